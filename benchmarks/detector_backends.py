@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency of the object detection backends on sample_inputs.
+
+Runs every configured detector (PyTorch OWLv2 and its ONNX Runtime exports) over the
+sample scenes with the reference and target labels of sample_outputs, and compares each
+backend's best box per label against the first backend's, and every two other backends
+against each other (e.g. the int8 export against the fp32 one):
+
+    python -m think_n_blend.export_detector --model owlv2-onnx
+    python -m think_n_blend.export_detector --model owlv2-onnx-int8 --quantize
+    python -m benchmarks.detector_backends --threads 4 --min_agreement 0.9
+
+Backends that have not been exported are skipped rather than silently run on PyTorch.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+import numpy as np
+from think_n_blend.config import DETECTION_ONNX_INTRA_OP_THREADS, REFERENCE_MIN_SCORE
+from think_n_blend.services import detection_service
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.onnx_detector import OnnxOwlDetector, EXPORT_INFO_FILE
+from think_n_blend.utils.image_utils import ImageContext
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+DEFAULT_BACKENDS = ["owlv2", "owlv2-onnx", "owlv2-onnx-int8"]
+EXTRA_LABELS = ["person", "tennis racket", "tennis ball"]
+
+def _sample_labels(outputs_dir: str) -> List[str]:
+    """Reference and target labels the vision model chose for the sample outputs."""
+    labels = []
+    for path in sorted(glob.glob(os.path.join(outputs_dir, "*", "*vision_reasoning.json"))):
+        with open(path) as f:
+            reasoning = json.load(f)
+        labels += [reasoning["reference_object"]["label"], reasoning["target_object"]["label"]]
+    return [label for label in dict.fromkeys(labels + EXTRA_LABELS) if label != "text_label"]
+
+def _load(name: str, threads: int) -> Optional[Any]:
+    """Loads one backend and makes it current, or returns None if its export is missing."""
+    config = model_manager.get_object_detection_model_config(name)
+    if config.get("backend") == "onnxruntime":
+        if not os.path.exists(os.path.join(config["onnx_dir"], EXPORT_INFO_FILE)):
+            print(f"Skipping {name}: no export in {config['onnx_dir']} (see think_n_blend.export_detector)")
+            return None
+        detector = model_manager.get_model(f"object_detection:{name}", lambda: OnnxOwlDetector(config["onnx_dir"], threads))
+        if not isinstance(detector, OnnxOwlDetector):
+            print(f"Skipping {name}: its export did not load on ONNX Runtime")
+            model_manager.unload_all_models()
+            return None
+    else:
+        detector = model_manager.get_object_detector(name)
+    model_manager.set_object_detection_model(name)
+    return detector
+
+def _iou(a: Dict[str, int], b: Dict[str, int]) -> float:
+    """Intersection over union of two pipeline-style boxes."""
+    width = min(a["xmax"], b["xmax"]) - max(a["xmin"], b["xmin"])
+    height = min(a["ymax"], b["ymax"]) - max(a["ymin"], b["ymin"])
+    intersection = max(0, width) * max(0, height)
+    area = lambda box: (box["xmax"] - box["xmin"]) * (box["ymax"] - box["ymin"])
+    union = area(a) + area(b) - intersection
+    return intersection / union if union else 0.0
+
+def run_backend(name: str, images: List[str], labels: List[str], runs: int, threads: int) -> Optional[Dict[str, Any]]:
+    """Times full detections (image and label embeddings uncached) and keeps each label's best prediction."""
+    start = time.perf_counter()
+    if _load(name, threads) is None:
+        return None
+    load_s = time.perf_counter() - start
+
+    contexts = [ImageContext(path) for path in images]
+    detection_service.detect_objects(contexts[0], labels, threshold=0.0)  # Warm-up
+
+    seconds, best = [], {}
+    for _ in range(runs):
+        for path, context in zip(images, contexts):
+            detection_service.clear_embedding_cache()
+            start = time.perf_counter()
+            predictions = detection_service.detect_objects(context, labels, threshold=0.0)
+            seconds.append(time.perf_counter() - start)
+            for label in labels:
+                best[f"{os.path.basename(path)}:{label}"] = next(
+                    (prediction for prediction in predictions if prediction["label"] == label), None
+                )
+    for context in contexts:
+        context.release()
+    memory_bytes = model_manager.get_memory_usage()[f"object_detection:{name}"]
+    model_manager.unload_all_models()
+
+    return {
+        "load_s": round(load_s, 2),
+        "detect_p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 1),
+        "detect_max_ms": round(max(seconds) * 1000, 1),
+        "memory_mb": round(memory_bytes / (1024 * 1024), 1),
+        "best": best,
+    }
+
+def compare(reference: Dict[str, Any], candidate: Dict[str, Any], min_score: float) -> Dict[str, Any]:
+    """Agreement of a backend's best box per (image, label) with the reference backend's."""
+    ious, score_deltas, agreements = [], [], []
+    for key, expected in reference["best"].items():
+        actual = candidate["best"].get(key)
+        found = [prediction is not None and prediction["score"] >= min_score for prediction in (expected, actual)]
+        if all(found):
+            iou = _iou(expected["box"], actual["box"])
+            ious.append(iou)
+            agreements.append(iou >= 0.5)
+        else:
+            agreements.append(found[0] == found[1])
+        if expected is not None and actual is not None:
+            score_deltas.append(abs(expected["score"] - actual["score"]))
+    return {
+        "agreement": round(sum(agreements) / len(agreements), 3) if agreements else None,
+        "mean_iou": round(float(np.mean(ious)), 3) if ious else None,
+        "max_score_delta": round(max(score_deltas), 4) if score_deltas else None,
+    }
+
+def print_pairs(results: Dict[str, Any]):
+    """Agreement between every two backends, e.g. the int8 export against the fp32 one."""
+    print(f"\n{'backend':<18}{'against':<18}{'agree':>8}{'IoU':>8}{'max Δscore':>12}")
+    for pair, comparison in results.items():
+        cells = ["-" if comparison[key] is None else comparison[key] for key in ("agreement", "mean_iou", "max_score_delta")]
+        candidate, reference = pair.split(" vs ")
+        print(f"{candidate:<18}{reference:<18}{cells[0]:>8}{cells[1]:>8}{cells[2]:>12}")
+
+def print_report(results: Dict[str, Any], reference: str):
+    print(f"\n{'backend':<18}{'load s':>8}{'MB':>8}{'p50 ms':>10}{'max ms':>10}{'agree':>8}{'IoU':>8}{'max Δscore':>12}")
+    for name, result in results.items():
+        comparison = result.get("comparison", {})
+        cells = [comparison.get(key) for key in ("agreement", "mean_iou", "max_score_delta")]
+        cells = ["-" if cell is None else cell for cell in cells]
+        print(f"{name:<18}{result['load_s']:>8}{result['memory_mb']:>8}{result['detect_p50_ms']:>10}{result['detect_max_ms']:>10}"
+              f"{cells[0]:>8}{cells[1]:>8}{cells[2]:>12}")
+    print(f"\nAgreement: the best box per (image, label) matches {reference}'s (IoU >= 0.5), "
+          f"or neither backend finds the label (score < {REFERENCE_MIN_SCORE})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare object detection backends on the sample inputs")
+    parser.add_argument("--backends", type=str, nargs="+", default=DEFAULT_BACKENDS,
+                       help="Object detection models to compare; the first is the reference")
+    parser.add_argument("--inputs", type=str, default=os.path.join(REPO_DIR, "sample_inputs"),
+                       help="Directory of sample_n scenes")
+    parser.add_argument("--labels", type=str, nargs="+",
+                       help="Labels to detect (defaults to the labels in sample_outputs plus a few scene objects)")
+    parser.add_argument("--runs", type=int, default=5,
+                       help="Timed passes over the scenes per backend")
+    parser.add_argument("--threads", type=int, default=DETECTION_ONNX_INTRA_OP_THREADS,
+                       help="ONNX Runtime intra-op threads (0 uses every physical core)")
+    parser.add_argument("--output", type=str,
+                       help="Also write the results to this JSON file")
+    parser.add_argument("--min_agreement", type=float,
+                       help="Exit with an error if any backend agrees with the reference less often than this (0-1)")
+    args = parser.parse_args()
+
+    images = [path for path in sorted(glob.glob(os.path.join(args.inputs, "sample_*.*"))) if "_obj_" not in path]
+    labels = args.labels or _sample_labels(os.path.join(REPO_DIR, "sample_outputs"))
+    print(f"{len(images)} scenes, labels: {', '.join(labels)}")
+
+    results = {}
+    for name in args.backends:
+        print(f"\nRunning {name}...")
+        result = run_backend(name, images, labels, args.runs, args.threads)
+        if result is not None:
+            results[name] = result
+    if not results:
+        sys.exit("No backend could run")
+
+    reference = next(iter(results))
+    for name, result in results.items():
+        if name != reference:
+            result["comparison"] = compare(results[reference], result, REFERENCE_MIN_SCORE)
+    print_report(results, reference)
+
+    names = list(results)
+    pairs = {
+        f"{candidate} vs {other}": compare(results[other], results[candidate], REFERENCE_MIN_SCORE)
+        for index, candidate in enumerate(names) for other in names[1:index]
+    }
+    if pairs:
+        print_pairs(pairs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                **{name: {key: value for key, value in result.items() if key != "best"}
+                   for name, result in results.items()},
+                "pairs": pairs,
+            }, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if args.min_agreement is not None:
+        agreements = {name: result["comparison"]["agreement"] for name, result in results.items() if "comparison" in result}
+        below = [name for name, agreement in agreements.items() if agreement is not None and agreement < args.min_agreement]
+        if below:
+            sys.exit(f"Agreement with {reference} below {args.min_agreement}: {', '.join(below)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions with canned placement JSON after a configurable
+latency, so the pipelines can be benchmarked offline. Point the OpenAI client at it
+with OPENAI_BASE_URL=http://<host>:<port>/v1.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+DEFAULT_PLACEMENT = {
+    "reference_object": {
+        "label": "table",
+        "description": "A large, clearly visible surface near the middle of the scene.",
+        "position_role": "reference",
+        "alternative_labels": ["desk", "shelf"],
+    },
+    "target_object": {
+        "label": "item",
+        "description": "The inserted item, placed beside the reference object.",
+        "relative_position": "right",
+        "inpainting_description": "the item resting naturally beside the table, matching the scene lighting",
+    },
+}
+
+# Header of the item list in the multi-insertion prompt
+ITEMS_HEADER = "The items to insert are:"
+
+def _prompt_text(messages: list) -> str:
+    """Concatenates the text parts of the first user message, which carries the original prompt."""
+    content = next((message.get("content", "") for message in messages if message.get("role") == "user"), "")
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+def _insertion_count(prompt: str) -> int:
+    """Counts the numbered items listed after the header, not the prompt's numbered instructions."""
+    _, header, items = prompt.rpartition(ITEMS_HEADER)
+    return (len(re.findall(r"^\d+\. ", items, re.MULTILINE)) if header else 0) or 1
+
+def _shaped(schema: Dict[str, Any], value: Any) -> Any:
+    """
+    Restricts value to the fields the schema asks for. A repair schema keys list items by
+    index, so those properties take the matching item of value instead.
+    """
+    if schema.get("type") != "object" or not isinstance(value, (dict, list)):
+        return value
+    return {
+        name: _shaped(field_schema, value[min(int(name), len(value) - 1)] if isinstance(value, list) else value.get(name))
+        for name, field_schema in schema.get("properties", {}).items()
+    }
+
+def _reply_content(body: Dict[str, Any], placement: Dict[str, Any]) -> str:
+    """Builds the canned reply, shaped like the schema the request asks for."""
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema", {})
+    prompt = _prompt_text(body.get("messages", []))
+    if "placements" in schema.get("properties", {}) or ITEMS_HEADER in prompt:
+        data = {"placements": [placement] * _insertion_count(prompt)}
+    else:
+        data = placement
+
+    if response_format.get("type") == "json_schema":
+        return json.dumps(_shaped(schema, data))
+    return f"Here is the placement.\n```json\n{json.dumps(data, indent=2)}\n```"
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler; the server carries the latency settings and canned placement."""
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404, f"Unknown endpoint: {self.path}")
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.next_latency())
+
+        content = _reply_content(body, self.server.placement)
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(content) // 4
+        payload = json.dumps({
+            "id": f"chatcmpl-standin-{self.server.next_id()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float, jitter_ms: float, placement: Dict[str, Any], seed: int = 0):
+        super().__init__(address, StandInHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.placement = placement
+        self._random = random.Random(seed)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def next_latency(self) -> float:
+        """Latency of the next reply in seconds: the base latency plus uniform jitter."""
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._count += 1
+            return self._count
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI chat completions server for offline benchmarks")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                       help="Address to listen on")
+    parser.add_argument("--port", type=int, default=0,
+                       help="Port to listen on (0 picks a free port)")
+    parser.add_argument("--latency_ms", type=float, default=800.0,
+                       help="Base latency of every reply")
+    parser.add_argument("--jitter_ms", type=float, default=200.0,
+                       help="Uniform jitter added to the base latency")
+    parser.add_argument("--placement_file", type=str,
+                       help="JSON file with the canned placement (reference_object and target_object)")
+    parser.add_argument("--seed", type=int, default=0,
+                       help="Seed for the latency jitter")
+    args = parser.parse_args()
+
+    placement = DEFAULT_PLACEMENT
+    if args.placement_file:
+        with open(args.placement_file) as f:
+            placement = json.load(f)
+
+    server = StandInServer((args.host, args.port), args.latency_ms, args.jitter_ms, placement, args.seed)
+    host, port = server.server_address[:2]
+    # The benchmark runner reads this line to find the port
+    print(f"Listening on http://{host}:{port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
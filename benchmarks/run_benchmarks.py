@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the ThinkNBlend pipelines.
+
+Runs object_insertion_pipeline, text_insertion_pipeline, multi_insertion_pipeline and
+BatchProcessor against a stand-in OpenAI server, a stand-in UniCombine script and (by
+default) a stand-in detector, reports throughput, per-stage p50/p95 latency and peak
+memory, and compares the numbers with a stored baseline.
+
+    python -m benchmarks.run_benchmarks                  # run and compare with the baseline
+    python -m benchmarks.run_benchmarks --save_baseline  # run and store a new baseline
+"""
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import inspect
+import argparse
+import resource
+import tempfile
+import functools
+import subprocess
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+STANDIN_UNICOMBINE_DIR = os.path.join(BENCHMARKS_DIR, "standin_unicombine")
+SCENARIOS = ["object_pipeline", "text_pipeline", "multi_pipeline", "batch_object", "batch_text"]
+
+# Settings that change the numbers; a baseline is only compared against runs with the same ones
+COMPARABLE_SETTINGS = [
+    "openai_latency_ms", "openai_jitter_ms", "unicombine_latency_ms", "detector", "detector_latency_ms",
+    "diffusion_model", "iterations", "batch_copies", "texts", "max_in_flight",
+]
+
+# Per-process stage timings in seconds, filled by the instrumented service functions
+_timings: Dict[str, List[float]] = defaultdict(list)
+
+class StandInDetector:
+    """Answers zero-shot detection queries with deterministic boxes after a fixed latency."""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def __call__(self, image, candidate_labels: List[str], threshold: float = 0.1) -> List[Dict[str, Any]]:
+        time.sleep(self.latency_ms / 1000)
+        width, height = image.size
+        predictions = []
+        for index, label in enumerate(candidate_labels):
+            score = 0.9 - 0.1 * index
+            if score < threshold:
+                continue
+            # A box a quarter of the image across, shifted a little for each label
+            xmin = int(width * (0.3 + 0.05 * index))
+            ymin = int(height * (0.4 + 0.05 * index))
+            predictions.append({
+                "score": score,
+                "label": label,
+                "box": {"xmin": xmin, "ymin": ymin, "xmax": xmin + width // 4, "ymax": ymin + height // 4},
+            })
+        return predictions
+
+def _instrument(module: Any, name: str, stage: str):
+    """Replaces module.name with a wrapper recording its duration under stage."""
+    func = getattr(module, name)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _timings[stage].append(time.perf_counter() - start)
+    else:
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _timings[stage].append(time.perf_counter() - start)
+
+    setattr(module, name, timed)
+
+def _find_inputs(inputs_dir: str) -> List[Tuple[str, List[str]]]:
+    """Pairs each sample_n image in inputs_dir with its sample_n_obj_* crops."""
+    samples = []
+    for main_image in sorted(glob.glob(os.path.join(inputs_dir, "sample_*.*"))):
+        stem = Path(main_image).stem
+        if "_obj_" in stem:
+            continue
+        crops = sorted(glob.glob(os.path.join(inputs_dir, f"{stem}_obj_*.*")))
+        samples.append((main_image, crops))
+    return samples
+
+def _batch_inputs(inputs: List[Tuple[str, List[str]]], copies: int, work_dir: str) -> Tuple[str, str]:
+    """Lays out a batch input tree with copies of every main image and all crops."""
+    scenes_dir = os.path.join(work_dir, "inputs", "scenes")
+    objects_dir = os.path.join(work_dir, "inputs", "objects")
+    os.makedirs(scenes_dir, exist_ok=True)
+    os.makedirs(objects_dir, exist_ok=True)
+    for main_image, crops in inputs:
+        stem, extension = os.path.splitext(os.path.basename(main_image))
+        for copy in range(copies):
+            shutil.copy(main_image, os.path.join(scenes_dir, f"{stem}_{copy}{extension}"))
+        for crop in crops:
+            shutil.copy(crop, objects_dir)
+    return scenes_dir, objects_dir
+
+def _run_pipeline_scenario(name: str, settings: Dict[str, Any], inputs, work_dir: str) -> List[bool]:
+    from think_n_blend.cli import object_insertion_pipeline, text_insertion_pipeline, multi_insertion_pipeline
+    from think_n_blend.schemas import InsertionSpec
+
+    results = []
+    for iteration in range(settings["iterations"]):
+        for main_image, crops in inputs:
+            if name == "object_pipeline":
+                runs = [(object_insertion_pipeline, crop, Path(crop).stem) for crop in crops]
+            elif name == "multi_pipeline":
+                # Every crop and text in one job: one vision request places them all
+                insertions = [InsertionSpec(kind="object", object_crop=crop) for crop in crops]
+                insertions += [InsertionSpec(kind="text", text=text) for text in settings["texts"]]
+                runs = [(multi_insertion_pipeline, insertions, Path(main_image).stem)]
+            else:
+                runs = [(text_insertion_pipeline, text, text.replace(" ", "_")) for text in settings["texts"]]
+            for pipeline, subject, label in runs:
+                output_dir = os.path.join(work_dir, name, str(iteration), label)
+                start = time.perf_counter()
+                result = pipeline(main_image, subject, False, settings["diffusion_model"], output_dir)
+                _timings["end_to_end"].append(time.perf_counter() - start)
+                results.append(result is not None)
+    return results
+
+def _run_batch_scenario(name: str, settings: Dict[str, Any], inputs, work_dir: str) -> List[bool]:
+    from think_n_blend.batch_processor import BatchProcessor
+
+    scenes_dir, objects_dir = _batch_inputs(inputs, settings["batch_copies"], work_dir)
+    processor = BatchProcessor(
+        scenes_dir,
+        os.path.join(work_dir, name),
+        concurrent=True,
+        max_in_flight=settings["max_in_flight"],
+        diffusion_model=settings["diffusion_model"],
+    )
+    if name == "batch_object":
+        processor.process_object_insertions(objects_dir)
+    else:
+        processor.process_text_insertions(settings["texts"], ["top", "bottom"])
+    return [bool(result.get("success")) for result in processor.journal.iter_results()]
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _summarize(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 1),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 1),
+    }
+
+def _run_scenario(name: str, settings: Dict[str, Any], base_url: str, work_dir: str) -> Dict[str, Any]:
+    """Runs one scenario in a fresh process so its peak memory is its own."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "standin"
+    os.environ["STANDIN_UNICOMBINE_LATENCY_MS"] = str(settings["unicombine_latency_ms"])
+
+    from think_n_blend.services import (
+        vision_service, detection_service, composition_service, blending_service, text_service
+    )
+    from think_n_blend.services.model_manager import model_manager
+    from think_n_blend.services.vision_cache import vision_cache
+
+    # Every request has to reach the stand-in server
+    vision_cache.set_enabled(False)
+    unicombine = {**model_manager.get_diffusion_model_config("unicombine"), "path": STANDIN_UNICOMBINE_DIR}
+    model_manager.diffusion_models = {**model_manager.diffusion_models, "unicombine": unicombine}
+
+    for module, names, stage in [
+        (vision_service, ["get_vision_reasoning", "get_text_vision_reasoning", "get_multi_vision_reasoning",
+                          "get_vision_reasoning_async", "get_text_vision_reasoning_async",
+                          "get_multi_vision_reasoning_async"], "reasoning"),
+        (detection_service, ["detect_objects"], "detection"),
+        (composition_service, ["find_target_boxes", "resolve_overlapping_boxes"], "composition"),
+        (blending_service, ["blend_object_with_unicombine", "blend_insertions"], "blending"),
+        (text_service, ["insert_text_with_unicombine"], "blending"),
+    ]:
+        for function_name in names:
+            _instrument(module, function_name, stage)
+
+    inputs = _find_inputs(settings["inputs"])
+    run = _run_pipeline_scenario if name.endswith("_pipeline") else _run_batch_scenario
+    with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if settings["verbose"] else devnull):
+        if settings["detector"] == "standin":
+            model_manager.get_model(
+                f"object_detection:{model_manager.current_object_detection_model}",
+                lambda: StandInDetector(settings["detector_latency_ms"]),
+            )
+        start = time.perf_counter()
+        try:
+            results = run(name, settings, inputs, work_dir)
+        finally:
+            model_manager.shutdown_inference_workers()
+    wall = time.perf_counter() - start
+
+    return {
+        "jobs": len(results),
+        "succeeded": sum(results),
+        "wall_s": round(wall, 2),
+        "throughput_jobs_per_s": round(len(results) / wall, 3) if wall else 0.0,
+        "stages": {stage: _summarize(samples) for stage, samples in _timings.items() if samples},
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+def _start_standin_server(settings: Dict[str, Any]) -> Tuple[subprocess.Popen, str]:
+    command = [
+        sys.executable, "-m", "benchmarks.openai_standin",
+        "--latency_ms", str(settings["openai_latency_ms"]),
+        "--jitter_ms", str(settings["openai_jitter_ms"]),
+    ]
+    if settings["placement_file"]:
+        command += ["--placement_file", settings["placement_file"]]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(BENCHMARKS_DIR))
+    line = server.stdout.readline()
+    if not line.startswith("Listening on "):
+        server.kill()
+        raise RuntimeError(f"Stand-in OpenAI server failed to start: {line!r}")
+    return server, line.split("Listening on ", 1)[1].strip()
+
+def _comparisons(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                 p95_tolerance: float) -> List[Tuple[str, float, float, bool, float]]:
+    """Lists (metric, baseline, current, higher_is_better, tolerance) for every metric both runs have."""
+    rows = []
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if not previous:
+            continue
+        rows.append((f"{scenario}.throughput_jobs_per_s", previous["throughput_jobs_per_s"],
+                     current["throughput_jobs_per_s"], True, tolerance))
+        for stage, summary in current["stages"].items():
+            if stage not in previous["stages"]:
+                continue
+            for key, key_tolerance in (("p50_ms", tolerance), ("p95_ms", p95_tolerance)):
+                rows.append((f"{scenario}.{stage}.{key}", previous["stages"][stage][key], summary[key],
+                             False, key_tolerance))
+        rows.append((f"{scenario}.peak_rss_mb", previous["peak_rss_mb"], current["peak_rss_mb"], False, tolerance))
+    return rows
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                          p95_tolerance: float, min_delta_ms: float) -> List[str]:
+    """Prints the change of every metric against the baseline and returns the regressed ones."""
+    regressions = []
+    print(f"\n{'metric':<42}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, previous, current, higher_is_better, metric_tolerance in _comparisons(
+            results, baseline["results"], tolerance, p95_tolerance):
+        change = (current - previous) / previous if previous else 0.0
+        worse = -change if higher_is_better else change
+        # Ignore millisecond jitter on stages that are nearly free
+        noise = metric.endswith("_ms") and abs(current - previous) < min_delta_ms
+        regressed = worse > metric_tolerance and not noise
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric:<42}{previous:>12}{current:>12}{change:>+10.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def print_report(results: Dict[str, Any]):
+    for scenario, result in results.items():
+        print(f"\n{scenario}: {result['succeeded']}/{result['jobs']} jobs in {result['wall_s']}s "
+              f"({result['throughput_jobs_per_s']} jobs/s), peak RSS {result['peak_rss_mb']} MB "
+              f"(child processes {result['children_peak_rss_mb']} MB)")
+        for stage, summary in result["stages"].items():
+            print(f"  {stage:<12} n={summary['count']:<4} p50 {summary['p50_ms']:>9} ms   p95 {summary['p95_ms']:>9} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the ThinkNBlend pipelines")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS,
+                       help="Scenarios to run")
+    parser.add_argument("--inputs", type=str, default="sample_inputs",
+                       help="Directory with sample_n images and sample_n_obj_m crops")
+    parser.add_argument("--iterations", type=int, default=3,
+                       help="Passes over the inputs for the pipeline scenarios")
+    parser.add_argument("--batch_copies", type=int, default=4,
+                       help="Copies of every main image in the batch scenarios")
+    parser.add_argument("--texts", type=str, nargs="+", default=["SALE", "Fresh Coffee"],
+                       help="Texts inserted by the text scenarios")
+    parser.add_argument("--max_in_flight", type=int, default=8,
+                       help="Concurrent vision requests in the batch scenarios")
+    parser.add_argument("--diffusion_model", type=str, default="unicombine",
+                       help="unicombine (the stand-in script) or simple_paste")
+    parser.add_argument("--openai_latency_ms", type=float, default=800.0,
+                       help="Base latency of the stand-in OpenAI server")
+    parser.add_argument("--openai_jitter_ms", type=float, default=200.0,
+                       help="Latency jitter of the stand-in OpenAI server")
+    parser.add_argument("--placement_file", type=str,
+                       help="Canned placement JSON for the stand-in OpenAI server")
+    parser.add_argument("--unicombine_latency_ms", type=float, default=500.0,
+                       help="Time the stand-in UniCombine script takes per job")
+    parser.add_argument("--detector", choices=["standin", "owlv2"], default="standin",
+                       help="Stand-in detector, or the real OWLv2 model (needs its weights)")
+    parser.add_argument("--detector_latency_ms", type=float, default=50.0,
+                       help="Time the stand-in detector takes per query")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE,
+                       help="Baseline results to compare with")
+    parser.add_argument("--save_baseline", action="store_true",
+                       help="Store this run as the baseline instead of comparing with it")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                       help="Relative slowdown (or memory growth) reported as a regression")
+    parser.add_argument("--p95_tolerance", type=float, default=1.0,
+                       help="Relative p95 slowdown reported as a regression; tail latencies of a few samples are noisy")
+    parser.add_argument("--min_delta_ms", type=float, default=10.0,
+                       help="Latency changes smaller than this are never regressions")
+    parser.add_argument("--results_file", type=str, default="benchmark_results.json",
+                       help="Where to write this run's results")
+    parser.add_argument("--keep_outputs", action="store_true",
+                       help="Keep the pipeline outputs instead of deleting them")
+    parser.add_argument("--verbose", action="store_true",
+                       help="Show the pipelines' own output")
+    args = parser.parse_args()
+
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ("scenarios", "baseline", "save_baseline", "results_file", "keep_outputs")}
+    if not _find_inputs(args.inputs):
+        parser.error(f"No sample_n images found in {args.inputs}")
+
+    server, base_url = _start_standin_server(settings)
+    work_dir = tempfile.mkdtemp(prefix="thinknblend_bench_")
+    print(f"Stand-in OpenAI server at {base_url}; outputs in {work_dir}")
+
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            print(f"Running {scenario}...")
+            # A fresh process per scenario keeps caches and peak memory from leaking between them
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results[scenario] = executor.submit(_run_scenario, scenario, settings, base_url, work_dir).result()
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.keep_outputs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results)
+    run = {"settings": settings, "results": results}
+    with open(args.results_file, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults saved to {args.results_file}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save_baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    mismatched = [key for key in COMPARABLE_SETTINGS if baseline["settings"].get(key) != settings.get(key)]
+    if mismatched:
+        print(f"Baseline was recorded with different settings ({', '.join(mismatched)}); not comparing")
+        return
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.p95_tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} metrics regressed beyond their tolerance: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Stand-in for UniCombine's inference.py, for offline benchmarks.
+
+Accepts the same arguments, sleeps for STANDIN_UNICOMBINE_LATENCY_MS to stand in
+for the diffusion run and pastes the subject into the box from the JSON file.
+"""
+import os
+import json
+import time
+import argparse
+from PIL import Image
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in UniCombine inference")
+    parser.add_argument("--condition_types", nargs="+", default=[])
+    parser.add_argument("--denoising_lora_name", type=str)
+    parser.add_argument("--denoising_lora_weight", type=float)
+    parser.add_argument("--fill", type=str, required=True)
+    parser.add_argument("--subject", type=str, required=True)
+    parser.add_argument("--json", type=str, required=True)
+    parser.add_argument("--version", type=str)
+    parser.add_argument("--output_dir", type=str, default="output")
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get("STANDIN_UNICOMBINE_LATENCY_MS", "2000")) / 1000)
+
+    with open(args.json) as f:
+        x1, y1, x2, y2 = json.load(f)["box"]
+    with Image.open(args.fill) as fill, Image.open(args.subject) as subject:
+        result = fill.convert("RGB")
+        if x2 > x1 and y2 > y1:
+            result.paste(subject.convert("RGB").resize((x2 - x1, y2 - y1)), (x1, y1))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    result.save(os.path.join(args.output_dir, "result.jpg"))
+
+if __name__ == "__main__":
+    main()
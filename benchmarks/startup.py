@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the ThinkNBlend entry points.
+
+Times fresh interpreters running the CLI's --help and list-models and importing the
+CLI, batch, server and pipeline modules, and checks that none of them load a heavy backend
+(openai, torch, transformers, easyocr, diffusers, onnxruntime) before a job actually needs it.
+
+    python -m benchmarks.startup                  # run and compare with the baseline
+    python -m benchmarks.startup --save_baseline  # run and store a new baseline
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "startup_baseline.json")
+
+# Modules that must stay unloaded until a stage that needs them runs
+HEAVY_MODULES = ["openai", "torch", "transformers", "easyocr", "diffusers", "onnxruntime"]
+
+# Each probe runs in a fresh interpreter, reports its own timing and which heavy modules it loaded
+PROBE = """
+import sys, time, json, runpy, contextlib, io
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}), file=sys.__stderr__)
+"""
+
+CLI_RUN = """
+sys.argv = {argv!r}
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        runpy.run_path("main.py", run_name="__main__")
+    except SystemExit:
+        pass
+"""
+
+ENTRY_POINTS = {
+    "cli_help": CLI_RUN.format(argv=["main.py", "--help"]),
+    "cli_list_models": CLI_RUN.format(argv=["main.py", "--mode", "list-models"]),
+    "import_cli": "import think_n_blend.cli",
+    "import_batch_processor": "import think_n_blend.batch_processor",
+    "import_server": "import think_n_blend.server",
+    "import_pipeline": "import think_n_blend.pipeline",
+}
+
+def _probe(body: str) -> Dict[str, Any]:
+    """Runs body in a fresh interpreter and returns its import-inclusive timing."""
+    script = PROBE.format(body=body, heavy=HEAVY_MODULES)
+    completed = subprocess.run(
+        [sys.executable, "-c", script], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stderr.strip().splitlines()[-1])
+
+def run_startup_benchmarks(runs: int) -> Dict[str, Any]:
+    """Times every entry point over runs fresh interpreters."""
+    results = {}
+    for name, body in ENTRY_POINTS.items():
+        probes = [_probe(body) for _ in range(runs)]
+        seconds = [probe["seconds"] for probe in probes]
+        results[name] = {
+            "runs": runs,
+            "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 1),
+            "max_ms": round(max(seconds) * 1000, 1),
+            "heavy_modules_loaded": sorted({module for probe in probes for module in probe["loaded"]}),
+        }
+    return results
+
+def print_report(results: Dict[str, Any]):
+    print(f"\n{'entry point':<26}{'p50 ms':>10}{'max ms':>10}  heavy modules loaded")
+    for name, result in results.items():
+        loaded = ", ".join(result["heavy_modules_loaded"]) or "-"
+        print(f"{name:<26}{result['p50_ms']:>10}{result['max_ms']:>10}  {loaded}")
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                     min_delta_ms: float) -> List[str]:
+    """Lists entry points that load a heavy module or start slower than the baseline allows."""
+    regressions = []
+    for name, result in results.items():
+        if result["heavy_modules_loaded"]:
+            regressions.append(f"{name} loads {', '.join(result['heavy_modules_loaded'])}")
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        delta = result["p50_ms"] - previous["p50_ms"]
+        if delta > previous["p50_ms"] * tolerance and delta >= min_delta_ms:
+            regressions.append(f"{name} p50 {previous['p50_ms']} -> {result['p50_ms']} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the ThinkNBlend entry points")
+    parser.add_argument("--runs", type=int, default=5,
+                       help="Fresh interpreters per entry point")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE,
+                       help="Baseline results to compare with")
+    parser.add_argument("--save_baseline", action="store_true",
+                       help="Store this run as the baseline instead of comparing with it")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                       help="Relative p50 slowdown reported as a regression")
+    parser.add_argument("--min_delta_ms", type=float, default=50.0,
+                       help="Slowdowns smaller than this are never regressions")
+    args = parser.parse_args()
+
+    results = run_startup_benchmarks(args.runs)
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        print(f"\nNo baseline at {args.baseline}; only checking for heavy imports")
+
+    regressions = find_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("\nStartup regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo startup regressions")
+
+if __name__ == "__main__":
+    main()
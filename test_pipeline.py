@@ -233,6 +233,53 @@ def test_text_insertion_with_samples(simple_paste=False):
     
     return results
 
+def test_pipeline_context_reuse():
+    """
+    Runs one ImageContext through two diffusion jobs of a Pipeline session. Uses the offline
+    stand-ins from benchmarks/ (OpenAI server, UniCombine script and detector), so it needs
+    neither an API key nor a GPU.
+    """
+    print("\n" + "="*50)
+    print("TESTING IMAGE CONTEXT REUSE ACROSS PIPELINE CALLS")
+    print("="*50)
+
+    from benchmarks.run_benchmarks import STANDIN_UNICOMBINE_DIR, StandInDetector, _start_standin_server
+    from think_n_blend.pipeline import Pipeline
+    from think_n_blend.services.model_manager import model_manager
+    from think_n_blend.services.vision_cache import vision_cache
+    from think_n_blend.utils.image_utils import ImageContext
+
+    sample_data, _ = find_sample_images()
+    if not sample_data:
+        print("❌ No sample images found in sample_inputs directory")
+        return False
+
+    server, base_url = _start_standin_server({"openai_latency_ms": 0, "openai_jitter_ms": 0, "placement_file": None})
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["STANDIN_UNICOMBINE_LATENCY_MS"] = "0"
+    vision_cache.set_enabled(False)
+    unicombine = {**model_manager.get_diffusion_model_config("unicombine"), "path": STANDIN_UNICOMBINE_DIR}
+    model_manager.diffusion_models = {**model_manager.diffusion_models, "unicombine": unicombine}
+    model_manager.get_model(
+        f"object_detection:{model_manager.current_object_detection_model}", lambda: StandInDetector(0)
+    )
+
+    with open(sample_data[0]['main_image'], 'rb') as f:
+        context = ImageContext.from_bytes(f.read())
+    try:
+        with Pipeline(diffusion_model="unicombine", api_key="standin") as pipeline:
+            results = [pipeline.insert_text(context, text) for text in ("SALE", "OPEN")]
+    finally:
+        server.terminate()
+        server.wait()
+
+    for result in results:
+        status = "✅" if result.success else "❌"
+        print(f"{status} {result.failed_stage or 'all stages'} {result.error or ''}")
+    assert all(result.success for result in results), "Reusing an ImageContext failed"
+    assert context.path is None, "The pipeline left the caller's context pointing at a temporary file"
+    return True
+
 def main():
     """Run the test pipeline with sample images."""
     import argparse
@@ -241,8 +288,15 @@ def main():
     parser.add_argument("--simple_paste", action="store_true",
                        help="Use simple paste instead of diffusion model (no GPU required)")
     
+    parser.add_argument("--context_reuse", action="store_true",
+                       help="Only run the offline image context reuse test (uses the benchmark stand-ins)")
+    
     args = parser.parse_args()
     
+    if args.context_reuse:
+        test_pipeline_context_reuse()
+        return
+    
     print("ThinkNBlend Pipeline Test with Sample Images")
     if args.simple_paste:
         print("MODE: Simple Paste (no diffusion model required)")
@@ -0,0 +1,79 @@
+"""Ranking of candidate target boxes and overlap resolution for multi-insertion jobs."""
+import numpy as np
+from PIL import Image
+from think_n_blend.services.composition_service import (
+    compute_target_bounding_box, find_target_boxes, resolve_overlapping_boxes
+)
+
+REFERENCE = (150, 150, 250, 250)
+
+def blank(size=(400, 400)):
+    return Image.new("RGB", size, "white")
+
+def overlap(a, b):
+    return max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[3], b[3]) - max(a[1], b[1]))
+
+def test_best_box_sits_on_the_requested_side():
+    assert find_target_boxes(blank(), REFERENCE, "top")[0] == (150, 50, 250, 150)
+    assert find_target_boxes(blank(), REFERENCE, "left")[0] == (50, 150, 150, 250)
+    assert compute_target_bounding_box(blank(), REFERENCE, "bottom") == (150, 250, 250, 350)
+
+def test_alternatives_are_distinct_and_limited():
+    boxes = find_target_boxes(blank(), REFERENCE, "top", num_alternatives=3)
+    assert len(boxes) == 4
+    assert len(set(boxes)) == 4
+    assert find_target_boxes(blank(), REFERENCE, "top", num_alternatives=0) == boxes[:1]
+
+def test_side_outside_the_image_falls_back_to_another_side():
+    best = find_target_boxes(blank(), (150, 0, 250, 100), "top")[0]
+    assert best == (150, 100, 250, 200)
+
+def test_obstacles_push_the_box_aside():
+    obstacle = (150, 50, 200, 150)  # Left half of the best box on a blank image
+    best = find_target_boxes(blank(), REFERENCE, "top", obstacles=[obstacle])[0]
+    assert best[3] <= REFERENCE[1]  # Still above the reference
+    assert overlap(best, obstacle) == 0
+
+def test_fully_blocked_side_gives_way_to_another():
+    obstacle = (0, 0, 400, 150)
+    best = find_target_boxes(blank(), REFERENCE, "top", obstacles=[obstacle])[0]
+    assert overlap(best, obstacle) == 0
+
+def test_edge_clutter_shifts_the_box_to_plain_background():
+    image = np.full((400, 400, 3), 255, dtype=np.uint8)
+    image[50:150, 100:200] = np.random.default_rng(0).integers(0, 256, (100, 100, 3), dtype=np.uint8)
+    best = find_target_boxes(Image.fromarray(image), REFERENCE, "top")[0]
+    assert best[3] <= REFERENCE[1]
+    assert best[0] > 150  # Moved right, away from the noisy patch
+
+def test_no_viable_candidate():
+    assert find_target_boxes(blank((20, 20)), (0, 0, 20, 20), "top") == []
+    assert compute_target_bounding_box(blank((20, 20)), (0, 0, 20, 20), "top") is None
+
+def test_disjoint_boxes_are_kept():
+    boxes = [(0, 0, 50, 50), (60, 0, 110, 50), (0, 0, 0, 0)]
+    assert resolve_overlapping_boxes(blank(), boxes) == boxes
+
+def test_overlapping_box_is_shifted_by_the_smallest_move():
+    first, second = (100, 100, 200, 200), (180, 100, 280, 200)
+    resolved = resolve_overlapping_boxes(blank(), [first, second])
+    assert resolved == [first, (200, 100, 300, 200)]
+
+def test_shift_stays_inside_the_image():
+    # Moving right by 80 would leave the image, moving down by 80 does not
+    first, second = (300, 100, 400, 200), (320, 120, 400, 200)
+    resolved = resolve_overlapping_boxes(blank(), [first, second])
+    assert resolved[1] == (320, 200, 400, 280)
+    assert overlap(*resolved) == 0
+
+def test_box_without_room_to_move_is_trimmed():
+    first, second = (0, 0, 100, 60), (0, 40, 100, 100)
+    resolved = resolve_overlapping_boxes(blank((100, 100)), [first, second])
+    assert resolved == [first, (0, 60, 100, 100)]
+
+def test_every_box_is_cleared_of_all_earlier_ones():
+    boxes = [(100, 100, 200, 200)] * 4
+    resolved = resolve_overlapping_boxes(blank(), boxes)
+    assert resolved[0] == boxes[0]
+    for index, box in enumerate(resolved):
+        assert all(overlap(box, other) == 0 for other in resolved[:index])
@@ -0,0 +1,124 @@
+"""Crash safety of the batch job journal and of BatchProcessor --resume."""
+import json
+import os
+import pytest
+from PIL import Image
+from think_n_blend import batch_processor
+from think_n_blend.batch_processor import BatchProcessor
+from think_n_blend.config import BATCH_JOURNAL_FILE
+from think_n_blend.utils.job_utils import JobJournal
+
+TEXTS = ["SALE", "OPEN", "FAIL"]
+
+@pytest.fixture
+def scenes(tmp_path):
+    scenes_dir = tmp_path / "scenes"
+    scenes_dir.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        Image.new("RGB", (32, 32), "white").save(scenes_dir / name)
+    return scenes_dir
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Replaces the text pipeline with one that records its calls and fails for texts in `failing`."""
+    calls = []
+    failing = {"FAIL"}
+
+    def fake_text_pipeline(main_image, text, verify, diffusion_model, output_dir):
+        calls.append((os.path.basename(main_image), text))
+        if text in failing:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, "result.jpg")
+        Image.new("RGB", (8, 8)).save(output_path)
+        return output_path
+
+    monkeypatch.setattr(batch_processor, "text_insertion_pipeline", fake_text_pipeline)
+    return calls, failing
+
+def run_batch(scenes, output_dir, resume=False):
+    processor = BatchProcessor(str(scenes), str(output_dir), resume=resume, diffusion_model="simple_paste")
+    processor.process_text_insertions(TEXTS, ["top"])
+    processor.save_results("batch_results.json")
+    with open(output_dir / "batch_results.json") as f:
+        return processor, json.load(f)
+
+def test_truncated_last_line_is_dropped_on_resume(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = JobJournal(path)
+    journal.record("one", "hash1", {"success": False, "error": "boom"})
+    journal.record("two", "hash2", {"success": False, "error": "boom"})
+    with open(path, "ab") as f:
+        f.write(b'{"job_id": "three", "inputs_ha')  # Crash mid-write
+
+    resumed = JobJournal(path, resume=True)
+    assert [record["job_id"] for record in resumed.iter_records()] == ["one", "two"]
+    resumed.record("three", "hash3", {"success": False, "error": "again"})
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 3
+    assert [json.loads(line)["job_id"] for line in lines] == ["one", "two", "three"]
+
+def test_latest_record_wins(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = JobJournal(path)
+    journal.record("one", "hash1", {"success": False, "error": "boom"})
+    journal.record("one", "hash1", {"success": True, "output_path": "x.jpg"})
+
+    resumed = JobJournal(path, resume=True)
+    assert list(resumed.iter_results(["one", "missing"])) == [{"success": True, "output_path": "x.jpg"}]
+
+def test_completed_requires_same_inputs_and_existing_output(tmp_path):
+    output_path = tmp_path / "result.jpg"
+    output_path.write_bytes(b"image")
+    journal = JobJournal(str(tmp_path / "journal.jsonl"))
+    journal.record("one", "hash1", {"success": True, "output_path": str(output_path)})
+
+    assert journal.is_complete("one", "hash1")
+    assert not journal.is_complete("one", "edited")
+    output_path.unlink()
+    assert not journal.is_complete("one", "hash1")
+
+def test_resume_skips_completed_and_retries_failed_jobs(scenes, tmp_path, pipeline):
+    calls, failing = pipeline
+    output_dir = tmp_path / "output"
+
+    _, first = run_batch(scenes, output_dir)
+    assert len(calls) == 6
+    assert [result["success"] for result in first] == [True, True, False] * 2
+
+    calls.clear()
+    failing.clear()
+    _, resumed = run_batch(scenes, output_dir, resume=True)
+    assert sorted(calls) == [("a.jpg", "FAIL"), ("b.jpg", "FAIL")]
+    assert all(result["success"] for result in resumed)
+    # Results stay in submission order, with every job's latest result
+    assert [(os.path.basename(r["main_image"]), r["text"]) for r in resumed] == \
+        [(os.path.basename(r["main_image"]), r["text"]) for r in first]
+
+def test_resume_reruns_job_whose_record_was_torn(scenes, tmp_path, pipeline):
+    calls, failing = pipeline
+    failing.clear()
+    output_dir = tmp_path / "output"
+    run_batch(scenes, output_dir)
+
+    journal_path = output_dir / BATCH_JOURNAL_FILE
+    data = journal_path.read_bytes()
+    last_line_start = data.rstrip(b"\n").rfind(b"\n") + 1
+    last = json.loads(data[last_line_start:])
+    journal_path.write_bytes(data[:last_line_start + 20])  # Killed while writing the last record
+
+    calls.clear()
+    _, resumed = run_batch(scenes, output_dir, resume=True)
+    assert calls == [(os.path.basename(last["result"]["main_image"]), last["result"]["text"])]
+    assert len(resumed) == 6
+
+def test_fresh_run_truncates_journal(scenes, tmp_path, pipeline):
+    calls, _ = pipeline
+    output_dir = tmp_path / "output"
+    run_batch(scenes, output_dir)
+
+    calls.clear()
+    _, results = run_batch(scenes, output_dir)
+    assert len(calls) == 6
+    assert len(results) == 6
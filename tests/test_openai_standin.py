@@ -0,0 +1,36 @@
+"""Replies of the stand-in OpenAI server follow the schema and item count of each request."""
+import json
+from PIL import Image
+from benchmarks.openai_standin import DEFAULT_PLACEMENT, _reply_content
+from think_n_blend.schemas import InsertionSpec
+from think_n_blend.services import vision_service
+from think_n_blend.utils.schema_utils import schema_issues, subset_json_schema
+
+INSERTIONS = [InsertionSpec(kind="text", text=text) for text in ("SALE", "OPEN")]
+
+def multi_body(schema):
+    request = vision_service._multi_request(Image.new("RGB", (16, 16)), INSERTIONS)
+    return {
+        "messages": [{"role": "user", "content": [{"type": "text", "text": request["prompt"]}]}],
+        "response_format": {"type": "json_schema", "json_schema": {"schema": schema}},
+    }
+
+def test_multi_reply_has_one_placement_per_insertion():
+    data = json.loads(_reply_content(multi_body(vision_service.MULTI_VISION_RESPONSE_SCHEMA), DEFAULT_PLACEMENT))
+    assert len(data["placements"]) == len(INSERTIONS)
+    assert schema_issues(data, vision_service.MULTI_VISION_RESPONSE_SCHEMA) == []
+
+def test_repair_reply_is_keyed_by_index():
+    schema = subset_json_schema(vision_service.MULTI_VISION_RESPONSE_SCHEMA,
+                                ["placements.1.target_object.relative_position"])
+    body = multi_body(schema)
+    body["messages"].append({"role": "user", "content": "Your answer was missing these fields..."})
+    data = json.loads(_reply_content(body, DEFAULT_PLACEMENT))
+    assert data == {"placements": {"1": {"target_object": {"relative_position": "right"}}}}
+
+def test_unstructured_multi_reply_counts_items_of_the_original_prompt():
+    body = multi_body({})
+    del body["response_format"]
+    body["messages"].append({"role": "user", "content": "1. Reply again"})
+    content = _reply_content(body, DEFAULT_PLACEMENT)
+    assert len(vision_service._parse_vision_json(content)["placements"]) == len(INSERTIONS)
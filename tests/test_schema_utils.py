@@ -0,0 +1,111 @@
+"""Schema checks and the partial repair of GPT-4 Vision replies."""
+import json
+from types import SimpleNamespace
+import pytest
+from PIL import Image
+from think_n_blend.schemas import InsertionSpec
+from think_n_blend.services import vision_service
+from think_n_blend.services.vision_cache import vision_cache
+from think_n_blend.utils.schema_utils import schema_issues, subset_json_schema, merge_json
+
+SCHEMA = vision_service.MULTI_VISION_RESPONSE_SCHEMA
+
+def placement(label="table", position="top"):
+    return {
+        "reference_object": {"label": label, "description": "a wooden table", "position_role": "reference",
+                             "alternative_labels": []},
+        "target_object": {"label": "vase", "description": "a blue vase", "relative_position": position,
+                          "inpainting_description": "a vase on the table"},
+    }
+
+class FakeClient:
+    """Answers chat completions with queued replies and records the requests."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        content = json.dumps(self.replies.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+@pytest.fixture
+def multi_request(tmp_path):
+    vision_cache.set_enabled(False)
+    main_image = Image.new("RGB", (16, 16), "white")
+    insertions = [InsertionSpec(kind="text", text=text) for text in ("SALE", "OPEN", "NEW")]
+    yield vision_service._multi_request(main_image, insertions)
+    vision_cache.set_enabled(True)
+
+def test_schema_issues_reports_nested_and_item_paths():
+    bad = placement(position="above")
+    del bad["reference_object"]["description"]
+    data = {"placements": [placement(), bad]}
+    assert schema_issues(data, SCHEMA) == [
+        "placements.1.reference_object.description",
+        "placements.1.target_object.relative_position",
+    ]
+    assert schema_issues({"placements": "none"}, SCHEMA) == ["placements"]
+    assert schema_issues(None, SCHEMA) == ["placements"]
+
+def test_subset_schema_keys_array_items_by_index():
+    subset = subset_json_schema(SCHEMA, ["placements.1.target_object.relative_position", "placements.3"])
+    items = subset["properties"]["placements"]
+    assert items["required"] == ["1", "3"]
+    assert items["properties"]["1"]["properties"]["target_object"]["required"] == ["relative_position"]
+    assert items["properties"]["3"] == SCHEMA["properties"]["placements"]["items"]
+
+def test_merge_repairs_item_fields_by_index():
+    data = {"placements": [placement(), placement(position="above")]}
+    repaired = merge_json(data, {"placements": {"1": {"target_object": {"relative_position": "left"}}}})
+    assert repaired["placements"][1]["target_object"]["relative_position"] == "left"
+    assert repaired["placements"][1]["target_object"]["label"] == "vase"
+    assert data["placements"][1]["target_object"]["relative_position"] == "above"  # base is not mutated
+
+def test_merge_appends_contiguous_indices_in_order():
+    merged = merge_json([0], {"2": 2, "1": 1})
+    assert merged == [0, 1, 2]
+
+def test_merge_rejects_index_that_leaves_a_gap():
+    assert merge_json([0, 1], {"3": 3}) == [0, 1]
+    assert merge_json([0, 1], {"2": 2, "4": 4}) == [0, 1, 2]
+
+def test_missing_placements_are_repaired_one_by_one(multi_request):
+    client = FakeClient([
+        {"placements": [placement()]},
+        {"placements": {"1": placement("shelf"), "2": placement("wall")}},
+    ])
+    response = vision_service._run_request(multi_request, None, client)
+    assert [p.reference_object.label for p in response.placements] == ["table", "shelf", "wall"]
+    assert client.requests[0]["response_format"]["json_schema"]["schema"] == SCHEMA
+    repair_schema = client.requests[1]["response_format"]["json_schema"]["schema"]
+    assert repair_schema["properties"]["placements"]["required"] == ["1", "2"]
+
+def test_gap_in_repair_is_asked_for_again(multi_request):
+    client = FakeClient([
+        {"placements": [placement()]},
+        {"placements": {"2": placement("wall")}},  # Skips index 1
+        {"placements": {"1": placement("shelf"), "2": placement("wall")}},
+    ])
+    response = vision_service._run_request(multi_request, None, client)
+    assert [p.reference_object.label for p in response.placements] == ["table", "shelf", "wall"]
+    repair_schema = client.requests[2]["response_format"]["json_schema"]["schema"]
+    assert repair_schema["properties"]["placements"]["required"] == ["1", "2"]
+
+def test_surplus_placements_redo_the_whole_list(multi_request):
+    client = FakeClient([
+        {"placements": [placement()] * 4},
+        {"placements": [placement("a"), placement("b"), placement("c")]},
+    ])
+    response = vision_service._run_request(multi_request, None, client)
+    assert [p.reference_object.label for p in response.placements] == ["a", "b", "c"]
+    repair_schema = client.requests[1]["response_format"]["json_schema"]["schema"]
+    assert repair_schema["properties"]["placements"]["type"] == "array"
+
+def test_unrepaired_placements_raise(multi_request, monkeypatch):
+    monkeypatch.setattr(vision_service, "VISION_MAX_REPAIR_ATTEMPTS", 1)
+    client = FakeClient([{"placements": [placement()]}, {"placements": {"1": placement()}}])
+    with pytest.raises(ValueError, match="placements.2"):
+        vision_service._run_request(multi_request, None, client)
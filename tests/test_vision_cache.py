@@ -0,0 +1,25 @@
+"""Vision cache keys change with everything that shapes the reply."""
+import pytest
+from PIL import Image
+from think_n_blend.services import vision_service
+
+@pytest.fixture
+def main_image():
+    return Image.new("RGB", (16, 16), "white")
+
+@pytest.mark.parametrize("setting, value", [
+    ("VISION_MAX_IMAGE_SIDE", 512),
+    ("VISION_IMAGE_FORMAT", "WEBP"),
+    ("VISION_IMAGE_QUALITY", 60),
+    ("VISION_STRUCTURED_OUTPUT", False),
+    ("VISION_RESPONSE_SCHEMA", {"type": "object", "properties": {}, "required": [], "additionalProperties": False}),
+])
+def test_key_changes_with_request_settings(main_image, monkeypatch, setting, value):
+    key = vision_service._text_request(main_image, "SALE")["cache_key"]
+    monkeypatch.setattr(vision_service, setting, value)
+    assert vision_service._text_request(main_image, "SALE")["cache_key"] != key
+
+def test_key_is_stable_for_the_same_request(main_image):
+    first = vision_service._text_request(main_image, "SALE")["cache_key"]
+    assert vision_service._text_request(main_image.copy(), "SALE")["cache_key"] == first
+    assert vision_service._text_request(main_image, "OPEN")["cache_key"] != first
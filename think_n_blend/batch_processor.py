@@ -1,22 +1,109 @@
 import os
 import json
+import asyncio
 import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
 from pathlib import Path
-from typing import List, Dict, Any
-from think_n_blend.cli import object_insertion_pipeline, text_insertion_pipeline
-from think_n_blend.schemas import InsertionResult
+from typing import List, Dict, Any, Callable, Optional
+from think_n_blend.cli import (
+    object_insertion_pipeline, text_insertion_pipeline, multi_insertion_pipeline,
+    detect_and_compose, blend_object, insert_text, plan_insertions, blend_insertions
+)
+from think_n_blend.config import (
+    DEFAULT_MAX_IN_FLIGHT_REQUESTS, DEFAULT_DETECTION_WORKERS,
+    DEFAULT_BLENDING_WORKERS, DEFAULT_STAGE_QUEUE_SIZE, BATCH_JOURNAL_FILE, DEFAULT_PASTE_WORKERS,
+    METRICS_FILE, METRICS_JOBS_FILE, DEFAULT_VERIFICATION_WORKERS, DEFAULT_VERIFICATION_BATCH_SIZE
+)
+from think_n_blend.schemas import InsertionResult, InsertionSpec, VerificationCheck, VerificationResult
+from think_n_blend.services import vision_service
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.paste_pool import PastePool, PasteTask
+from think_n_blend.services.verification_queue import VerificationQueue, planned_checks, save_checks
+from think_n_blend.services.vision_cache import vision_cache
+from think_n_blend.utils.image_utils import ImageContext
+from think_n_blend.utils.job_utils import job_output_dir, multi_job_output_dir, job_inputs_hash, JobJournal
+from think_n_blend.utils.metrics import metrics
+
+class _MainImages:
+    """
+    One ImageContext per distinct main image for a whole concurrent run, so each image is read
+    and decoded once however many jobs use it. With a paste pool, the run also holds the
+    image's shared block. Both are released once the image's last job is journaled.
+    """
+
+    def __init__(self, jobs: List[Dict[str, Any]], paste_pool: Optional[PastePool] = None):
+        self._remaining = Counter(job['main_image'] for job in jobs)
+        self._contexts: Dict[str, ImageContext] = {}
+        self._paste_pool = paste_pool
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> ImageContext:
+        with self._lock:
+            if path not in self._contexts:
+                context = ImageContext(path)
+                if self._paste_pool is not None:
+                    self._paste_pool.share(context)
+                self._contexts[path] = context
+            return self._contexts[path]
+
+    def done(self, path: str):
+        """Called once per finished job, whatever stage it stopped at."""
+        with self._lock:
+            self._remaining[path] -= 1
+            if self._remaining[path] > 0:
+                return
+            context = self._contexts.pop(path, None)
+        if context is not None:
+            context.release()
+            if self._paste_pool is not None:
+                self._paste_pool.release(path)
 
 class BatchProcessor:
     """Handles batch processing of multiple images for object and text insertion."""
     
-    def __init__(self, input_dir: str, output_dir: str):
+    def __init__(self, input_dir: str, output_dir: str, concurrent: bool = False,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+                 detection_workers: int = DEFAULT_DETECTION_WORKERS,
+                 blending_workers: int = DEFAULT_BLENDING_WORKERS,
+                 queue_size: int = DEFAULT_STAGE_QUEUE_SIZE,
+                 resume: bool = False,
+                 diffusion_model: str = "unicombine",
+                 paste_workers: int = DEFAULT_PASTE_WORKERS,
+                 verification_workers: int = DEFAULT_VERIFICATION_WORKERS,
+                 verification_batch_size: int = DEFAULT_VERIFICATION_BATCH_SIZE):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.concurrent = concurrent
+        self.max_in_flight = max_in_flight
+        self.detection_workers = detection_workers
+        self.blending_workers = blending_workers
+        self.queue_size = queue_size
+        self.diffusion_model = diffusion_model
+        # Simple-paste rendering can fan out to worker processes, which the staged (concurrent) runner feeds
+        self.paste_workers = paste_workers if model_manager.is_simple_paste_model(diffusion_model) else 0
+        if self.paste_workers and not self.concurrent:
+            print(f"Using concurrent stages to feed {self.paste_workers} paste worker processes")
+            self.concurrent = True
+        self.verification_workers = verification_workers
+        self.verification_batch_size = verification_batch_size
+        self._verification: Optional[VerificationQueue] = None  # Set while a verifying run is in progress
+        self.job_ids: List[str] = []  # Every job of this run in submission order, for ordered results
+        self._resumed_job_ids: List[str] = []  # Jobs of this run skipped as already completed
+        # Every finished job is journaled as it completes; resuming skips the ones that succeeded
+        self.journal = JobJournal(str(self.output_dir / BATCH_JOURNAL_FILE), resume=resume)
+        # Per-job stage timings go next to the journal, and follow the same resume rule
+        jobs_metrics_path = self.output_dir / METRICS_JOBS_FILE
+        if not resume:
+            jobs_metrics_path.unlink(missing_ok=True)
+        metrics.set_jobs_file(str(jobs_metrics_path))
         
-    def process_object_insertions(self, object_crops_dir: str, verify: bool = False) -> List[Dict[str, Any]]:
-        """Process object insertions for multiple images."""
-        results = []
+    def process_object_insertions(self, object_crops_dir: str, verify: bool = False):
+        """Process object insertions for multiple images. Results are written to the journal."""
         object_crops_dir = Path(object_crops_dir)
         
         # Get all main images
@@ -25,46 +112,50 @@ class BatchProcessor:
         
         print(f"Found {len(main_images)} main images and {len(object_crops)} object crops")
         
-        for i, main_image in enumerate(main_images):
-            for j, object_crop in enumerate(object_crops):
-                print(f"\nProcessing {i+1}/{len(main_images)} main image with {j+1}/{len(object_crops)} object crop")
-                
-                try:
-                    result_path = object_insertion_pipeline(
-                        str(main_image),
-                        str(object_crop),
-                        verify
-                    )
-                    
-                    if result_path:
-                        results.append({
-                            'main_image': str(main_image),
-                            'object_crop': str(object_crop),
-                            'output_path': result_path,
-                            'success': True
-                        })
-                    else:
-                        results.append({
-                            'main_image': str(main_image),
-                            'object_crop': str(object_crop),
-                            'success': False,
-                            'error': 'Pipeline failed'
-                        })
-                        
-                except Exception as e:
-                    results.append({
-                        'main_image': str(main_image),
-                        'object_crop': str(object_crop),
-                        'success': False,
-                        'error': str(e)
-                    })
+        jobs = self._pending([
+            self._new_job(
+                "object",
+                job_output_dir(str(self.output_dir), "object", str(main_image), object_crop=str(object_crop)),
+                image_paths=[str(main_image), str(object_crop)],
+                values=[],
+                main_image=str(main_image),
+                object_crop=str(object_crop),
+            )
+            for main_image in main_images
+            for object_crop in object_crops
+        ])
+        result_keys = ['main_image', 'object_crop']
         
-        return results
+        with self._verifying(verify):
+            if self.concurrent:
+                self._run_concurrent(
+                    jobs,
+                    reason=lambda job, client: vision_service.get_vision_reasoning_async(
+                        job['main_image'], job['object_crop'], job['output_dir'], client
+                    ),
+                    finish=lambda job: blend_object(
+                        job['main_context'], job['object_crop'], job['vision_response'],
+                        job['reference_box'], job['target_box'], False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                    paste_task=lambda job: PasteTask(
+                        output_path=os.path.join(job['output_dir'], "simple_paste_result.jpg"),
+                        layers=[("object", job['object_crop'], job['target_box'])],
+                        visualizations=[(job['reference_box'], job['target_box'],
+                                         os.path.join(job['output_dir'], "object_bounding_boxes_visualization.jpg"))],
+                    ),
+                )
+            else:
+                self._run_sequential(
+                    jobs,
+                    run=lambda job: object_insertion_pipeline(
+                        job['main_image'], job['object_crop'], False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                )
     
-    def process_text_insertions(self, texts: List[str], positions: List[str] = None, verify: bool = False) -> List[Dict[str, Any]]:
-        """Process text insertions for multiple images."""
-        results = []
-        
+    def process_text_insertions(self, texts: List[str], positions: List[str] = None, verify: bool = False):
+        """Process text insertions for multiple images. Results are written to the journal."""
         if positions is None:
             positions = ["top", "bottom", "left", "right"]
         
@@ -73,96 +164,481 @@ class BatchProcessor:
         
         print(f"Found {len(main_images)} main images")
         
-        for i, main_image in enumerate(main_images):
-            for j, text in enumerate(texts):
-                for k, position in enumerate(positions):
-                    print(f"\nProcessing {i+1}/{len(main_images)} main image with text '{text}' at position {position}")
-                    
-                    try:
-                        result_path = text_insertion_pipeline(
-                            str(main_image),
-                            text,
-                            position,
-                            verify
-                        )
-                        
-                        if result_path:
-                            results.append({
-                                'main_image': str(main_image),
-                                'text': text,
-                                'position': position,
-                                'output_path': result_path,
-                                'success': True
-                            })
-                        else:
-                            results.append({
-                                'main_image': str(main_image),
-                                'text': text,
-                                'position': position,
-                                'success': False,
-                                'error': 'Pipeline failed'
-                            })
-                            
-                    except Exception as e:
-                        results.append({
-                            'main_image': str(main_image),
-                            'text': text,
-                            'position': position,
-                            'success': False,
-                            'error': str(e)
-                        })
-        
-        return results
-    
-    def save_results(self, results: List[Dict[str, Any]], filename: str):
-        """Save processing results to JSON file."""
+        jobs = self._pending([
+            self._new_job(
+                "text",
+                os.path.join(job_output_dir(str(self.output_dir), "text", str(main_image), text=text), position),
+                image_paths=[str(main_image)],
+                values=[text, position],
+                main_image=str(main_image),
+                text=text,
+                position=position,
+            )
+            for main_image in main_images
+            for text in texts
+            for position in positions
+        ])
+        result_keys = ['main_image', 'text', 'position']
+        
+        with self._verifying(verify):
+            if self.concurrent:
+                self._run_concurrent(
+                    jobs,
+                    reason=lambda job, client: vision_service.get_text_vision_reasoning_async(
+                        job['main_image'], job['text'], job['output_dir'], client
+                    ),
+                    finish=lambda job: insert_text(
+                        job['main_context'], job['text'], job['reference_box'], job['target_box'],
+                        False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                    paste_task=lambda job: PasteTask(
+                        output_path=os.path.join(job['output_dir'], f"simple_text_{job['text'].replace(' ', '_')}.jpg"),
+                        layers=[("text", job['text'], job['target_box'])],
+                        visualizations=[(job['reference_box'], job['target_box'],
+                                         os.path.join(job['output_dir'], "text_bounding_boxes_visualization.jpg"))],
+                    ),
+                )
+            else:
+                self._run_sequential(
+                    jobs,
+                    run=lambda job: text_insertion_pipeline(
+                        job['main_image'], job['text'], False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                )
+    
+    def process_multi_insertions(self, object_crops_dir: Optional[str] = None, texts: Optional[List[str]] = None,
+                                 verify: bool = False):
+        """Insert all object crops and texts together into each main image, one render per image."""
+        # Get all main images
+        main_images = list(self.input_dir.glob("*.jpg")) + list(self.input_dir.glob("*.png"))
+        insertions = []
+        if object_crops_dir:
+            object_crops = list(Path(object_crops_dir).glob("*.jpg")) + list(Path(object_crops_dir).glob("*.png"))
+            insertions += [InsertionSpec("object", object_crop=str(object_crop)) for object_crop in object_crops]
+        insertions += [InsertionSpec("text", text=text) for text in texts or []]
+        subjects = [spec.subject for spec in insertions]
+        
+        print(f"Found {len(main_images)} main images and {len(insertions)} insertions per image")
+        
+        jobs = self._pending([
+            self._new_job(
+                "multi",
+                multi_job_output_dir(str(self.output_dir), str(main_image), insertions),
+                image_paths=[str(main_image)] + [spec.object_crop for spec in insertions if spec.kind == "object"],
+                values=[spec.text for spec in insertions if spec.kind == "text"],
+                main_image=str(main_image),
+                insertions=insertions,
+                subjects=subjects,
+            )
+            for main_image in main_images
+        ])
+        result_keys = ['main_image', 'subjects']
+        
+        with self._verifying(verify):
+            if self.concurrent:
+                self._run_concurrent(
+                    jobs,
+                    reason=lambda job, client: vision_service.get_multi_vision_reasoning_async(
+                        job['main_image'], job['insertions'], job['output_dir'], client
+                    ),
+                    finish=lambda job: blend_insertions(
+                        job['main_context'], job['planned'], False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                    plan=self._plan_multi,
+                    paste_task=self._multi_paste_task,
+                )
+            else:
+                self._run_sequential(
+                    jobs,
+                    run=lambda job: multi_insertion_pipeline(
+                        job['main_image'], job['insertions'], False, self.diffusion_model, job['output_dir']
+                    ),
+                    result_keys=result_keys,
+                )
+    
+    def _new_job(self, mode: str, output_dir: str, image_paths: List[str], values: List[str],
+                 **fields) -> Dict[str, Any]:
+        """Creates a job identified by its output directory and fingerprinted by its inputs."""
+        return {
+            **fields,
+            'mode': mode,
+            'output_dir': output_dir,
+            'job_id': os.path.relpath(output_dir, self.output_dir),
+            'inputs_hash': job_inputs_hash(mode, image_paths, values),
+        }
+    
+    def _pending(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drops jobs the journal records as already completed on the same inputs."""
+        self.job_ids.extend(job['job_id'] for job in jobs)
+        pending = [job for job in jobs if not self.journal.is_complete(job['job_id'], job['inputs_hash'])]
+        pending_ids = {job['job_id'] for job in pending}
+        self._resumed_job_ids = [job['job_id'] for job in jobs if job['job_id'] not in pending_ids]
+        if len(pending) < len(jobs):
+            print(f"Resuming: {len(jobs) - len(pending)} jobs already completed, {len(pending)} to run")
+        return pending
+    
+    def _record(self, job: Dict[str, Any], result_keys: List[str], output_path: Optional[str] = None,
+                error: Optional[str] = None):
+        """Journals a finished job's result and its metrics record."""
+        if 'metrics' in job:
+            metrics.finish_job(job['metrics'], bool(output_path), output_path, None if output_path else error)
+        result = {key: job[key] for key in result_keys}
+        if output_path:
+            result.update(output_path=output_path, success=True)
+        else:
+            result.update(success=False, error=error or 'Pipeline failed')
+        self.journal.record(job['job_id'], job['inputs_hash'], result)
+        if output_path and self._verification is not None:
+            self._verification.submit((job['job_id'], job['inputs_hash'], result), output_path, job['output_dir'])
+    
+    @contextmanager
+    def _verifying(self, verify: bool):
+        """With verify, runs the verification stage beside the pipeline and waits for it to drain on exit."""
+        if not verify:
+            yield
+            return
+        print(f"Verifying finished outputs in {self.verification_workers} workers "
+              f"(up to {self.verification_batch_size} per pass)")
+        with VerificationQueue(self._record_verification, self.verification_workers,
+                               self.verification_batch_size) as verification:
+            self._verification = verification
+            try:
+                self._verify_resumed()
+                yield
+            finally:
+                self._verification = None
+    
+    def _record_verification(self, key, results: List[VerificationResult]):
+        """Journals a job's result again, now with its verification results."""
+        job_id, inputs_hash, result = key
+        passed = sum(result_item.passed for result_item in results)
+        errors = [result_item.error_message for result_item in results if result_item.error_message]
+        print(f"Verification of {job_id}: {passed}/{len(results)} insertions found"
+              + (f" ({'; '.join(errors)})" if errors else ""))
+        self.journal.record(job_id, inputs_hash, {
+            **result,
+            'verification': [asdict(result_item) for result_item in results],
+            'verified': all(result_item.passed for result_item in results),
+        })
+    
+    def _submit_finished(self, records: List[Dict[str, Any]]):
+        """Queues the journaled records of successful jobs whose output still exists for verification."""
+        for record in records:
+            if record['status'] == "success" and os.path.exists(record['result'].get('output_path', "")):
+                self._verification.submit(
+                    (record['job_id'], record['inputs_hash'], record['result']),
+                    record['result']['output_path'], str(self.output_dir / record['job_id'])
+                )
+    
+    def _verify_resumed(self):
+        """Queues jobs a resumed run skips as completed but that were never verified, e.g. after a killed --verify run."""
+        resumed = set(self._resumed_job_ids)
+        unverified = [record for record in self.journal.iter_records()
+                      if record['job_id'] in resumed and 'verified' not in record['result']]
+        if unverified:
+            print(f"Verifying {len(unverified)} completed jobs that were not verified before")
+            self._submit_finished(unverified)
+    
+    def verify_outputs(self):
+        """Verifies the outputs of every successful job already journaled in the output directory."""
+        records = list(self.journal.iter_records())
+        self.job_ids = [record['job_id'] for record in records]
+        self._resumed_job_ids = []
+        finished = [record for record in records
+                    if record['status'] == "success" and os.path.exists(record['result'].get('output_path', ""))]
+        print(f"Found {len(finished)} finished jobs to verify")
+        with self._verifying(True):
+            self._submit_finished(finished)
+    
+    def _run_sequential(self, jobs: List[Dict[str, Any]], run: Callable, result_keys: List[str]):
+        """Run jobs one after another through the full pipeline."""
+        for i, job in enumerate(jobs):
+            print(f"\nProcessing {i+1}/{len(jobs)}: " + ", ".join(f"{key}={job[key]}" for key in result_keys))
+            
+            job['metrics'] = metrics.start_job(job['job_id'], job['mode'])
+            try:
+                self._record(job, result_keys, output_path=metrics.run_in_job(job['metrics'], run, job))
+            except Exception as e:
+                self._record(job, result_keys, error=str(e))
+    
+    @staticmethod
+    def _plan_single(job: Dict[str, Any]) -> bool:
+        """Stages 2-3 for a single-insertion job."""
+        boxes = detect_and_compose(job['main_context'], job['vision_response'])
+        if not boxes:
+            job['error'] = f"Could not detect any of {job['vision_response'].reference_object.candidate_labels}"
+            return False
+        job['reference_box'], job['target_box'] = boxes
+        return True
+    
+    @staticmethod
+    def _plan_multi(job: Dict[str, Any]) -> bool:
+        """Stages 2-3 for a multi-insertion job."""
+        job['planned'] = plan_insertions(job['main_context'], job['insertions'], job['vision_response'])
+        if not job['planned']:
+            job['error'] = "Could not place any of the insertions"
+            return False
+        return True
+    
+    @staticmethod
+    def _multi_paste_task(job: Dict[str, Any]) -> PasteTask:
+        """Describes the simple-paste render of a planned multi-insertion job."""
+        usable = [insertion for insertion in job['planned']
+                  if insertion.target_box[2] > insertion.target_box[0] and insertion.target_box[3] > insertion.target_box[1]]
+        if not usable:
+            raise ValueError("No insertion has a usable target box")
+        return PasteTask(
+            output_path=os.path.join(job['output_dir'], "simple_multi_paste_result.jpg"),
+            layers=[(insertion.spec.kind, insertion.spec.subject, insertion.target_box) for insertion in usable],
+            visualizations=[
+                (insertion.reference.box, insertion.target_box,
+                 os.path.join(job['output_dir'], f"insertion_{index}_bounding_boxes_visualization.jpg"))
+                for index, insertion in enumerate(job['planned'])
+            ],
+        )
+    
+    @staticmethod
+    def _checks(job: Dict[str, Any]) -> List[VerificationCheck]:
+        """What verification looks for in a job rendered by the paste pool."""
+        if 'planned' in job:
+            return planned_checks(job['planned'])
+        if 'text' in job:
+            return [VerificationCheck("text", job['text'], job['target_box'])]
+        return [VerificationCheck("object", job['vision_response'].target_object.label, job['target_box'])]
+    
+    def _run_concurrent(self, jobs: List[Dict[str, Any]], reason: Callable, finish: Callable,
+                        result_keys: List[str], plan: Optional[Callable] = None,
+                        paste_task: Optional[Callable] = None):
+        """Run jobs through concurrent reasoning, detection and blending stages."""
+        paste_task = paste_task if self.paste_workers else None
+        blending = f"{self.paste_workers} paste processes" if paste_task else f"{self.blending_workers} blending workers"
+        print(f"Running {len(jobs)} jobs concurrently "
+              f"({self.max_in_flight} in-flight requests, {self.detection_workers} detection workers, {blending})")
+        asyncio.run(self._run_stages(
+            jobs, reason, plan or self._plan_single, finish,
+            record=lambda job: self._record(job, result_keys, job.get('output_path'), job.get('error')),
+            paste_task=paste_task,
+        ))
+    
+    async def _run_stages(self, jobs: List[Dict[str, Any]], reason: Callable, plan: Callable,
+                          finish: Callable, record: Callable, paste_task: Optional[Callable] = None):
+        """
+        Stage 1 runs on the async OpenAI client; Stages 2-4 run in thread pools fed by bounded queues.
+        With a paste_task builder, Stage 4 renders in the paste worker processes instead.
+        """
+        from openai import AsyncOpenAI
+        
+        loop = asyncio.get_running_loop()
+        client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        reasoning_queue: asyncio.Queue = asyncio.Queue()
+        detection_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        blending_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        
+        async def run_reasoning(job):
+            job['vision_response'] = await reason(job, client)
+            return True
+        
+        def run_detection(job):
+            # Every job on the same main image shares one decoded context until its last job is journaled
+            job['main_context'] = main_images.get(job['main_image'])
+            return plan(job)
+        
+        def run_blending(job):
+            job['output_path'] = finish(job)
+            return bool(job['output_path'])
+        
+        async def run_pooled_blending(job):
+            with metrics.span("blending"):
+                future = paste_pool.submit(job['main_context'], paste_task(job))
+                job['output_path'] = await asyncio.wrap_future(future)
+            save_checks(job['output_dir'], self._checks(job))
+            return bool(job['output_path'])
+        
+        async def stage_worker(in_queue: asyncio.Queue, out_queue: Optional[asyncio.Queue], handler: Callable,
+                               executor: Optional[ThreadPoolExecutor], stage_name: str):
+            while True:
+                job = await in_queue.get()
+                if job is None:
+                    return
+                if 'metrics' not in job:
+                    job['metrics'] = metrics.start_job(job['job_id'], job['mode'])
+                try:
+                    if executor is None:
+                        with metrics.job_context(job['metrics']):
+                            ok = await handler(job)
+                    else:
+                        # Executor threads do not inherit the task's context, so hand the record over
+                        ok = await loop.run_in_executor(executor, metrics.run_in_job, job['metrics'], handler, job)
+                except Exception as e:
+                    print(f"Error in {stage_name} stage: {e}")
+                    job['error'] = str(e)
+                    ok = False
+                if ok and out_queue is not None:
+                    await out_queue.put(job)
+                else:
+                    # The job is done, successfully or not; journal it right away
+                    record(job)
+                    main_images.done(job['main_image'])
+        
+        for job in jobs:
+            reasoning_queue.put_nowait(job)
+        for _ in range(self.max_in_flight):
+            reasoning_queue.put_nowait(None)
+        
+        with ThreadPoolExecutor(self.detection_workers) as detection_pool, \
+                ThreadPoolExecutor(self.blending_workers) as blending_pool, \
+                (PastePool(self.paste_workers) if paste_task else nullcontext()) as paste_pool:
+            main_images = _MainImages(jobs, paste_pool)
+            reasoning_tasks = [
+                asyncio.create_task(stage_worker(reasoning_queue, detection_queue, run_reasoning, None, "reasoning"))
+                for _ in range(self.max_in_flight)
+            ]
+            detection_tasks = [
+                asyncio.create_task(stage_worker(detection_queue, blending_queue, run_detection, detection_pool, "detection"))
+                for _ in range(self.detection_workers)
+            ]
+            if paste_task:
+                # Two submissions per process keep every worker busy while the next task is shared
+                blending_tasks = [
+                    asyncio.create_task(stage_worker(blending_queue, None, run_pooled_blending, None, "blending"))
+                    for _ in range(self.paste_workers * 2)
+                ]
+            else:
+                blending_tasks = [
+                    asyncio.create_task(stage_worker(blending_queue, None, run_blending, blending_pool, "blending"))
+                    for _ in range(self.blending_workers)
+                ]
+            
+            # Shut the stages down in order once upstream work has drained
+            await asyncio.gather(*reasoning_tasks)
+            for _ in detection_tasks:
+                await detection_queue.put(None)
+            await asyncio.gather(*detection_tasks)
+            for _ in blending_tasks:
+                await blending_queue.put(None)
+            await asyncio.gather(*blending_tasks)
+        
+        await client.close()
+    
+    def save_results(self, filename: str):
+        """Save the latest result of every job, in submission order, to a JSON file streamed from the journal."""
         output_file = self.output_dir / filename
+        successful = total = verified = checked = 0
         with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+            f.write("[")
+            for result in self.journal.iter_results(self.job_ids):
+                f.write(",\n" if total else "\n")
+                f.write(json.dumps(result, indent=2))
+                total += 1
+                successful += bool(result.get('success', False))
+                if 'verified' in result:
+                    checked += 1
+                    verified += result['verified']
+            f.write("\n]\n")
         print(f"Results saved to {output_file}")
+        metrics.write_prometheus(str(self.output_dir / METRICS_FILE))
+        print(f"Metrics saved to {self.output_dir / METRICS_FILE} (per job: {self.output_dir / METRICS_JOBS_FILE})")
         
         # Print summary
-        successful = sum(1 for r in results if r.get('success', False))
-        total = len(results)
         print(f"Processing complete: {successful}/{total} successful insertions")
+        if checked:
+            print(f"Verification: {verified}/{checked} verified jobs found every insertion")
 
 def main():
     parser = argparse.ArgumentParser(description="Batch processing for ThinkNBlend")
-    parser.add_argument("--mode", choices=["object", "text"], required=True,
-                       help="Insertion mode")
+    parser.add_argument("--mode", choices=["object", "text", "multi", "verify"], required=True,
+                       help="Insertion mode, or verify to check the finished jobs already in --output_dir")
     parser.add_argument("--input_dir", type=str, default="input",
                        help="Directory containing main images")
     parser.add_argument("--output_dir", type=str, default="output",
                        help="Directory for output images")
     parser.add_argument("--object_crops_dir", type=str,
-                       help="Directory containing object crops (for object mode)")
+                       help="Directory containing object crops (for object and multi mode)")
     parser.add_argument("--texts", type=str, nargs="+",
-                       help="List of texts to insert (for text mode)")
+                       help="List of texts to insert (for text and multi mode)")
     parser.add_argument("--positions", type=str, nargs="+", 
                        default=["top", "bottom", "left", "right"],
                        help="Text positions (for text mode)")
     parser.add_argument("--verify", action="store_true",
-                       help="Enable verification for all insertions")
+                       help="Verify every finished insertion in a separate stage beside the pipeline")
+    parser.add_argument("--verification_workers", type=int, default=DEFAULT_VERIFICATION_WORKERS,
+                       help="Threads running verification")
+    parser.add_argument("--verification_batch_size", type=int, default=DEFAULT_VERIFICATION_BATCH_SIZE,
+                       help="Finished outputs a verification worker takes per pass")
     parser.add_argument("--output_file", type=str, default="batch_results.json",
                        help="Output file for results")
+    parser.add_argument("--concurrent", action="store_true",
+                       help="Run reasoning, detection and blending as concurrent stages")
+    parser.add_argument("--max_in_flight", type=int, default=DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+                       help="Maximum concurrent GPT-4 Vision requests (concurrent mode)")
+    parser.add_argument("--detection_workers", type=int, default=DEFAULT_DETECTION_WORKERS,
+                       help="Number of detection workers (concurrent mode)")
+    parser.add_argument("--blending_workers", type=int, default=DEFAULT_BLENDING_WORKERS,
+                       help="Number of blending workers (concurrent mode)")
+    parser.add_argument("--queue_size", type=int, default=DEFAULT_STAGE_QUEUE_SIZE,
+                       help="Jobs buffered between stages (concurrent mode)")
+    parser.add_argument("--no_cache", action="store_true",
+                       help="Bypass the GPT-4 Vision reasoning cache")
+    parser.add_argument("--clear_cache", action="store_true",
+                       help="Invalidate the GPT-4 Vision reasoning cache before running")
+    parser.add_argument("--resume", action="store_true",
+                       help="Skip jobs the output directory's journal records as completed; rerun failures")
+    parser.add_argument("--diffusion_model", type=str, default="unicombine",
+                       help="Diffusion model to use for blending")
+    parser.add_argument("--simple_paste", action="store_true",
+                       help="Use simple paste instead of diffusion model")
+    parser.add_argument("--paste_workers", type=int, default=DEFAULT_PASTE_WORKERS,
+                       help="Render simple-paste jobs in this many worker processes (0 renders in threads)")
+    parser.add_argument("--metrics_port", type=int,
+                       help="Serve live Prometheus metrics on this port at /metrics while the batch runs")
     
     args = parser.parse_args()
     
-    processor = BatchProcessor(args.input_dir, args.output_dir)
+    if args.clear_cache:
+        print(f"Cleared {vision_cache.clear()} cached vision reasoning results")
+    vision_cache.set_enabled(not args.no_cache)
+    
+    # Validate before opening the journal, which a fresh (non-resumed) run truncates
+    if args.mode == "object" and not args.object_crops_dir:
+        parser.error("--object_crops_dir is required for object mode")
+    if args.mode == "text" and not args.texts:
+        parser.error("--texts is required for text mode")
+    if args.mode == "multi" and not args.object_crops_dir and not args.texts:
+        parser.error("--object_crops_dir and/or --texts are required for multi mode")
+    if args.mode == "verify" and not os.path.exists(os.path.join(args.output_dir, BATCH_JOURNAL_FILE)):
+        parser.error(f"verify mode needs an earlier run's {BATCH_JOURNAL_FILE} in --output_dir")
+    
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    
+    processor = BatchProcessor(
+        args.input_dir,
+        args.output_dir,
+        concurrent=args.concurrent,
+        max_in_flight=args.max_in_flight,
+        detection_workers=args.detection_workers,
+        blending_workers=args.blending_workers,
+        queue_size=args.queue_size,
+        resume=args.resume or args.mode == "verify",
+        diffusion_model="simple_paste" if args.simple_paste else args.diffusion_model,
+        paste_workers=args.paste_workers,
+        verification_workers=args.verification_workers,
+        verification_batch_size=args.verification_batch_size,
+    )
     
     if args.mode == "object":
-        if not args.object_crops_dir:
-            parser.error("--object_crops_dir is required for object mode")
-        
-        results = processor.process_object_insertions(args.object_crops_dir, args.verify)
-        
+        processor.process_object_insertions(args.object_crops_dir, args.verify)
     elif args.mode == "text":
-        if not args.texts:
-            parser.error("--texts is required for text mode")
-        
-        results = processor.process_text_insertions(args.texts, args.positions, args.verify)
+        processor.process_text_insertions(args.texts, args.positions, args.verify)
+    elif args.mode == "multi":
+        processor.process_multi_insertions(args.object_crops_dir, args.texts, args.verify)
+    elif args.mode == "verify":
+        processor.verify_outputs()
     
-    processor.save_results(results, args.output_file)
+    processor.save_results(args.output_file)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
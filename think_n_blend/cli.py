@@ -1,53 +1,54 @@
 import argparse
 import os
+from typing import List
 from think_n_blend.services import (
     vision_service, detection_service, composition_service, 
     blending_service, text_service, verification_service
 )
-from think_n_blend.schemas import TextInsertion
-from think_n_blend.utils.image_utils import create_dummy_image, save_bounding_box_visualization
+from think_n_blend.schemas import TextInsertion, InsertionSpec, PlannedInsertion, VerificationCheck
+from think_n_blend.utils.image_utils import (
+    create_dummy_image, save_bounding_box_visualization, ImageContext, ImageSource
+)
+from think_n_blend.utils.job_utils import job_output_dir, multi_job_output_dir
+from think_n_blend.utils.metrics import metrics
 from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.vision_cache import vision_cache
+from think_n_blend.services.verification_queue import planned_checks, save_checks
 
-def object_insertion_pipeline(main_image: str, object_crop: str, verify: bool = False, diffusion_model: str = "unicombine", output_dir: str = "output"):
-    """Runs the object insertion pipeline."""
-    print("=== Object Insertion Pipeline ===")
-    
-    # Check model availability
-    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
-        print(f"Error: {diffusion_model} model not available")
-        return None
-    
-    # --- Stage 1: GPT-4 Vision Reasoning ---
-    print("\n--- Stage 1: GPT-4 Vision Reasoning ---")
-    try:
-        vision_response = vision_service.get_vision_reasoning(main_image, object_crop, output_dir)
-        print(f"Reference Object Label: {vision_response.reference_object.label}")
-        print(f"Relative Position: {vision_response.target_object.relative_position}")
-        print(f"Inpainting Description: {vision_response.target_object.inpainting_description}")
-    except Exception as e:
-        print(f"Error in Stage 1: {e}")
-        return None
-    print("---------------------------------------------")
-
+def detect_and_compose(main_image: ImageSource, vision_response):
+    """Runs detection and target box computation (Stages 2-3). Returns (reference_box, target_box) or None."""
     # --- Stage 2: Zero-Shot Object Detection ---
     print("\n--- Stage 2: Zero-Shot Object Detection ---")
-    reference_box = detection_service.detect_reference_object(
-        main_image, vision_response.reference_object.label
-    )
-    if not reference_box:
-        print(f"Could not detect '{vision_response.reference_object.label}' in the image.")
+    candidate_labels = vision_response.reference_object.candidate_labels
+    detection = detection_service.detect_best_reference(main_image, candidate_labels)
+    if not detection:
+        print(f"Could not detect any of {candidate_labels} in the image.")
+        metrics.increment("stage_failures_total", stage="detection")
         return None
+    reference_box = detection.box
+    print(f"Detected reference '{detection.label}' (candidate {detection.rank + 1}/{len(candidate_labels)}, "
+          f"score {detection.score:.2f}, {detection.model})")
     print(f"Detected reference box: {reference_box}")
     print("-----------------------------------------")
 
     # --- Stage 3: Compute Target Insertion Bounding Box ---
     print("\n--- Stage 3: Compute Target Bounding Box ---")
-    target_box = composition_service.compute_target_bounding_box(
+    target_boxes = composition_service.find_target_boxes(
         main_image, reference_box, vision_response.target_object.relative_position
     )
+    if not target_boxes:
+        print(f"No usable target box next to the reference box {reference_box}.")
+        metrics.increment("stage_failures_total", stage="composition")
+        return None
+    target_box = target_boxes[0]
     print(f"Computed target box: {target_box}")
+    print(f"Alternative target boxes: {target_boxes[1:]}")
     print("------------------------------------------")
+    return reference_box, target_box
 
+def blend_object(main_image: ImageSource, object_crop: str, vision_response, reference_box, target_box,
+                 verify: bool = False, diffusion_model: str = "unicombine", output_dir: str = "output"):
+    """Runs object blending and optional verification (Stage 4). Returns the final image path or None."""
     # --- Stage 4: Stable Diffusion Blending ---
     final_image_path = blending_service.blend_object_with_unicombine(
         main_image,
@@ -60,12 +61,13 @@ def object_insertion_pipeline(main_image: str, object_crop: str, verify: bool =
 
     if final_image_path:
         print(f"\nPipeline complete. Final image saved at: {final_image_path}")
+        save_checks(output_dir, [VerificationCheck("object", vision_response.target_object.label, target_box)])
         
         # Verification
         if verify:
             print("\n--- Verification ---")
             verification_result = verification_service.verify_insertion_quality(
-                final_image_path, "object", vision_response.target_object.label
+                final_image_path, "object", vision_response.target_object.label, target_box
             )
             print(f"Object detected: {verification_result.object_detected}")
             print(f"Confidence: {verification_result.object_confidence}")
@@ -80,48 +82,12 @@ def object_insertion_pipeline(main_image: str, object_crop: str, verify: bool =
         return final_image_path
     else:
         print("\nPipeline failed at the blending stage.")
+        metrics.increment("stage_failures_total", stage="blending")
         return None
 
-def text_insertion_pipeline(main_image: str, text: str, verify: bool = False, diffusion_model: str = "unicombine", output_dir: str = "output"):
-    """Runs the text insertion pipeline."""
-    print("=== Text Insertion Pipeline ===")
-    
-    # Check model availability
-    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
-        print(f"Error: {diffusion_model} model not available")
-        return None
-    
-    # --- Stage 1: GPT-4 Vision Reasoning ---
-    print("\n--- Stage 1: GPT-4 Vision Reasoning ---")
-    try:
-        vision_response = vision_service.get_text_vision_reasoning(main_image, text, output_dir)
-        print(f"Reference Object Label: {vision_response.reference_object.label}")
-        print(f"Relative Position: {vision_response.target_object.relative_position}")
-        print(f"Inpainting Description: {vision_response.target_object.inpainting_description}")
-    except Exception as e:
-        print(f"Error in Stage 1: {e}")
-        return None
-    print("---------------------------------------------")
-
-    # --- Stage 2: Zero-Shot Object Detection ---
-    print("\n--- Stage 2: Zero-Shot Object Detection ---")
-    reference_box = detection_service.detect_reference_object(
-        main_image, vision_response.reference_object.label
-    )
-    if not reference_box:
-        print(f"Could not detect '{vision_response.reference_object.label}' in the image.")
-        return None
-    print(f"Detected reference box: {reference_box}")
-    print("-----------------------------------------")
-
-    # --- Stage 3: Compute Target Insertion Bounding Box ---
-    print("\n--- Stage 3: Compute Target Bounding Box ---")
-    target_box = composition_service.compute_target_bounding_box(
-        main_image, reference_box, vision_response.target_object.relative_position
-    )
-    print(f"Computed target box: {target_box}")
-    print("------------------------------------------")
-
+def insert_text(main_image: ImageSource, text: str, reference_box, target_box,
+                verify: bool = False, diffusion_model: str = "unicombine", output_dir: str = "output"):
+    """Runs text insertion and optional verification (Stage 4). Returns the final image path or None."""
     # --- Stage 4: Text Insertion ---
     result = text_service.insert_text_with_unicombine(
         main_image,
@@ -133,15 +99,17 @@ def text_insertion_pipeline(main_image: str, text: str, verify: bool = False, di
     
     if result.success:
         print(f"\nText insertion complete. Final image saved at: {result.output_path}")
+        save_checks(output_dir, [VerificationCheck("text", text, target_box)])
         
         # Verification
         if verify:
             print("\n--- Verification ---")
             verification_result = verification_service.verify_insertion_quality(
-                result.output_path, "text", text
+                result.output_path, "text", text, target_box
             )
             print(f"Text detected: {verification_result.text_detected}")
             print(f"Detected text: {verification_result.detected_text}")
+            print(f"Similarity: {verification_result.text_similarity}")
             print(f"Confidence: {verification_result.text_confidence}")
         
         save_bounding_box_visualization(
@@ -154,8 +122,206 @@ def text_insertion_pipeline(main_image: str, text: str, verify: bool = False, di
         return result.output_path
     else:
         print(f"\nText insertion failed: {result.error_message}")
+        metrics.increment("stage_failures_total", stage="blending")
         return None
 
+def plan_insertions(main_image: ImageSource, insertions: List[InsertionSpec], multi_response) -> List[PlannedInsertion]:
+    """Runs one detection pass and the target box computation for all insertions (Stages 2-3)."""
+    # --- Stage 2: Zero-Shot Object Detection ---
+    print("\n--- Stage 2: Zero-Shot Object Detection ---")
+    placements = multi_response.placements
+    detections = detection_service.detect_best_references(
+        main_image, [placement.reference_object.candidate_labels for placement in placements]
+    )
+    located = []
+    for spec, placement, detection in zip(insertions, placements, detections):
+        if not detection:
+            print(f"Skipping '{spec.subject}': could not detect any of {placement.reference_object.candidate_labels}")
+            metrics.increment("stage_failures_total", stage="detection")
+            continue
+        print(f"'{spec.subject}': reference '{detection.label}' (score {detection.score:.2f}) at {detection.box}")
+        located.append((spec, placement, detection))
+    print("-----------------------------------------")
+
+    # --- Stage 3: Compute Target Insertion Bounding Boxes ---
+    print("\n--- Stage 3: Compute Target Bounding Boxes ---")
+    # Each placement avoids all reference objects and the targets chosen before it
+    reference_boxes = [detection.box for _, _, detection in located]
+    placed = []
+    for spec, placement, detection in located:
+        target_boxes = composition_service.find_target_boxes(
+            main_image, detection.box, placement.target_object.relative_position,
+            obstacles=reference_boxes + [box for *_, box in placed],
+        )
+        if not target_boxes:
+            print(f"Skipping '{spec.subject}': no usable target box next to {detection.box}")
+            metrics.increment("stage_failures_total", stage="composition")
+            continue
+        placed.append((spec, placement, detection, target_boxes[0]))
+    resolved_boxes = composition_service.resolve_overlapping_boxes(main_image, [box for *_, box in placed])
+    planned = [
+        PlannedInsertion(spec=spec, vision_response=placement, reference=detection, target_box=target_box)
+        for (spec, placement, detection, _), target_box in zip(placed, resolved_boxes)
+    ]
+    for insertion in planned:
+        print(f"'{insertion.spec.subject}': target box {insertion.target_box}")
+    print("------------------------------------------")
+    return planned
+
+def blend_insertions(main_image: ImageSource, planned: List[PlannedInsertion], verify: bool = False,
+                     diffusion_model: str = "unicombine", output_dir: str = "output"):
+    """Renders all planned insertions in one pass and optionally verifies each (Stage 4). Returns the final image path or None."""
+    # --- Stage 4: Single-pass Blending ---
+    final_image_path = blending_service.blend_insertions(main_image, planned, diffusion_model, output_dir)
+
+    if final_image_path:
+        print(f"\nPipeline complete. Final image saved at: {final_image_path}")
+        save_checks(output_dir, planned_checks(planned))
+
+        # Verification
+        if verify:
+            print("\n--- Verification ---")
+            for insertion in planned:
+                if insertion.spec.kind == "object":
+                    verification_result = verification_service.verify_insertion_quality(
+                        final_image_path, "object", insertion.vision_response.target_object.label,
+                        insertion.target_box
+                    )
+                    print(f"'{insertion.spec.subject}' detected: {verification_result.object_detected} "
+                          f"(confidence {verification_result.object_confidence})")
+                else:
+                    verification_result = verification_service.verify_insertion_quality(
+                        final_image_path, "text", insertion.spec.text, insertion.target_box
+                    )
+                    print(f"'{insertion.spec.subject}' detected: {verification_result.text_detected} "
+                          f"(confidence {verification_result.text_confidence})")
+
+        for index, insertion in enumerate(planned):
+            save_bounding_box_visualization(
+                main_image,
+                insertion.reference.box,
+                insertion.target_box,
+                os.path.join(output_dir, f"insertion_{index}_bounding_boxes_visualization.jpg"),
+            )
+        print("Saved visualizations with reference and target boxes")
+        return final_image_path
+    else:
+        print("\nPipeline failed at the blending stage.")
+        metrics.increment("stage_failures_total", stage="blending")
+        return None
+
+@metrics.track_job("object")
+def object_insertion_pipeline(main_image: str, object_crop: str, verify: bool = False, diffusion_model: str = "unicombine", output_dir: str | None = None):
+    """Runs the object insertion pipeline. Without an output_dir, the job gets its own directory under output/."""
+    print("=== Object Insertion Pipeline ===")
+    output_dir = output_dir or job_output_dir("output", "object", main_image, object_crop=object_crop)
+    os.makedirs(output_dir, exist_ok=True)
+    metrics.set_job_id(output_dir)
+    
+    # Check model availability
+    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
+        print(f"Error: {diffusion_model} model not available")
+        return None
+    
+    # --- Stage 1: GPT-4 Vision Reasoning ---
+    print("\n--- Stage 1: GPT-4 Vision Reasoning ---")
+    try:
+        vision_response = vision_service.get_vision_reasoning(main_image, object_crop, output_dir)
+        print(f"Reference Object Label: {vision_response.reference_object.label}")
+        print(f"Relative Position: {vision_response.target_object.relative_position}")
+        print(f"Inpainting Description: {vision_response.target_object.inpainting_description}")
+    except Exception as e:
+        print(f"Error in Stage 1: {e}")
+        return None
+    print("---------------------------------------------")
+
+    # Decode the main image once for all remaining stages
+    with ImageContext(main_image) as main_context:
+        boxes = detect_and_compose(main_context, vision_response)
+        if not boxes:
+            return None
+        reference_box, target_box = boxes
+
+        return blend_object(
+            main_context, object_crop, vision_response, reference_box, target_box,
+            verify, diffusion_model, output_dir
+        )
+
+@metrics.track_job("text")
+def text_insertion_pipeline(main_image: str, text: str, verify: bool = False, diffusion_model: str = "unicombine", output_dir: str | None = None):
+    """Runs the text insertion pipeline. Without an output_dir, the job gets its own directory under output/."""
+    print("=== Text Insertion Pipeline ===")
+    output_dir = output_dir or job_output_dir("output", "text", main_image, text=text)
+    os.makedirs(output_dir, exist_ok=True)
+    metrics.set_job_id(output_dir)
+    
+    # Check model availability
+    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
+        print(f"Error: {diffusion_model} model not available")
+        return None
+    
+    # --- Stage 1: GPT-4 Vision Reasoning ---
+    print("\n--- Stage 1: GPT-4 Vision Reasoning ---")
+    try:
+        vision_response = vision_service.get_text_vision_reasoning(main_image, text, output_dir)
+        print(f"Reference Object Label: {vision_response.reference_object.label}")
+        print(f"Relative Position: {vision_response.target_object.relative_position}")
+        print(f"Inpainting Description: {vision_response.target_object.inpainting_description}")
+    except Exception as e:
+        print(f"Error in Stage 1: {e}")
+        return None
+    print("---------------------------------------------")
+
+    # Decode the main image once for all remaining stages
+    with ImageContext(main_image) as main_context:
+        boxes = detect_and_compose(main_context, vision_response)
+        if not boxes:
+            return None
+        reference_box, target_box = boxes
+
+        return insert_text(
+            main_context, text, reference_box, target_box,
+            verify, diffusion_model, output_dir
+        )
+
+@metrics.track_job("multi")
+def multi_insertion_pipeline(main_image: str, insertions: List[InsertionSpec], verify: bool = False,
+                             diffusion_model: str = "unicombine", output_dir: str | None = None):
+    """
+    Inserts several objects and texts into one image with one vision request, one detector
+    pass and one render. Without an output_dir, the job gets its own directory under output/.
+    """
+    print(f"=== Multi-Insertion Pipeline ({len(insertions)} insertions) ===")
+    output_dir = output_dir or multi_job_output_dir("output", main_image, insertions)
+    os.makedirs(output_dir, exist_ok=True)
+    metrics.set_job_id(output_dir)
+    
+    # Check model availability
+    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
+        print(f"Error: {diffusion_model} model not available")
+        return None
+    
+    # --- Stage 1: GPT-4 Vision Reasoning ---
+    print("\n--- Stage 1: GPT-4 Vision Reasoning ---")
+    try:
+        multi_response = vision_service.get_multi_vision_reasoning(main_image, insertions, output_dir)
+        for spec, placement in zip(insertions, multi_response.placements):
+            print(f"'{spec.subject}': {placement.target_object.relative_position} of "
+                  f"{placement.reference_object.label} - {placement.target_object.inpainting_description}")
+    except Exception as e:
+        print(f"Error in Stage 1: {e}")
+        return None
+    print("---------------------------------------------")
+
+    # Decode the main image once for all remaining stages
+    with ImageContext(main_image) as main_context:
+        planned = plan_insertions(main_context, insertions, multi_response)
+        if not planned:
+            print("Could not place any of the insertions.")
+            return None
+
+        return blend_insertions(main_context, planned, verify, diffusion_model, output_dir)
+
 def list_models():
     """List available models."""
     models = model_manager.list_available_models()
@@ -172,19 +338,33 @@ def list_models():
 
 def main():
     parser = argparse.ArgumentParser(description="ThinkNBlend: Context-aware object and text insertion pipeline.")
-    parser.add_argument("--mode", choices=["object", "text", "list-models"], required=True, 
-                       help="Insertion mode: object, text, or list-models")
+    parser.add_argument("--mode", choices=["object", "text", "multi", "list-models"], required=True, 
+                       help="Insertion mode: object, text, multi, or list-models")
     parser.add_argument("--main_image", type=str, default="input/main_image.jpg", 
                        help="Path to the main image.")
     parser.add_argument("--object_crop", type=str, default="input/object_crop.jpg", 
                        help="Path to the object crop image (for object mode).")
     parser.add_argument("--text", type=str, help="Text to insert (for text mode).")
+    parser.add_argument("--object_crops", type=str, nargs="+", default=[],
+                       help="Object crop images to insert together (for multi mode).")
+    parser.add_argument("--texts", type=str, nargs="+", default=[],
+                       help="Texts to insert together (for multi mode).")
     parser.add_argument("--verify", action="store_true", 
                        help="Verify insertion quality using object detection/OCR.")
     parser.add_argument("--diffusion_model", type=str, default="unicombine",
                        help="Diffusion model to use for blending.")
     parser.add_argument("--simple_paste", action="store_true",
                        help="Use simple paste instead of diffusion model (no GPU required).")
+    parser.add_argument("--output_dir", type=str, default="output",
+                       help="Base directory; each job writes into its own subdirectory.")
+    parser.add_argument("--no_cache", action="store_true",
+                       help="Bypass the GPT-4 Vision reasoning cache.")
+    parser.add_argument("--clear_cache", action="store_true",
+                       help="Invalidate the GPT-4 Vision reasoning cache before running.")
+    parser.add_argument("--metrics_file", type=str,
+                       help="Write stage timings and counters to this file in the Prometheus text format.")
+    parser.add_argument("--job_metrics_file", type=str,
+                       help="Append a JSON line with the job's per-stage timings and counters to this file.")
     
     args = parser.parse_args()
 
@@ -192,6 +372,11 @@ def main():
         list_models()
         return
 
+    if args.clear_cache:
+        print(f"Cleared {vision_cache.clear()} cached vision reasoning results")
+    vision_cache.set_enabled(not args.no_cache)
+    metrics.set_jobs_file(args.job_metrics_file)
+
     # Input validation
     # Override diffusion model if simple_paste flag is set
     diffusion_model = "simple_paste" if args.simple_paste else args.diffusion_model
@@ -204,7 +389,8 @@ def main():
             print(f"Object crop not found at '{args.object_crop}'. Creating a dummy file.")
             create_dummy_image(args.object_crop, (100, 100), 'blue')
         
-        return object_insertion_pipeline(args.main_image, args.object_crop, args.verify, diffusion_model)
+        output_dir = job_output_dir(args.output_dir, "object", args.main_image, object_crop=args.object_crop)
+        result = object_insertion_pipeline(args.main_image, args.object_crop, args.verify, diffusion_model, output_dir)
     
     elif args.mode == "text":
         if not args.text:
@@ -214,7 +400,29 @@ def main():
             print(f"Main image not found at '{args.main_image}'. Creating a dummy file.")
             create_dummy_image(args.main_image, (800, 600), 'red')
         
-        return text_insertion_pipeline(args.main_image, args.text, args.verify, diffusion_model)
+        output_dir = job_output_dir(args.output_dir, "text", args.main_image, text=args.text)
+        result = text_insertion_pipeline(args.main_image, args.text, args.verify, diffusion_model, output_dir)
+    
+    elif args.mode == "multi":
+        if not args.object_crops and not args.texts:
+            parser.error("--object_crops and/or --texts are required for multi mode")
+        
+        if not os.path.exists(args.main_image):
+            print(f"Main image not found at '{args.main_image}'. Creating a dummy file.")
+            create_dummy_image(args.main_image, (800, 600), 'red')
+        for object_crop in args.object_crops:
+            if not os.path.exists(object_crop):
+                parser.error(f"Object crop not found at '{object_crop}'")
+        
+        insertions = [InsertionSpec("object", object_crop=object_crop) for object_crop in args.object_crops]
+        insertions += [InsertionSpec("text", text=text) for text in args.texts]
+        output_dir = multi_job_output_dir(args.output_dir, args.main_image, insertions)
+        result = multi_insertion_pipeline(args.main_image, insertions, args.verify, diffusion_model, output_dir)
+    
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+    return result
 
 if __name__ == "__main__":
     main()
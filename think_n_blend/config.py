@@ -6,7 +6,7 @@ You are a vision model assistant. You are given:
 Your task is to analyze both images and decide where in the main image the object (from the crop) could be realistically placed.
 
 You must:
-Identify a plausible reference object already present in the main image.
+Identify a plausible reference object already present in the main image, and list up to 3 alternative reference objects ranked best first, in case the first one cannot be found.
 Determine a relative position where the new object could naturally fit. Valid positions are: "top", "bottom", "left", or "right" — relative to the reference object's bounding box.
 Generate a concise, inpainting-style description (like a Stable Diffusion prompt) that clearly describes what the final image should look like after placing the object in context.
 
@@ -15,7 +15,8 @@ Output the result in this exact JSON format:
   "reference_object": {
     "label": "object_label_in_main_image",
     "description": "Short explanation of the reference object and why it's suitable.",
-    "position_role": "reference"
+    "position_role": "reference",
+    "alternative_labels": ["second_choice_label", "third_choice_label"]
   },
   "target_object": {
     "label": "object_label_from_crop",
@@ -33,7 +34,7 @@ GPT4_TEXT_VISION_PROMPT = """You are a vision model assistant. You are given:
 Your task is to analyze the main image and decide where the text could be realistically placed.
 
 You must:
-1. Identify a plausible reference object already present in the main image.
+1. Identify a plausible reference object already present in the main image, and list up to 3 alternative reference objects ranked best first, in case the first one cannot be found.
 2. Determine a relative position where the text could naturally fit.
    Valid positions are: "top", "bottom", "left", or "right" — relative to the reference object's bounding box.
 3. Generate a concise, inpainting-style description that clearly describes what the final image should look like after placing the text in context.
@@ -43,7 +44,8 @@ Output the result in this exact JSON format:
   "reference_object": {{
     "label": "object_label_in_main_image",
     "description": "Short explanation of the reference object and why it's suitable.",
-    "position_role": "reference"
+    "position_role": "reference",
+    "alternative_labels": ["second_choice_label", "third_choice_label"]
   }},
   "target_object": {{
     "label": "text_label",
@@ -56,12 +58,68 @@ Output the result in this exact JSON format:
 The text to insert is: "{text}"
 """
 
+GPT4_MULTI_VISION_PROMPT = """You are a vision model assistant. You are given:
+- A main image showing a real-world scene (the first image).
+- Several items that all need to be inserted into that same image. Object items are shown as the following cropped images, in order.
+
+Your task is to decide where each item could be realistically placed, so that all of them fit in the final image together without covering each other.
+
+For each item, in the order listed, you must:
+1. Identify a plausible reference object already present in the main image, and list up to 3 alternative reference objects ranked best first, in case the first one cannot be found. Prefer different reference objects, or different sides of the same one, for different items.
+2. Determine a relative position where the item could naturally fit.
+   Valid positions are: "top", "bottom", "left", or "right" — relative to the reference object's bounding box.
+3. Generate a concise, inpainting-style description that clearly describes what the item should look like after placement.
+
+Output the result in this exact JSON format, with exactly one placement per item:
+{{
+  "placements": [
+    {{
+      "reference_object": {{
+        "label": "object_label_in_main_image",
+        "description": "Short explanation of the reference object and why it's suitable.",
+        "position_role": "reference",
+        "alternative_labels": ["second_choice_label", "third_choice_label"]
+      }},
+      "target_object": {{
+        "label": "item_label",
+        "description": "Short explanation of what the item is and why it's placed here.",
+        "relative_position": "top",
+        "inpainting_description": "Short, high-quality prompt describing the item after placement for an inpainting model"
+      }}
+    }}
+  ]
+}}
+
+The items to insert are:
+{insertions}
+"""
+
 GPT4_VISION_MODEL = "gpt-4o"
+VISION_STRUCTURED_OUTPUT = True  # Constrain replies with a JSON schema derived from schemas.py
+VISION_MAX_REPAIR_ATTEMPTS = 2  # Follow-up requests asking only for missing or invalid fields
+
+# Vision upload preprocessing: images are downscaled and re-encoded before being sent to the API
+VISION_MAX_IMAGE_SIDE = 1536  # Longest side in pixels; larger images are downscaled
+VISION_IMAGE_FORMAT = "JPEG"  # "JPEG" or "WEBP"
+VISION_IMAGE_QUALITY = 85
 OBJECT_DETECTION_MODEL = "google/owlv2-base-patch16-ensemble"
 
 # Submodule paths
 SUBMODULES_DIR = "submodules"
 UNICOMBINE_PATH = f"{SUBMODULES_DIR}/UniCombine"
+UNICOMBINE_STARTUP_TIMEOUT_S = 1800  # Seconds the persistent worker may take to load its weights
+UNICOMBINE_JOB_TIMEOUT_S = 900  # Seconds one inference job may take before the worker is killed and restarted
+# Classes whose from_pretrained (and load_lora_weights) results the persistent UniCombine worker
+# keeps resident between jobs; only these are patched, and only inside the worker process
+UNICOMBINE_CACHED_CLASSES = [
+    "diffusers.FluxPipeline",
+    "diffusers.FluxTransformer2DModel",
+    "diffusers.AutoencoderKL",
+    "transformers.CLIPTextModel",
+    "transformers.T5EncoderModel",
+    "transformers.CLIPTokenizer",
+    "transformers.T5TokenizerFast",
+]
 
 # Model configurations
 DIFFUSION_MODELS = {
@@ -80,24 +138,135 @@ DIFFUSION_MODELS = {
 }
 
 OBJECT_DETECTION_MODELS = {
+    "owlvit": {
+        "model": "google/owlvit-base-patch32",
+        "task": "zero-shot-object-detection",
+        "backend": "pytorch",
+        "description": "OWL-ViT (768px, 32px patches), about 6x fewer patches than OWLv2"
+    },
     "owlv2": {
         "model": "google/owlv2-base-patch16-ensemble",
         "task": "zero-shot-object-detection",
+        "backend": "pytorch",
         "description": "OWLv2 for zero-shot object detection"
+    },
+    "owlv2-onnx": {
+        "model": "google/owlv2-base-patch16-ensemble",
+        "task": "zero-shot-object-detection",
+        "backend": "onnxruntime",
+        "onnx_dir": "models/onnx/owlv2",
+        "description": "OWLv2 on ONNX Runtime for CPU-only hosts (falls back to PyTorch until exported)"
+    },
+    "owlv2-onnx-int8": {
+        "model": "google/owlv2-base-patch16-ensemble",
+        "task": "zero-shot-object-detection",
+        "backend": "onnxruntime",
+        "onnx_dir": "models/onnx/owlv2-int8",
+        "description": "OWLv2 on ONNX Runtime with int8 dynamic quantization (falls back to PyTorch until exported)"
+    },
+    "owlvit-owlv2-cascade": {
+        "cascade": ["owlvit", "owlv2"],  # Tiers tried cheapest first
+        "escalation_score": 0.3,  # A tier whose best reference scores below this hands over to the next
+        "description": "OWL-ViT first, escalating to OWLv2 only when OWL-ViT is unsure"
+    }
+}
+
+OCR_MODELS = {
+    "easyocr": {
+        "languages": ["en"],
+        "description": "EasyOCR for text verification"
     }
 }
 
+# Object detection configurations
+DETECTION_SCORE_THRESHOLD = 0.1
+REFERENCE_MIN_SCORE = 0.1  # Reference candidates scoring below this are not used for placement
+DETECTION_EMBEDDING_CACHE_SIZE = 32  # Images whose detector embeddings are kept for further label queries
+DETECTION_TEXT_EMBEDDING_CACHE_SIZE = 1024  # Label embeddings kept; labels are free text, so this is bounded too
+DETECTION_ONNX_INTRA_OP_THREADS = 0  # ONNX Runtime threads per detector call; 0 uses every physical core
+DETECTION_ONNX_OPSET = 17  # ONNX opset used when exporting detectors
+
+# Verification configurations
+VERIFICATION_REGION_OF_INTEREST = True  # Verify only the target box plus a margin instead of the whole image
+VERIFICATION_ROI_MARGIN = 0.25  # Margin around the target box, as a fraction of its longer side
+VERIFICATION_OBJECT_MIN_SCORE = 0.5  # Detector score above which the inserted object counts as present
+VERIFICATION_TEXT_MIN_SIMILARITY = 0.8  # Fuzzy similarity at which the inserted text counts as present
+DEFAULT_VERIFICATION_WORKERS = 1  # Threads verifying finished batch outputs beside the pipeline
+DEFAULT_VERIFICATION_BATCH_SIZE = 4  # Finished outputs a verification worker takes per pass
+VERIFICATION_CHECKS_FILE = "verification_checks.json"  # What to verify, saved in each job directory
+
+# Placement search configurations
+PLACEMENT_SCALES = [1.0, 0.75, 0.5]  # Candidate target sizes relative to the reference box
+PLACEMENT_OFFSETS = [0.0, -0.25, 0.25, -0.5, 0.5]  # Shifts along the reference side, as fractions of its length
+PLACEMENT_MIN_SIDE_PX = 16  # Candidates narrower or shorter than this once clipped to the image are dropped
+PLACEMENT_ALTERNATIVES = 3  # Ranked alternatives returned besides the best box
+PLACEMENT_EDGE_MAP_SIDE = 256  # Longest side of the downscaled edge map used for clutter scoring
+PLACEMENT_EDGE_CACHE_SIZE = 8  # Edge maps kept for the most recently placed-into images
+PLACEMENT_WEIGHTS = {
+    "side": 1.0,  # Not on the side the vision model asked for
+    "clipped": 2.0,  # Fraction of the box falling outside the image
+    "overlap": 2.0,  # Fraction of the box covering detected objects
+    "edges": 0.5,  # Edge density relative to the whole image
+    "scale": 0.3,  # Shrinking relative to the reference box
+    "offset": 0.2,  # Shift away from the reference box's center line
+}
+
 # Default model selections
 DEFAULT_DIFFUSION_MODEL = "unicombine"
 DEFAULT_OBJECT_DETECTION_MODEL = "owlv2"
+DEFAULT_OCR_MODEL = "easyocr"
+
+# Model registry configurations
+MODEL_MEMORY_BUDGET_MB = 8192  # Least-recently-used models are evicted above this budget
 
 # Processing configurations
 DEFAULT_BATCH_SIZE = 1
 DEFAULT_VERIFY_INSERTIONS = True
 DEFAULT_SAVE_INTERMEDIATE_RESULTS = False
 SKIP_DIFFUSION_MODEL = False  # Flag to skip diffusion model and use simple pasting
+SIMPLE_PASTE_FEATHER_PX = 2  # Width of the soft edge blended around pasted objects
+SIMPLE_PASTE_COLOR_MATCH = 0.0  # 0..1 strength of matching pasted object colors to the scene
+MULTI_INSERTION_SUBJECT_BACKGROUND = "black"  # Background of the combined subject image for one-pass diffusion
+
+# Text rendering configurations
+FONT_DIRS = ["/usr/share/fonts", "/usr/local/share/fonts", "~/.local/share/fonts", "~/.fonts"]
+FONT_FACES = ["DejaVuSans-Bold", "LiberationSans-Bold", "DejaVuSans", "LiberationSans-Regular", "Arial"]  # Preferred font file names, best first
+FONT_CACHE_SIZE = 256  # Loaded (face, size) fonts kept in memory
+TEXT_MIN_FONT_SIZE = 8
+TEXT_MAX_FONT_SIZE = 400
+TEXT_FIT_MARGIN = 0.9  # Fraction of the target box auto-fitted text may fill
+
+# Concurrent batch configurations
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 8  # Concurrent GPT-4 Vision requests
+DEFAULT_DETECTION_WORKERS = 1
+DEFAULT_BLENDING_WORKERS = 1
+DEFAULT_STAGE_QUEUE_SIZE = 16  # Jobs buffered between stages before upstream stages wait
+BATCH_JOURNAL_FILE = "batch_journal.jsonl"  # Append-only record of finished jobs in the batch output directory
+DEFAULT_PASTE_WORKERS = 0  # Processes rendering simple-paste jobs; 0 renders them in the blending threads
+PASTE_WORKER_ATTACHED_IMAGES = 4  # Shared main images each paste worker keeps mapped
+
+# Vision reasoning cache configurations
+VISION_CACHE_ENABLED = True
+VISION_CACHE_DIR = ".cache/vision_reasoning"
+VISION_CACHE_MAX_SIZE_MB = 256  # Least-recently-used entries are evicted above this size
 
 # Output configurations
 DEFAULT_OUTPUT_FORMAT = "jpg"
 DEFAULT_COMPRESSION_QUALITY = 95
 
+
+# Metrics configurations
+METRICS_PREFIX = "thinknblend"  # Prefix of every exported Prometheus metric name
+METRICS_DURATION_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]  # Stage duration histogram bounds in seconds
+METRICS_FILE = "metrics.prom"  # Prometheus text snapshot written to the batch output directory
+METRICS_JOBS_FILE = "metrics_jobs.jsonl"  # Per-job timing records written to the batch output directory
+
+# HTTP inference service configurations
+SERVICE_HOST = "0.0.0.0"
+SERVICE_PORT = 8000
+SERVICE_WORKERS = 2  # Jobs processed at the same time; models are shared between them
+SERVICE_MAX_QUEUED_JOBS = 64  # Submissions beyond this are rejected with 503 until the queue drains
+SERVICE_MAX_FINISHED_JOBS = 1000  # Finished jobs kept for status queries; older jobs and their directories are deleted
+SERVICE_MAX_REQUEST_MB = 32  # Largest accepted request body (inline images are base64 data URLs)
+SERVICE_OUTPUT_DIR = "output/service"  # Each job writes into <dir>/<job id>
+SERVICE_INPUT_DIRS = ["input"]  # Server-side image paths must lie under one of these directories
@@ -0,0 +1,153 @@
+"""
+Exports an OWL-ViT/OWLv2 detector to ONNX for CPU inference with ONNX Runtime.
+
+The model is split the way detection_service uses it: an image encoder (patch features
+and boxes), a text encoder (query embeddings) and the class head that scores one
+against the other, so image and label embeddings stay cacheable:
+
+    python -m think_n_blend.export_detector --model owlv2-onnx
+    python -m think_n_blend.export_detector --model owlv2-onnx-int8 --quantize
+
+Each graph is optimized offline; with --quantize, the encoders' weights are
+dynamically quantized to int8. Needs torch, transformers and onnxruntime.
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+from think_n_blend.config import DETECTION_ONNX_OPSET
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.onnx_detector import (
+    IMAGE_ENCODER_FILE, TEXT_ENCODER_FILE, CLASS_HEAD_FILE, EXPORT_INFO_FILE
+)
+
+def _export_graphs(model, image_size: int, work_dir: str, opset: int):
+    """Traces the three heads of an OWL model to fp32 ONNX graphs in work_dir."""
+    import torch
+
+    class ImageEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            feature_map = self.model.image_embedder(pixel_values=pixel_values)[0]
+            batch_size, height, width, depth = feature_map.shape
+            image_feats = feature_map.reshape(batch_size, height * width, depth)
+            return image_feats, self.model.box_predictor(image_feats, feature_map)
+
+    class TextEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.text_model = getattr(model, "owlv2", None) or getattr(model, "owlvit")
+
+        def forward(self, input_ids, attention_mask):
+            return self.text_model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    class ClassHead(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image_feats, query_embeds, query_mask):
+            return self.model.class_predictor(image_feats, query_embeds, query_mask)[0]
+
+    pixel_values = torch.zeros(1, 3, image_size, image_size)
+    with torch.no_grad():
+        image_feats, _ = ImageEncoder()(pixel_values)
+        input_ids = torch.ones(1, 16, dtype=torch.long)
+        query_embeds = TextEncoder()(input_ids, torch.ones_like(input_ids)).unsqueeze(0)
+
+    graphs = [
+        (ImageEncoder(), (pixel_values,), IMAGE_ENCODER_FILE,
+         ["pixel_values"], ["image_feats", "pred_boxes"], {}),
+        (TextEncoder(), (input_ids, torch.ones_like(input_ids)), TEXT_ENCODER_FILE,
+         ["input_ids", "attention_mask"], ["text_embeds"],
+         {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}),
+        (ClassHead(), (image_feats, query_embeds, torch.ones(query_embeds.shape[:2], dtype=torch.bool)), CLASS_HEAD_FILE,
+         ["image_feats", "query_embeds", "query_mask"], ["logits"],
+         {"query_embeds": {1: "labels"}, "query_mask": {1: "labels"}, "logits": {2: "labels"}}),
+    ]
+    for module, args, file_name, input_names, output_names, dynamic_axes in graphs:
+        print(f"Exporting {file_name}...")
+        with torch.no_grad():
+            torch.onnx.export(
+                module.eval(), args, os.path.join(work_dir, file_name),
+                input_names=input_names, output_names=output_names,
+                dynamic_axes=dynamic_axes, opset_version=opset,
+            )
+
+def _optimize(source: str, destination: str):
+    """Applies ONNX Runtime's portable graph optimizations (fusions, constant folding) offline."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    # Extended rather than all: the saved graph must not depend on this machine's hardware
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = destination
+    ort.InferenceSession(source, options, providers=["CPUExecutionProvider"])
+
+def _quantize(source: str, destination: str, work_dir: str):
+    """Dynamically quantizes a graph's weights to int8; activations are quantized at run time."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared = os.path.join(work_dir, "prepared_" + os.path.basename(source))
+    quant_pre_process(source, prepared)
+    quantize_dynamic(prepared, destination, weight_type=QuantType.QInt8)
+
+def export_detector(model_name: str, output_dir: str, quantize: bool = False, opset: int = DETECTION_ONNX_OPSET) -> str:
+    """Exports the detector model_name is configured with into output_dir and returns it."""
+    from transformers import AutoModelForZeroShotObjectDetection, AutoProcessor
+
+    config = model_manager.get_object_detection_model_config(model_name)
+    print(f"Loading {config['model']}...")
+    model = AutoModelForZeroShotObjectDetection.from_pretrained(config["model"]).eval()
+    processor = AutoProcessor.from_pretrained(config["model"])
+    image_size = model.config.vision_config.image_size
+
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="thinknblend_onnx_")
+    try:
+        _export_graphs(model, image_size, work_dir, opset)
+        for file_name in (IMAGE_ENCODER_FILE, TEXT_ENCODER_FILE, CLASS_HEAD_FILE):
+            source = os.path.join(work_dir, file_name)
+            destination = os.path.join(output_dir, file_name)
+            # The class head has no weights worth quantizing and decides every score, so it stays fp32
+            if quantize and file_name != CLASS_HEAD_FILE:
+                print(f"Quantizing {file_name} to int8...")
+                _quantize(source, destination, work_dir)
+            else:
+                print(f"Optimizing {file_name}...")
+                _optimize(source, destination)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    processor.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, EXPORT_INFO_FILE), "w") as f:
+        json.dump({"model": config["model"], "model_type": model.config.model_type, "quantized": quantize,
+                   "opset": opset, "image_size": image_size}, f, indent=2)
+    print(f"Exported {config['model']} to {output_dir}")
+    return output_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an OWL detector to ONNX Runtime")
+    parser.add_argument("--model", type=str, default="owlv2-onnx",
+                       help="Object detection model to export; its onnx_dir is the default destination")
+    parser.add_argument("--output_dir", type=str,
+                       help="Export directory (defaults to the model's onnx_dir)")
+    parser.add_argument("--quantize", action="store_true",
+                       help="Dynamically quantize the image and text encoders to int8")
+    parser.add_argument("--opset", type=int, default=DETECTION_ONNX_OPSET,
+                       help="ONNX opset version")
+    args = parser.parse_args()
+
+    config = model_manager.get_object_detection_model_config(args.model)
+    output_dir = args.output_dir or config.get("onnx_dir")
+    if not output_dir:
+        parser.error(f"'{args.model}' has no onnx_dir; pass --output_dir")
+    export_detector(args.model, output_dir, args.quantize, args.opset)
+
+if __name__ == "__main__":
+    main()
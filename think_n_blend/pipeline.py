@@ -0,0 +1,235 @@
+"""
+In-process pipeline sessions.
+
+A Pipeline owns the OpenAI client, the detector, the OCR reader and the diffusion worker
+for its lifetime, takes images as paths, encoded bytes, PIL images or NumPy arrays, and
+returns the final image, boxes, reasoning and stage timings in memory:
+
+    with Pipeline(diffusion_model="simple_paste") as pipeline:
+        result = pipeline.insert_object(scene_bytes, crop_image)
+        if result.success:
+            result.image.save("scene_with_object.jpg")
+
+Nothing is written to disk unless the pipeline has an output_dir. The one exception is
+diffusion blending, whose inference script reads its inputs from files; those go to a
+temporary directory that is removed after the job.
+"""
+import os
+import uuid
+import shutil
+import tempfile
+import threading
+from contextlib import nullcontext
+from typing import List, Optional
+from PIL import Image
+from think_n_blend.cli import plan_insertions
+from think_n_blend.schemas import InsertionSpec, PipelineResult, PlannedInsertion
+from think_n_blend.services import (
+    vision_service, detection_service, composition_service,
+    blending_service, text_service, verification_service
+)
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.utils.image_utils import ImageContext, ImageSource, as_image_context
+from think_n_blend.utils.metrics import metrics
+
+class PipelineError(Exception):
+    """A stage that could not produce its result; carries the stage name."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+class Pipeline:
+    """
+    Reusable insertion session. Safe to share between threads; models and the diffusion
+    worker are loaded once, on warm_up() or on first use.
+    """
+
+    def __init__(self, diffusion_model: str = "unicombine", verify: bool = False,
+                 output_dir: Optional[str] = None, api_key: Optional[str] = None):
+        """
+        Without an output_dir nothing is kept on disk; with one, every job saves its
+        vision responses and final image under <output_dir>/<job id>.
+        """
+        self.diffusion_model = diffusion_model
+        self.verify = verify
+        self.output_dir = output_dir
+        self._api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The session's OpenAI client, created on first use."""
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self._api_key)
+            return self._client
+
+    def warm_up(self) -> "Pipeline":
+        """Loads the detector (and OCR reader if verifying) and starts the diffusion worker now."""
+        if not model_manager.check_model_availability(self.diffusion_model, "diffusion"):
+            raise RuntimeError(f"{self.diffusion_model} model not available")
+        self.client  # Creates the OpenAI client
+        model_manager.get_object_detector()
+        if self.verify:
+            model_manager.get_ocr_reader()
+        worker = model_manager.get_inference_client(self.diffusion_model)
+        if worker is not None:
+            worker.start()
+        return self
+
+    def insert_object(self, main_image: ImageSource, object_crop: ImageSource,
+                      verify: Optional[bool] = None) -> PipelineResult:
+        """Places and blends one object crop into the main image."""
+        return self._run("object", main_image, [InsertionSpec("object", object_crop=object_crop)], verify)
+
+    def insert_text(self, main_image: ImageSource, text: str, verify: Optional[bool] = None) -> PipelineResult:
+        """Places and renders one text into the main image."""
+        return self._run("text", main_image, [InsertionSpec("text", text=text)], verify)
+
+    def insert_many(self, main_image: ImageSource, insertions: List[InsertionSpec],
+                    verify: Optional[bool] = None) -> PipelineResult:
+        """Places several objects and texts with one vision request and renders them in one pass."""
+        return self._run("multi", main_image, insertions, verify)
+
+    def close(self):
+        """Closes the OpenAI client and stops the diffusion worker."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+        model_manager.shutdown_inference_workers()
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self, mode: str, main_image: ImageSource, insertions: List[InsertionSpec],
+             verify: Optional[bool]) -> PipelineResult:
+        verify = self.verify if verify is None else verify
+        record = metrics.start_job(uuid.uuid4().hex, mode)
+        job_dir = os.path.join(self.output_dir, record.job_id) if self.output_dir else None
+        result = PipelineResult(success=False)
+
+        # Decode and hash every image once for all stages; contexts the caller passed in stay theirs
+        owned = not isinstance(main_image, ImageContext)
+        insertions = [
+            InsertionSpec("object", object_crop=as_image_context(spec.object_crop)) if spec.kind == "object" else spec
+            for spec in insertions
+        ]
+        with metrics.job_context(record), (as_image_context(main_image) if owned else nullcontext(main_image)) as context:
+            try:
+                if not model_manager.check_model_availability(self.diffusion_model, "diffusion"):
+                    raise PipelineError("blending", f"{self.diffusion_model} model not available")
+                self._run_stages(mode, context, insertions, verify, job_dir, result)
+                result.success = True
+            except PipelineError as e:
+                result.failed_stage, result.error = e.stage, str(e)
+                metrics.increment("stage_failures_total", stage=e.stage)
+            except Exception as e:
+                result.error = str(e)
+
+        metrics.finish_job(record, result.success, result.output_path, result.error)
+        result.timings = dict(record.stages)
+        result.duration_s = record.duration_s
+        return result
+
+    def _run_stages(self, mode: str, context: ImageContext, insertions: List[InsertionSpec], verify: bool,
+                    job_dir: Optional[str], result: PipelineResult):
+        # --- Stage 1: GPT-4 Vision Reasoning ---
+        try:
+            if mode == "object":
+                result.reasoning = vision_service.get_vision_reasoning(
+                    context, insertions[0].object_crop, job_dir, self.client
+                )
+            elif mode == "text":
+                result.reasoning = vision_service.get_text_vision_reasoning(
+                    context, insertions[0].text, job_dir, self.client
+                )
+            else:
+                result.reasoning = vision_service.get_multi_vision_reasoning(context, insertions, job_dir, self.client)
+        except Exception as e:
+            raise PipelineError("reasoning", str(e)) from e
+
+        # --- Stages 2-3: Detection and Target Boxes ---
+        if mode == "multi":
+            result.insertions = plan_insertions(context, insertions, result.reasoning)
+            if not result.insertions:
+                raise PipelineError("composition", "Could not place any of the insertions")
+        else:
+            result.insertions = [self._plan_single(context, insertions[0], result.reasoning)]
+
+        # --- Stage 4: Blending ---
+        result.image, result.output_path = self._blend(mode, context, result.insertions, job_dir)
+
+        # --- Verification ---
+        if verify:
+            final = ImageContext.from_image(result.output_path, result.image)
+            result.verification = [
+                verification_service.verify_insertion_quality(
+                    final, insertion.spec.kind,
+                    insertion.vision_response.target_object.label if insertion.spec.kind == "object"
+                    else insertion.spec.text,
+                    insertion.target_box,
+                )
+                for insertion in result.insertions
+            ]
+
+    def _plan_single(self, context: ImageContext, spec: InsertionSpec, vision_response) -> PlannedInsertion:
+        """Finds the reference and the best target box for a single insertion."""
+        candidate_labels = vision_response.reference_object.candidate_labels
+        detection = detection_service.detect_best_reference(context, candidate_labels)
+        if not detection:
+            raise PipelineError("detection", f"Could not detect any of {candidate_labels} in the image")
+        target_boxes = composition_service.find_target_boxes(
+            context, detection.box, vision_response.target_object.relative_position
+        )
+        if not target_boxes:
+            raise PipelineError("composition", f"No usable target box next to the reference box {detection.box}")
+        return PlannedInsertion(spec=spec, vision_response=vision_response, reference=detection,
+                                target_box=target_boxes[0])
+
+    def _blend(self, mode: str, context: ImageContext, planned: List[PlannedInsertion],
+               job_dir: Optional[str]):
+        """Renders the insertions; returns the final image and, with a job directory, its path."""
+        if model_manager.is_simple_paste_model(self.diffusion_model):
+            image = blending_service.render_insertions(context, planned)
+            if image is None:
+                raise PipelineError("blending", "No insertion has a usable target box")
+            output_path = None
+            if job_dir:
+                os.makedirs(job_dir, exist_ok=True)
+                output_path = os.path.join(job_dir, "final_image.jpg")
+                image.save(output_path, quality=95)
+            return image, output_path
+
+        # The diffusion worker reads and writes files, in a temporary directory unless the job keeps them
+        work_dir = job_dir or tempfile.mkdtemp(prefix="thinknblend_")
+        try:
+            insertion = planned[0]
+            if mode == "object":
+                output_path = blending_service.blend_object_with_unicombine(
+                    context, insertion.spec.object_crop, insertion.vision_response.target_object.inpainting_description,
+                    insertion.target_box, self.diffusion_model, work_dir
+                )
+            elif mode == "text":
+                text_result = text_service.insert_text_with_unicombine(
+                    context, insertion.spec.text, insertion.target_box, self.diffusion_model, work_dir
+                )
+                output_path = text_result.output_path if text_result.success else None
+            else:
+                output_path = blending_service.blend_insertions(context, planned, self.diffusion_model, work_dir)
+            if not output_path:
+                raise PipelineError("blending", f"{self.diffusion_model} produced no image")
+
+            with Image.open(output_path) as image:
+                image.load()
+                final_image = image.convert('RGB')
+            return final_image, output_path if job_dir else None
+        finally:
+            if not job_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
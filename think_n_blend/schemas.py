@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Literal, Tuple, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, Literal, Tuple, Optional, List
 
 RelativePosition = Literal["top", "bottom", "left", "right"]
 BoundingBox = Tuple[int, int, int, int]
@@ -9,6 +9,12 @@ class ReferenceObject:
     label: str
     description: str
     position_role: str = "reference"
+    alternative_labels: List[str] = field(default_factory=list)  # Fallback references, ranked best first
+
+    @property
+    def candidate_labels(self) -> List[str]:
+        """The chosen label followed by the alternatives, without duplicates."""
+        return list(dict.fromkeys([self.label] + self.alternative_labels))
 
 @dataclass
 class TargetObject:
@@ -17,6 +23,14 @@ class TargetObject:
     relative_position: RelativePosition
     inpainting_description: str
 
+@dataclass
+class ReferenceDetection:
+    label: str
+    box: BoundingBox
+    score: float
+    rank: int  # Position of the label among the vision model's candidates
+    model: Optional[str] = None  # Detection model, or cascade tier, that found it
+
 @dataclass
 class TextInsertion:
     text: str
@@ -31,6 +45,45 @@ class Gpt4VisionResponse:
     reference_object: ReferenceObject
     target_object: TargetObject
 
+@dataclass
+class InsertionSpec:
+    kind: Literal["object", "text"]
+    object_crop: Optional[Any] = None  # Object crop path, or any in-memory image source (object insertions)
+    text: Optional[str] = None  # Text to insert (text insertions)
+
+    @property
+    def subject(self) -> str:
+        """The object crop or the text, whichever this insertion carries."""
+        return self.object_crop if self.kind == "object" else self.text
+
+@dataclass
+class MultiInsertionResponse:
+    placements: List[Gpt4VisionResponse]  # One per insertion, in request order
+
+@dataclass
+class PlannedInsertion:
+    spec: InsertionSpec
+    vision_response: Gpt4VisionResponse
+    reference: ReferenceDetection
+    target_box: BoundingBox
+
+@dataclass
+class EncodedImage:
+    data: str  # base64-encoded image bytes
+    mime_type: str
+    original_size: Tuple[int, int]
+    encoded_size: Tuple[int, int]
+    num_bytes: int
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data}"
+
+    @property
+    def scale(self) -> float:
+        """Factor mapping encoded-image coordinates back to the original resolution."""
+        return self.original_size[0] / self.encoded_size[0]
+
 @dataclass
 class InsertionResult:
     success: bool
@@ -47,4 +100,39 @@ class VerificationResult:
     text_confidence: Optional[float] = None
     detected_text: Optional[str] = None
     detected_objects: Optional[list] = None
+    error_message: Optional[str] = None
+    text_similarity: Optional[float] = None  # Fuzzy match of the expected text against the detected text
+
+    @property
+    def passed(self) -> bool:
+        """True if the expected object or text was found."""
+        return self.object_detected or self.text_detected
+
+@dataclass
+class VerificationCheck:
+    kind: Literal["object", "text"]
+    expected: str  # Object label or text that should be found
+    target_box: Optional[BoundingBox] = None  # Where it was inserted; None checks the whole image
+
+@dataclass
+class PipelineResult:
+    success: bool
+    image: Optional[Any] = None  # Final PIL image
+    reasoning: Optional[Any] = None  # Gpt4VisionResponse, or MultiInsertionResponse for multi-insertion
+    insertions: List[PlannedInsertion] = field(default_factory=list)  # Placed insertions with their boxes
+    verification: List[VerificationResult] = field(default_factory=list)  # One per insertion when verifying
+    timings: Dict[str, float] = field(default_factory=dict)  # Seconds per stage
+    duration_s: float = 0.0
+    output_path: Optional[str] = None  # Saved final image, only when the pipeline has an output_dir
+    failed_stage: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def reference_box(self) -> Optional[BoundingBox]:
+        """Reference box of the first insertion."""
+        return self.insertions[0].reference.box if self.insertions else None
 
+    @property
+    def target_box(self) -> Optional[BoundingBox]:
+        """Target box of the first insertion."""
+        return self.insertions[0].target_box if self.insertions else None
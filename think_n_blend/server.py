@@ -0,0 +1,424 @@
+"""
+HTTP inference service.
+
+Keeps the detector, OCR reader and diffusion worker warm in one process and runs
+insertion jobs from a bounded queue:
+
+    POST /jobs                 submit an object, text or multi insertion job
+    GET  /jobs/<id>            job status
+    GET  /jobs/<id>/result     the final image once the job succeeded
+    GET  /healthz              liveness, with queue statistics
+    GET  /readyz               200 once the models are warm
+    GET  /metrics              Prometheus metrics
+"""
+import os
+import json
+import uuid
+import time
+import queue
+import base64
+import shutil
+import signal
+import argparse
+import binascii
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from think_n_blend.cli import object_insertion_pipeline, text_insertion_pipeline, multi_insertion_pipeline
+from think_n_blend.config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS, SERVICE_MAX_QUEUED_JOBS, SERVICE_MAX_FINISHED_JOBS,
+    SERVICE_MAX_REQUEST_MB, SERVICE_OUTPUT_DIR, SERVICE_INPUT_DIRS, METRICS_JOBS_FILE
+)
+from think_n_blend.schemas import InsertionSpec
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.utils.metrics import metrics
+
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+@dataclass
+class ServiceJob:
+    job_id: str
+    mode: str
+    request: Dict[str, Any]
+    output_dir: str
+    status: str = "queued"  # queued, running, succeeded or failed
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "mode": self.mode,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "result_url": f"/jobs/{self.job_id}/result" if self.status == "succeeded" else None,
+        }
+
+class JobRejected(Exception):
+    """A submission that cannot be accepted; carries the HTTP status to answer with."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _resolve_image(value: Any, inputs_dir: str, name: str, input_dirs: List[str]) -> str:
+    """
+    Turns an image field into a local path: data URLs are decoded into the job's inputs
+    directory, plain paths must point at an existing file under one of input_dirs.
+    """
+    if not isinstance(value, str) or not value:
+        raise JobRejected(400, f"'{name}' must be an image path or a data URL")
+
+    if value.startswith("data:"):
+        header, _, data = value.partition(",")
+        mime_type = header[len("data:"):].split(";")[0]
+        if mime_type not in IMAGE_EXTENSIONS or ";base64" not in header:
+            raise JobRejected(400, f"'{name}' must be a base64 JPEG, PNG or WebP data URL")
+        try:
+            image_bytes = base64.b64decode(data, validate=True)
+        except binascii.Error:
+            raise JobRejected(400, f"'{name}' is not valid base64")
+        os.makedirs(inputs_dir, exist_ok=True)
+        path = os.path.join(inputs_dir, f"{name}{IMAGE_EXTENSIONS[mime_type]}")
+        with open(path, 'wb') as f:
+            f.write(image_bytes)
+        return path
+
+    path = os.path.realpath(value)
+    allowed = [os.path.realpath(input_dir) for input_dir in input_dirs]
+    if not any(os.path.commonpath([path, input_dir]) == input_dir for input_dir in allowed):
+        raise JobRejected(403, f"'{name}' must lie under one of {input_dirs}")
+    if not os.path.isfile(path):
+        raise JobRejected(400, f"'{name}' not found: {value}")
+    return path
+
+class InsertionService:
+    """Owns the job queue, the worker threads and the job table behind the HTTP handler."""
+
+    def __init__(self, workers: int = SERVICE_WORKERS, max_queued: int = SERVICE_MAX_QUEUED_JOBS,
+                 diffusion_model: str = "unicombine", output_dir: str = SERVICE_OUTPUT_DIR,
+                 input_dirs: List[str] = SERVICE_INPUT_DIRS, warm_ocr: bool = False):
+        self.workers = workers
+        self.diffusion_model = diffusion_model
+        self.output_dir = output_dir
+        self.input_dirs = input_dirs
+        self.warm_ocr = warm_ocr
+        self.ready = threading.Event()
+        self.warmup_error: Optional[str] = None
+        self.started_at = time.time()
+
+        self._queue: "queue.Queue[Optional[ServiceJob]]" = queue.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, ServiceJob]" = OrderedDict()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+        os.makedirs(output_dir, exist_ok=True)
+        metrics.set_jobs_file(os.path.join(output_dir, METRICS_JOBS_FILE))
+
+    def start(self):
+        """Starts warming the models and the worker threads."""
+        threading.Thread(target=self._warm_up, name="warm-up", daemon=True).start()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Lets the workers finish their current job, then stops the inference workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        model_manager.shutdown_inference_workers()
+
+    def _warm_up(self):
+        try:
+            if not model_manager.check_model_availability(self.diffusion_model, "diffusion"):
+                raise RuntimeError(f"{self.diffusion_model} model not available")
+            model_manager.get_object_detector()
+            if self.warm_ocr:
+                model_manager.get_ocr_reader()
+            client = model_manager.get_inference_client(self.diffusion_model)
+            if client is not None:
+                client.start()
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"Warm-up failed: {e}")
+            return
+        self.ready.set()
+        print(f"Models warm after {time.time() - self.started_at:.1f}s; ready for jobs")
+
+    def submit(self, request: Dict[str, Any]) -> ServiceJob:
+        """Validates a job request, stages its input images and queues it."""
+        mode = request.get("mode")
+        if mode not in ("object", "text", "multi"):
+            raise JobRejected(400, "'mode' must be 'object', 'text' or 'multi'")
+
+        # Checked before staging so a full queue does not cost a decode; put_nowait below settles races
+        if self._queue.full():
+            metrics.increment("service_rejected_jobs_total")
+            raise JobRejected(503, "Job queue is full; retry later")
+
+        job_id = uuid.uuid4().hex
+        job = ServiceJob(job_id, mode, request, os.path.join(self.output_dir, job_id))
+        try:
+            job.request = self._prepare(mode, request, os.path.join(job.output_dir, "inputs"))
+            with self._lock:
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    metrics.increment("service_rejected_jobs_total")
+                    raise JobRejected(503, "Job queue is full; retry later")
+                self._jobs[job_id] = job
+        except JobRejected:
+            # Inputs staged before the rejection belong to no job
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+            raise
+        return job
+
+    def _prepare(self, mode: str, request: Dict[str, Any], inputs_dir: str) -> Dict[str, Any]:
+        verify = request.get("verify", False)
+        if not isinstance(verify, bool):
+            raise JobRejected(400, "'verify' must be a boolean")
+        prepared = {
+            "main_image": _resolve_image(request.get("main_image"), inputs_dir, "main_image", self.input_dirs),
+            "verify": verify,
+        }
+
+        if mode == "object":
+            prepared["object_crop"] = _resolve_image(request.get("object_crop"), inputs_dir, "object_crop", self.input_dirs)
+        elif mode == "text":
+            text = request.get("text")
+            if not isinstance(text, str) or not text.strip():
+                raise JobRejected(400, "'text' is required for text jobs")
+            prepared["text"] = text
+        else:
+            object_crops = request.get("object_crops") or []
+            texts = request.get("texts") or []
+            if not isinstance(object_crops, list) or not isinstance(texts, list) or not (object_crops or texts):
+                raise JobRejected(400, "'object_crops' and/or 'texts' lists are required for multi jobs")
+            if not all(isinstance(text, str) and text.strip() for text in texts):
+                raise JobRejected(400, "'texts' must be non-empty strings")
+            prepared["insertions"] = [
+                InsertionSpec("object", object_crop=_resolve_image(crop, inputs_dir, f"object_crop_{index}", self.input_dirs))
+                for index, crop in enumerate(object_crops)
+            ] + [InsertionSpec("text", text=text) for text in texts]
+        return prepared
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._running += 1
+            job.status, job.started_at = "running", time.time()
+
+            record = metrics.start_job(job.job_id, job.mode)
+            try:
+                job.output_path = metrics.run_in_job(record, self._run, job)
+                if not job.output_path:
+                    job.error = "Pipeline failed; see the server log"
+            except Exception as e:
+                job.error = str(e)
+            metrics.finish_job(record, bool(job.output_path), job.output_path, job.error)
+
+            job.status = "succeeded" if job.output_path else "failed"
+            job.finished_at = time.time()
+            with self._lock:
+                self._running -= 1
+                forgotten = self._forget_old_jobs()
+            for old_job in forgotten:
+                shutil.rmtree(old_job.output_dir, ignore_errors=True)
+
+    def _run(self, job: ServiceJob) -> Optional[str]:
+        request = job.request
+        if job.mode == "object":
+            return object_insertion_pipeline(
+                request["main_image"], request["object_crop"], request["verify"], self.diffusion_model, job.output_dir
+            )
+        if job.mode == "text":
+            return text_insertion_pipeline(
+                request["main_image"], request["text"], request["verify"], self.diffusion_model, job.output_dir
+            )
+        return multi_insertion_pipeline(
+            request["main_image"], request["insertions"], request["verify"], self.diffusion_model, job.output_dir
+        )
+
+    def _forget_old_jobs(self) -> List[ServiceJob]:
+        """Drops the earliest finished jobs beyond SERVICE_MAX_FINISHED_JOBS; their directories go with them."""
+        # By finish time, not submission: a long job that just finished must not lose its result right away
+        finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        return [self._jobs.pop(job.job_id) for job in finished[:max(0, len(finished) - SERVICE_MAX_FINISHED_JOBS)]]
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            running = self._running
+        return {
+            "status": "ok",
+            "ready": self.ready.is_set(),
+            "warmup_error": self.warmup_error,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "diffusion_model": self.diffusion_model,
+            "workers": self.workers,
+            "running": running,
+            "queued": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+        }
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the InsertionService on the server."""
+
+    def do_GET(self):
+        service: InsertionService = self.server.service
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.split("/")
+
+        if path == "/healthz":
+            self._send_json(200, service.health())
+        elif path == "/readyz":
+            ready = service.ready.is_set()
+            self._send_json(200 if ready else 503, {"ready": ready, "warmup_error": service.warmup_error})
+        elif path == "/metrics":
+            self._send(200, metrics.prometheus_text().encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8")
+        elif len(parts) in (3, 4) and parts[1] == "jobs":
+            job = service.get(parts[2])
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job: {parts[2]}"})
+            elif len(parts) == 3:
+                self._send_json(200, job.to_json())
+            elif parts[3] != "result":
+                self._send_json(404, {"error": f"Unknown endpoint: {path}"})
+            elif job.status != "succeeded":
+                self._send_json(409, {"error": f"Job is {job.status}", **job.to_json()})
+            else:
+                try:
+                    with open(job.output_path, 'rb') as f:
+                        image_bytes = f.read()
+                except FileNotFoundError:
+                    # Forgotten and deleted since the lookup above
+                    self._send_json(410, {"error": f"Result of job {job.job_id} is no longer kept"})
+                    return
+                self._send(200, image_bytes, "image/png" if job.output_path.endswith(".png") else "image/jpeg")
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {path}"})
+
+    def do_POST(self):
+        service: InsertionService = self.server.service
+        if self.path.split("?")[0].rstrip("/") != "/jobs":
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+
+        try:
+            length = self._content_length()
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise JobRejected(400, "Request body must be a JSON object")
+            job = service.submit(request)
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+        except JobRejected as e:
+            headers = {"Retry-After": "5"} if e.status == 503 else {}
+            self._send_json(e.status, {"error": str(e)}, headers)
+        else:
+            self._send_json(202, job.to_json(), {"Location": f"/jobs/{job.job_id}"})
+
+    def _content_length(self) -> int:
+        """The request body's size from its Content-Length header, which a body must have."""
+        header = self.headers.get("Content-Length")
+        if header is None:
+            raise JobRejected(411, "Content-Length is required")
+        try:
+            length = int(header)
+        except ValueError:
+            raise JobRejected(400, f"Invalid Content-Length: {header!r}")
+        if length < 0:
+            raise JobRejected(400, f"Invalid Content-Length: {header!r}")
+        if length > SERVICE_MAX_REQUEST_MB * 1024 * 1024:
+            raise JobRejected(413, f"Request body exceeds {SERVICE_MAX_REQUEST_MB} MB")
+        return length
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(payload).encode('utf-8'), "application/json", headers)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Status polling and probes would drown the pipeline logs; only submissions are logged
+        if self.command != "GET":
+            super().log_message(format, *args)
+
+def create_server(service: InsertionService, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="ThinkNBlend HTTP inference service")
+    parser.add_argument("--host", type=str, default=SERVICE_HOST,
+                       help="Address to listen on")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT,
+                       help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS,
+                       help="Jobs processed at the same time")
+    parser.add_argument("--max_queued", type=int, default=SERVICE_MAX_QUEUED_JOBS,
+                       help="Queued jobs beyond which submissions are rejected with 503")
+    parser.add_argument("--diffusion_model", type=str, default="unicombine",
+                       help="Diffusion model to use for blending")
+    parser.add_argument("--simple_paste", action="store_true",
+                       help="Use simple paste instead of diffusion model")
+    parser.add_argument("--output_dir", type=str, default=SERVICE_OUTPUT_DIR,
+                       help="Directory for job outputs; each job writes into <output_dir>/<job id>")
+    parser.add_argument("--input_dirs", type=str, nargs="+", default=SERVICE_INPUT_DIRS,
+                       help="Directories server-side image paths may point into")
+    parser.add_argument("--warm_ocr", action="store_true",
+                       help="Load the OCR reader at startup for jobs that verify text")
+    args = parser.parse_args()
+
+    service = InsertionService(
+        workers=args.workers,
+        max_queued=args.max_queued,
+        diffusion_model="simple_paste" if args.simple_paste else args.diffusion_model,
+        output_dir=args.output_dir,
+        input_dirs=args.input_dirs,
+        warm_ocr=args.warm_ocr,
+    )
+    server = create_server(service, args.host, args.port)
+    # Stop serving on SIGTERM as on Ctrl+C; shutdown() must not run on the serving thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    service.start()
+    print(f"Serving on http://{args.host}:{server.server_address[1]} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Shutting down: finishing running jobs")
+        service.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 import os
 import json
-import subprocess
-from think_n_blend.schemas import BoundingBox
-from think_n_blend.utils.image_utils import create_mask_from_box
+import shutil
+from typing import List
+from PIL import Image
+from think_n_blend.config import MULTI_INSERTION_SUBJECT_BACKGROUND
+from think_n_blend.schemas import BoundingBox, PlannedInsertion
+from think_n_blend.utils.image_utils import create_mask_from_box, ImageSource, as_image_context
+from think_n_blend.utils.metrics import metrics
 from think_n_blend.services.model_manager import model_manager
-from think_n_blend.services.simple_paste_service import simple_object_paste
+from think_n_blend.services.compositing_service import PasteLayer, composite_layers
+from think_n_blend.services.simple_paste_service import (
+    simple_object_paste, object_paste_layer, text_paste_layer, render_layers, composite_onto_copy
+)
 
+@metrics.timed("blending")
 def blend_object_with_unicombine(
-    main_image_path: str,
-    object_crop_path: str,
+    main_image: ImageSource,
+    object_crop: ImageSource,
     inpainting_description: str,
     target_box: BoundingBox,
     diffusion_model: str = "unicombine",
@@ -23,8 +31,8 @@ def blend_object_with_unicombine(
     if model_manager.is_simple_paste_model(diffusion_model):
         print("Using simple paste mode (no diffusion model required)")
         result = simple_object_paste(
-            main_image_path,
-            object_crop_path,
+            main_image,
+            object_crop,
             target_box,
             os.path.join(output_dir, "simple_paste_result.jpg")
         )
@@ -40,7 +48,8 @@ def blend_object_with_unicombine(
         print(f"Error: {diffusion_model} model not available")
         return None
 
-    mask_path = create_mask_from_box(main_image_path, target_box, os.path.join(output_dir, "mask.png"))
+    os.makedirs(output_dir, exist_ok=True)
+    mask_path = create_mask_from_box(main_image, target_box, os.path.join(output_dir, "mask.png"))
     
     unicombine_json_data = {
         "bg_prompt": "background",
@@ -52,28 +61,134 @@ def blend_object_with_unicombine(
     with open(unicombine_json_path, 'w') as f:
         json.dump(unicombine_json_data, f)
 
-    # Get inference command from model manager
-    command = model_manager.get_inference_command(
+    # Run the job on the persistent inference worker, writing into a private scratch directory
+    inference_output_dir = os.path.join(output_dir, "unicombine_output")
+    shutil.rmtree(inference_output_dir, ignore_errors=True)
+    output_file = model_manager.run_inference(
         diffusion_model,
-        main_image_path=main_image_path,
-        object_crop_path=object_crop_path,
+        main_image_path=as_image_context(main_image).ensure_file(output_dir, "main_image"),
+        object_crop_path=as_image_context(object_crop).ensure_file(output_dir, "object_crop"),
         json_path=unicombine_json_path,
-        output_dir=output_dir
+        output_dir=inference_output_dir
     )
+    if not output_file:
+        print("Error: No output image found from diffusion model.")
+        return None
 
-    try:
-        subprocess.run(command, check=True)
-        
-        output_files = [os.path.join(output_dir, f) for f in os.listdir(output_dir) if f.endswith(('.jpg', '.png')) and "mask" not in f and "visualization" not in f]
-        if not output_files:
-            print("Error: No output image found from diffusion model.")
+    final_image_path = os.path.join(output_dir, "final_blended_image.jpg")
+    os.replace(output_file, final_image_path)
+    return final_image_path
+
+def _insertion_layer(insertion: PlannedInsertion) -> PasteLayer:
+    """Builds the paste layer for one insertion at its target box."""
+    if insertion.spec.kind == "object":
+        return object_paste_layer(insertion.spec.object_crop, insertion.target_box)
+    return text_paste_layer(insertion.spec.text, insertion.target_box)
+
+def _usable_insertions(insertions: List[PlannedInsertion]) -> List[PlannedInsertion]:
+    """Drops insertions whose target box has no area."""
+    usable = []
+    for insertion in insertions:
+        x1, y1, x2, y2 = insertion.target_box
+        if x2 > x1 and y2 > y1:
+            usable.append(insertion)
+        else:
+            print(f"Skipping '{insertion.spec.subject}': empty target box {insertion.target_box}")
+    return usable
+
+@metrics.timed("blending")
+def render_insertions(main_image: ImageSource, insertions: List[PlannedInsertion]) -> Image.Image | None:
+    """
+    Simple-paste render of planned insertions into a copy of the main image, kept in
+    memory. Returns None if no insertion has a usable target box.
+    """
+    usable = _usable_insertions(insertions)
+    if not usable:
+        print("Error: No insertion has a usable target box.")
+        return None
+    return composite_onto_copy(main_image, [_insertion_layer(insertion) for insertion in usable])
+
+@metrics.timed("blending")
+def blend_insertions(
+    main_image: ImageSource,
+    insertions: List[PlannedInsertion],
+    diffusion_model: str = "unicombine",
+    output_dir: str = "output",
+) -> str | None:
+    """
+    Renders every insertion of a multi-insertion job into the main image in one pass.
+    Simple paste composites all layers onto a single copy of the image; diffusion models
+    run once, with the subjects laid out on one combined subject image covering the union
+    of the target boxes.
+    """
+    print(f"\n--- Running {diffusion_model} Blending for {len(insertions)} insertions ---")
+
+    usable = _usable_insertions(insertions)
+    if not usable:
+        print("Error: No insertion has a usable target box.")
+        return None
+    layers = [_insertion_layer(insertion) for insertion in usable]
+
+    if model_manager.is_simple_paste_model(diffusion_model):
+        print("Using simple paste mode (no diffusion model required)")
+        try:
+            return render_layers(main_image, layers, os.path.join(output_dir, "simple_multi_paste_result.jpg"))
+        except Exception as e:
+            print(f"Simple paste failed: {e}")
             return None
-            
-        latest_file = max(output_files, key=os.path.getctime)
-        final_image_path = os.path.join(output_dir, "final_blended_image.jpg")
-        os.rename(latest_file, final_image_path)
-        return final_image_path
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error during {diffusion_model} execution: {e}")
+
+    # Check if model is available
+    if not model_manager.check_model_availability(diffusion_model, "diffusion"):
+        print(f"Error: {diffusion_model} model not available")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    boxes = [insertion.target_box for insertion in usable]
+    union_box = (
+        min(box[0] for box in boxes), min(box[1] for box in boxes),
+        max(box[2] for box in boxes), max(box[3] for box in boxes),
+    )
+    create_mask_from_box(main_image, union_box, os.path.join(output_dir, "mask.png"))
+
+    # Lay all subjects out on one image, positioned as they will appear inside the union box
+    subject_image = Image.new('RGB', (union_box[2] - union_box[0], union_box[3] - union_box[1]),
+                              MULTI_INSERTION_SUBJECT_BACKGROUND)
+    composite_layers(
+        subject_image,
+        [PasteLayer(layer.image, (layer.position[0] - union_box[0], layer.position[1] - union_box[1]), False)
+         for layer in layers],
+        feather=0,
+        color_match=0.0,
+    )
+    subject_path = os.path.join(output_dir, "multi_subject.png")
+    subject_image.save(subject_path)
+
+    unicombine_json_data = {
+        "bg_prompt": "background",
+        "fg_prompt": "; ".join(
+            insertion.vision_response.target_object.inpainting_description for insertion in usable
+        ),
+        "box": [int(v) for v in union_box],
+        "fg_keep_original": False,
+    }
+    unicombine_json_path = os.path.join(output_dir, "multi_unicombine_data.json")
+    with open(unicombine_json_path, 'w') as f:
+        json.dump(unicombine_json_data, f)
+
+    # Run the job on the persistent inference worker, writing into a private scratch directory
+    inference_output_dir = os.path.join(output_dir, "unicombine_multi_output")
+    shutil.rmtree(inference_output_dir, ignore_errors=True)
+    output_file = model_manager.run_inference(
+        diffusion_model,
+        main_image_path=as_image_context(main_image).ensure_file(output_dir, "main_image"),
+        object_crop_path=subject_path,
+        json_path=unicombine_json_path,
+        output_dir=inference_output_dir
+    )
+    if not output_file:
+        print("Error: No output image found from diffusion model.")
         return None
+
+    final_image_path = os.path.join(output_dir, "final_multi_blended_image.jpg")
+    os.replace(output_file, final_image_path)
+    return final_image_path
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+import numpy as np
+from PIL import Image
+from think_n_blend.config import SIMPLE_PASTE_FEATHER_PX, SIMPLE_PASTE_COLOR_MATCH
+
+@dataclass
+class PasteLayer:
+    image: Image.Image  # RGBA layer, already sized for its destination
+    position: Tuple[int, int]  # Top-left corner in base image coordinates
+    color_match: bool = True  # Text layers keep their exact color
+
+def _feather_ramp(length: int, feather: int) -> np.ndarray:
+    """Linear 0..1 ramp over the first and last `feather` pixels of an axis."""
+    if feather <= 0:
+        return np.ones(length, dtype=np.float32)
+    index = np.arange(length, dtype=np.float32)
+    distance = np.minimum(index + 1, length - index)
+    return np.clip(distance / feather, 0.0, 1.0)
+
+def _match_colors(layer_rgb: np.ndarray, alpha: np.ndarray, region: np.ndarray, strength: float) -> np.ndarray:
+    """Moves the layer's per-channel mean and spread toward the background it covers."""
+    weights = alpha[..., None]
+    total = weights.sum()
+    if total <= 0:
+        return layer_rgb
+
+    layer_mean = (layer_rgb * weights).sum(axis=(0, 1)) / total
+    layer_std = np.sqrt(((layer_rgb - layer_mean) ** 2 * weights).sum(axis=(0, 1)) / total) + 1e-6
+    region_mean = region.reshape(-1, 3).mean(axis=0)
+    region_std = region.reshape(-1, 3).std(axis=0) + 1e-6
+
+    matched = (layer_rgb - layer_mean) * (region_std / layer_std) + region_mean
+    return layer_rgb + strength * (matched - layer_rgb)
+
+def composite_layers(
+    base: Image.Image,
+    layers: List[PasteLayer],
+    feather: int = SIMPLE_PASTE_FEATHER_PX,
+    color_match: float = SIMPLE_PASTE_COLOR_MATCH,
+) -> Image.Image:
+    """
+    Alpha-blends RGBA layers into an RGB image in place. Only each layer's destination
+    region is converted to NumPy, blended and written back; the rest of the frame is
+    never converted. Layers are applied in order, so later ones stack on top.
+    """
+    base_width, base_height = base.size
+
+    for layer in layers:
+        pixels = np.asarray(layer.image.convert('RGBA'), dtype=np.float32)
+        height, width = pixels.shape[:2]
+        x, y = layer.position
+
+        # Clip the layer to the base image
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, base_width), min(y + height, base_height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+
+        alpha = pixels[..., 3] / 255.0
+        alpha *= np.outer(_feather_ramp(height, feather), _feather_ramp(width, feather))
+        alpha = alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+        layer_rgb = pixels[y0 - y:y1 - y, x0 - x:x1 - x, :3]
+
+        region = np.asarray(base.crop((x0, y0, x1, y1)), dtype=np.float32)
+        if color_match > 0 and layer.color_match:
+            layer_rgb = _match_colors(layer_rgb, alpha, region, color_match)
+
+        blended = region + alpha[..., None] * (layer_rgb - region)
+        base.paste(Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8)), (x0, y0))
+
+    return base
@@ -1,33 +1,211 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
 from PIL import Image
+from think_n_blend.config import (
+    PLACEMENT_SCALES, PLACEMENT_OFFSETS, PLACEMENT_MIN_SIDE_PX, PLACEMENT_ALTERNATIVES,
+    PLACEMENT_EDGE_MAP_SIDE, PLACEMENT_EDGE_CACHE_SIZE, PLACEMENT_WEIGHTS
+)
 from think_n_blend.schemas import BoundingBox, RelativePosition
+from think_n_blend.utils.image_utils import ImageSource, ImageContext, as_image_context
+from think_n_blend.utils.metrics import metrics
 
-def compute_target_bounding_box(image_path: str, reference_box: BoundingBox, relative_position: RelativePosition) -> BoundingBox:
+SIDES = ["top", "bottom", "left", "right"]
+
+# Integral edge maps keyed by image content hash, least recently used first
+_edge_integrals: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+_edge_lock = threading.Lock()
+
+def compute_target_bounding_box(image: ImageSource, reference_box: BoundingBox,
+                                relative_position: RelativePosition) -> BoundingBox | None:
     """
     Computes the target bounding box for the new object based on the reference box
-    and the relative position.
+    and the relative position: the best box find_target_boxes chooses, or None if no
+    candidate is large enough.
+    """
+    boxes = find_target_boxes(image, reference_box, relative_position, num_alternatives=0)
+    return boxes[0] if boxes else None
+
+def _edge_integral(context: ImageContext) -> Tuple[np.ndarray, float]:
+    """
+    Returns the integral image of a downscaled gradient-magnitude map and the map's scale
+    relative to the original image, computed once per image content.
+    """
+    key = context.content_hash
+    with _edge_lock:
+        if key in _edge_integrals:
+            _edge_integrals.move_to_end(key)
+            return _edge_integrals[key]
+
+    width, height = context.size
+    scale = min(1.0, PLACEMENT_EDGE_MAP_SIDE / max(width, height))
+    small = context.image.convert('L').resize(
+        (max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.BILINEAR
+    )
+    gray = np.asarray(small, dtype=np.float32)
+    edges = np.zeros_like(gray)
+    edges[:, 1:] += np.abs(np.diff(gray, axis=1))
+    edges[1:, :] += np.abs(np.diff(gray, axis=0))
+
+    integral = np.zeros((edges.shape[0] + 1, edges.shape[1] + 1), dtype=np.float64)
+    integral[1:, 1:] = edges.cumsum(axis=0).cumsum(axis=1)
+
+    with _edge_lock:
+        _edge_integrals[key] = (integral, scale)
+        while len(_edge_integrals) > PLACEMENT_EDGE_CACHE_SIZE:
+            _edge_integrals.popitem(last=False)
+    return integral, scale
+
+def _candidate_boxes(reference_box: BoundingBox, relative_position: RelativePosition) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds candidate boxes (float x1, y1, x2, y2 rows) beside every side of the reference box at
+    each configured scale and offset, with a matching row of penalties for side, scale and offset.
     """
-    img_width, img_height = Image.open(image_path).size
     x1, y1, x2, y2 = reference_box
-    ref_width = x2 - x1
-    ref_height = y2 - y1
-    
-    x1_new, y1_new, x2_new, y2_new = 0, 0, 0, 0
-
-    if relative_position == "top":
-        y1_new = max(0, y1 - ref_height)
-        x1_new, x2_new = x1, x2
-        y2_new = y1
-    elif relative_position == "bottom":
-        y1_new = y2
-        x1_new, x2_new = x1, x2
-        y2_new = min(img_height, y2 + ref_height)
-    elif relative_position == "left":
-        x1_new = max(0, x1 - ref_width)
-        y1_new, y2_new = y1, y2
-        x2_new = x1
-    elif relative_position == "right":
-        x1_new = x2
-        y1_new, y2_new = y1, y2
-        x2_new = min(img_width, x2 + ref_width)
-    
-    return (x1_new, y1_new, x2_new, y2_new)
+    ref_width, ref_height = x2 - x1, y2 - y1
+    center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
+
+    side, scale, offset = (grid.ravel() for grid in np.meshgrid(
+        np.arange(len(SIDES)), np.array(PLACEMENT_SCALES, dtype=np.float64),
+        np.array(PLACEMENT_OFFSETS, dtype=np.float64), indexing='ij'
+    ))
+    width, height = ref_width * scale, ref_height * scale
+    vertical = side < 2  # top/bottom candidates slide horizontally, left/right ones vertically
+
+    mid_x = np.where(vertical, center_x + offset * ref_width, 0.0)
+    mid_y = np.where(vertical, 0.0, center_y + offset * ref_height)
+    left = np.select([vertical, side == 2, side == 3], [mid_x - width / 2, x1 - width, x2])
+    top = np.select([~vertical, side == 0, side == 1], [mid_y - height / 2, y1 - height, y2])
+    boxes = np.stack([left, top, left + width, top + height], axis=1)
+
+    weights = PLACEMENT_WEIGHTS
+    penalties = (
+        weights["side"] * (side != SIDES.index(relative_position))
+        + weights["scale"] * (1.0 - scale)
+        + weights["offset"] * np.abs(offset)
+    )
+    return boxes, penalties
+
+def _overlap_fraction(boxes: np.ndarray, obstacles: List[BoundingBox]) -> np.ndarray:
+    """Fraction of each box's area covered by the obstacles (overlaps between obstacles counted twice)."""
+    if not obstacles:
+        return np.zeros(len(boxes))
+    others = np.asarray(obstacles, dtype=np.float64)[None, :, :]
+    widths = np.minimum(boxes[:, None, 2], others[..., 2]) - np.maximum(boxes[:, None, 0], others[..., 0])
+    heights = np.minimum(boxes[:, None, 3], others[..., 3]) - np.maximum(boxes[:, None, 1], others[..., 1])
+    covered = (np.clip(widths, 0, None) * np.clip(heights, 0, None)).sum(axis=1)
+    return np.minimum(1.0, covered / ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])))
+
+def _edge_density(context: ImageContext, boxes: np.ndarray) -> np.ndarray:
+    """Mean edge strength inside each box relative to the whole image, capped at 3x and scaled to 0..1."""
+    integral, scale = _edge_integral(context)
+    rows, cols = integral.shape
+    cells = np.rint(boxes * scale).astype(np.int64)
+    x1, x2 = np.clip(cells[:, 0], 0, cols - 1), np.clip(cells[:, 2], 0, cols - 1)
+    y1, y2 = np.clip(cells[:, 1], 0, rows - 1), np.clip(cells[:, 3], 0, rows - 1)
+    x2, y2 = np.maximum(x2, x1 + 1).clip(max=cols - 1), np.maximum(y2, y1 + 1).clip(max=rows - 1)
+
+    sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    areas = np.maximum((x2 - x1) * (y2 - y1), 1)
+    image_mean = integral[-1, -1] / ((rows - 1) * (cols - 1)) + 1e-6
+    return np.minimum(sums / areas / image_mean, 3.0) / 3.0
+
+@metrics.timed("composition")
+def find_target_boxes(image: ImageSource, reference_box: BoundingBox, relative_position: RelativePosition,
+                      obstacles: Optional[List[BoundingBox]] = None,
+                      num_alternatives: int = PLACEMENT_ALTERNATIVES) -> List[BoundingBox]:
+    """
+    Searches candidate target boxes on all sides of the reference box at several scales and
+    offsets, scoring them in one vectorized pass for the requested side, area lost outside
+    the image, overlap with the reference and other obstacles, and edge clutter. Returns the
+    best box followed by up to num_alternatives others, or an empty list when no candidate
+    is large enough.
+    """
+    context = as_image_context(image)
+    img_width, img_height = context.size
+    boxes, penalties = _candidate_boxes(reference_box, relative_position)
+
+    clipped = boxes.copy()
+    clipped[:, [0, 2]] = clipped[:, [0, 2]].clip(0, img_width)
+    clipped[:, [1, 3]] = clipped[:, [1, 3]].clip(0, img_height)
+    clipped = np.floor(clipped + 0.5)
+    clipped_width, clipped_height = clipped[:, 2] - clipped[:, 0], clipped[:, 3] - clipped[:, 1]
+    viable = (clipped_width >= PLACEMENT_MIN_SIDE_PX) & (clipped_height >= PLACEMENT_MIN_SIDE_PX)
+    if not viable.any():
+        return []
+    boxes, clipped, penalties = boxes[viable], clipped[viable], penalties[viable]
+
+    raw_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    outside = 1.0 - (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1]) / raw_area
+
+    weights = PLACEMENT_WEIGHTS
+    costs = (
+        penalties
+        + weights["clipped"] * outside
+        + weights["overlap"] * _overlap_fraction(clipped, [reference_box] + list(obstacles or []))
+        + weights["edges"] * _edge_density(context, clipped)
+    )
+
+    ranked = []
+    for index in np.argsort(costs, kind='stable'):
+        box = tuple(int(v) for v in clipped[index])
+        if box not in ranked:
+            ranked.append(box)
+        if len(ranked) > num_alternatives:
+            break
+    return ranked
+
+def _box_area(box: BoundingBox) -> int:
+    x1, y1, x2, y2 = box
+    return max(0, x2 - x1) * max(0, y2 - y1)
+
+def _intersection_area(a: BoundingBox, b: BoundingBox) -> int:
+    return _box_area((max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])))
+
+def _shift_clear_of(box: BoundingBox, placed: List[BoundingBox], img_width: int, img_height: int) -> BoundingBox | None:
+    """Finds the smallest horizontal or vertical shift that moves box clear of all placed boxes."""
+    x1, y1, x2, y2 = box
+    shifts = set()
+    for px1, py1, px2, py2 in placed:
+        if _intersection_area(box, (px1, py1, px2, py2)):
+            shifts.update([(px2 - x1, 0), (px1 - x2, 0), (0, py2 - y1), (0, py1 - y2)])
+
+    for dx, dy in sorted(shifts, key=lambda shift: abs(shift[0]) + abs(shift[1])):
+        moved = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        inside = moved[0] >= 0 and moved[1] >= 0 and moved[2] <= img_width and moved[3] <= img_height
+        if inside and not any(_intersection_area(moved, other) for other in placed):
+            return moved
+    return None
+
+def _trim_clear_of(box: BoundingBox, placed: List[BoundingBox]) -> BoundingBox:
+    """Trims box to the largest part beside each placed box it overlaps."""
+    for px1, py1, px2, py2 in placed:
+        if not _intersection_area(box, (px1, py1, px2, py2)):
+            continue
+        x1, y1, x2, y2 = box
+        box = max(
+            [(x1, y1, min(x2, px1), y2), (max(x1, px2), y1, x2, y2),
+             (x1, y1, x2, min(y2, py1)), (x1, max(y1, py2), x2, y2)],
+            key=_box_area,
+        )
+    return box
+
+@metrics.timed("composition")
+def resolve_overlapping_boxes(image: ImageSource, target_boxes: List[BoundingBox]) -> List[BoundingBox]:
+    """
+    Makes the target boxes of a multi-insertion job disjoint. Earlier boxes keep their place;
+    a later box that overlaps is moved by the smallest shift that clears all earlier boxes
+    within the image, or trimmed to its largest non-overlapping part when no shift fits.
+    """
+    img_width, img_height = as_image_context(image).size
+    resolved: List[BoundingBox] = []
+    for box in target_boxes:
+        placed = [other for other in resolved if _box_area(other)]
+        if _box_area(box) and any(_intersection_area(box, other) for other in placed):
+            moved = _shift_clear_of(box, placed, img_width, img_height)
+            box = moved if moved else _trim_clear_of(box, placed)
+            print(f"Resolved overlapping target box to {box}")
+        resolved.append(box)
+    return resolved
+
@@ -1,16 +1,189 @@
-from transformers import pipeline
-from PIL import Image
-from think_n_blend.config import OBJECT_DETECTION_MODEL
-from think_n_blend.schemas import BoundingBox
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from think_n_blend.config import (
+    DETECTION_SCORE_THRESHOLD, DETECTION_EMBEDDING_CACHE_SIZE, DETECTION_TEXT_EMBEDDING_CACHE_SIZE, REFERENCE_MIN_SCORE
+)
+from think_n_blend.schemas import BoundingBox, ReferenceDetection
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.onnx_detector import OnnxOwlDetector
+from think_n_blend.utils.image_utils import ImageSource, ImageContext, as_image_context
+from think_n_blend.utils.metrics import metrics
 
-def detect_reference_object(image_path: str, reference_object_label: str) -> BoundingBox | None:
+# Image-side detector outputs keyed by (model, image content hash), least recently used first
+_image_embeddings: "OrderedDict[Tuple[str, str], Tuple[Any, np.ndarray]]" = OrderedDict()
+# Query embeddings keyed by (model, label), least recently used first
+_text_embeddings: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _supports_embedding_cache(detector) -> bool:
+    """OWL-ViT/OWLv2 expose separate image and query heads; other detectors use the plain pipeline."""
+    if isinstance(detector, OnnxOwlDetector):
+        return True
+    model = getattr(detector, "model", None)
+    return all(hasattr(model, attr) for attr in ("image_embedder", "box_predictor", "class_predictor"))
+
+def _pads_to_square(detector) -> bool:
+    """OWLv2 pads images to a square before resizing; OWL-ViT stretches them to one."""
+    if isinstance(detector, OnnxOwlDetector):
+        return detector.model_type == "owlv2"
+    return detector.model.config.model_type == "owlv2"
+
+def _model_name(detector) -> str:
+    """Embedding cache key of the loaded detector."""
+    return detector.name_or_path if isinstance(detector, OnnxOwlDetector) else detector.model.name_or_path
+
+def _get_image_embeddings(detector, context: ImageContext) -> Tuple[Any, np.ndarray]:
+    """Runs the image encoder once per image and caches the patch features and predicted boxes."""
+    key = (_model_name(detector), context.content_hash)
+    with _cache_lock:
+        if key in _image_embeddings:
+            _image_embeddings.move_to_end(key)
+            return _image_embeddings[key]
+
+    if isinstance(detector, OnnxOwlDetector):
+        image_feats, pred_boxes = detector.embed_image(context.image)
+    else:
+        import torch
+
+        inputs = detector.image_processor(images=context.image, return_tensors="pt").to(detector.device)
+        with torch.no_grad():
+            feature_map = detector.model.image_embedder(pixel_values=inputs["pixel_values"])[0]
+            batch_size, height, width, depth = feature_map.shape
+            image_feats = feature_map.reshape(batch_size, height * width, depth)
+            pred_boxes = detector.model.box_predictor(image_feats, feature_map)[0].cpu().numpy()
+
+    with _cache_lock:
+        _image_embeddings[key] = (image_feats, pred_boxes)
+        while len(_image_embeddings) > DETECTION_EMBEDDING_CACHE_SIZE:
+            _image_embeddings.popitem(last=False)
+    return image_feats, pred_boxes
+
+def _cached_text_embedding(model_name: str, label: str, embed: Callable[[str], Any]) -> Any:
+    """Returns a label's query embedding, computing it with embed on a cache miss."""
+    key = (model_name, label)
+    with _cache_lock:
+        if key in _text_embeddings:
+            _text_embeddings.move_to_end(key)
+            return _text_embeddings[key]
+
+    embedding = embed(label)
+    with _cache_lock:
+        _text_embeddings[key] = embedding
+        while len(_text_embeddings) > DETECTION_TEXT_EMBEDDING_CACHE_SIZE:
+            _text_embeddings.popitem(last=False)
+    return embedding
+
+def _get_text_embeddings(detector, labels: List[str]) -> Any:
+    """Embeds text queries, caching each label's embedding."""
+    if isinstance(detector, OnnxOwlDetector):
+        embeddings = [_cached_text_embedding(detector.name_or_path, label, detector.embed_text) for label in labels]
+        return np.stack(embeddings)[None]
+
+    import torch
+
+    model = detector.model
+    text_model = getattr(model, "owlv2", None) or getattr(model, "owlvit")
+
+    def embed(label: str) -> Any:
+        tokens = detector.tokenizer(label, return_tensors="pt").to(detector.device)
+        with torch.no_grad():
+            return text_model.get_text_features(
+                input_ids=tokens["input_ids"], attention_mask=tokens["attention_mask"]
+            )[0]
+
+    embeddings = [_cached_text_embedding(model.name_or_path, label, embed) for label in labels]
+    return torch.stack(embeddings).unsqueeze(0)
+
+def _class_scores(detector, image_feats: Any, query_embeds: Any) -> np.ndarray:
+    """Sigmoid scores (num_patches, num_labels) of the text queries against an image's patches."""
+    if isinstance(detector, OnnxOwlDetector):
+        return detector.class_scores(image_feats, query_embeds)
+
+    import torch
+
+    query_mask = torch.ones(query_embeds.shape[:2], dtype=torch.bool, device=query_embeds.device)
+    with torch.no_grad():
+        logits = detector.model.class_predictor(image_feats, query_embeds, query_mask)[0]
+    return torch.sigmoid(logits[0]).cpu().numpy()
+
+def owl_predictions(scores: np.ndarray, pred_boxes: np.ndarray, labels: List[str], size: Tuple[int, int],
+                    threshold: float, padded_to_square: bool = True) -> List[Dict[str, Any]]:
+    """Turns OWL patch scores and normalized boxes into pipeline-style predictions, best first."""
+    # Boxes are normalized (cx, cy, w, h) on the square the image was padded or stretched to
+    width, height = size
+    scale = (max(width, height),) * 2 if padded_to_square else (width, height)
+    cx, cy, w, h = (pred_boxes * np.array(scale * 2)).T
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=-1)
+
+    predictions = []
+    for label_index, label in enumerate(labels):
+        for patch_index in np.flatnonzero(scores[:, label_index] > threshold):
+            x1, y1, x2, y2 = boxes[patch_index].tolist()
+            predictions.append({
+                "score": float(scores[patch_index, label_index]),
+                "label": label,
+                "box": {
+                    "xmin": int(max(0, x1)),
+                    "ymin": int(max(0, y1)),
+                    "xmax": int(min(width, x2)),
+                    "ymax": int(min(height, y2)),
+                },
+            })
+    return sorted(predictions, key=lambda p: p["score"], reverse=True)
+
+def _query_embeddings(detector, context: ImageContext, labels: List[str], threshold: float) -> List[Dict[str, Any]]:
+    """Scores text queries against cached image embeddings, returning pipeline-style predictions."""
+    image_feats, pred_boxes = _get_image_embeddings(detector, context)
+    scores = _class_scores(detector, image_feats, _get_text_embeddings(detector, labels))
+    return owl_predictions(scores, pred_boxes, labels, context.size, threshold, _pads_to_square(detector))
+
+@metrics.timed("detection")
+def detect_objects(image: ImageSource, labels: List[str], threshold: float = DETECTION_SCORE_THRESHOLD,
+                   model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Detects any number of labels in an image. The image encoder runs once per image;
+    further queries against the same image only evaluate the lightweight query heads.
+    OWL models run on PyTorch or, when exported, on ONNX Runtime.
+    """
+    detector = model_manager.get_object_detector(model_name)
+    context = as_image_context(image)
+
+    if _supports_embedding_cache(detector):
+        return _query_embeddings(detector, context, labels, threshold)
+    return detector(context.image, candidate_labels=labels, threshold=threshold)
+
+def clear_embedding_cache():
+    """Drops all cached image and text embeddings."""
+    with _cache_lock:
+        _image_embeddings.clear()
+        _text_embeddings.clear()
+
+def _detect_cascaded(image: ImageSource, labels: List[str], threshold: float,
+                     settled: Callable[[List[Dict[str, Any]], float], bool]) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Runs the current detection model's tiers cheapest first, stopping at the first tier whose
+    predictions settle the lookup at the cascade's escalation score. Returns them and the tier.
+    """
+    tiers = model_manager.get_detection_tiers()
+    escalation_score = model_manager.get_escalation_score()
+    for tier in tiers:
+        predictions = detect_objects(image, labels, threshold, tier)
+        if tier == tiers[-1] or settled(predictions, escalation_score):
+            break
+        metrics.increment("detection_escalations_total", model=tier)
+    metrics.increment("detection_answers_total", model=tier)
+    return predictions, tier
+
+def detect_reference_object(image: ImageSource, reference_object_label: str) -> BoundingBox | None:
     """
     Detects the reference object in the main image using a zero-shot object detection model.
     """
-    detector = pipeline(model=OBJECT_DETECTION_MODEL, task="zero-shot-object-detection")
-    image = Image.open(image_path)
-    
-    predictions = detector(image, candidate_labels=[reference_object_label])
+    predictions, _ = _detect_cascaded(
+        image, [reference_object_label], DETECTION_SCORE_THRESHOLD,
+        lambda predictions, escalation_score: any(p['score'] >= escalation_score for p in predictions),
+    )
 
     best_box = None
     max_score = -1.0
@@ -18,8 +191,59 @@ def detect_reference_object(image_path: str, reference_object_label: str) -> Bou
         if prediction['score'] > max_score:
             max_score = prediction['score']
             best_box = prediction['box']
-    
+
     if best_box:
         return (best_box['xmin'], best_box['ymin'], best_box['xmax'], best_box['ymax'])
-    
+
     return None
+
+def _best_detection(predictions: List[Dict[str, Any]], candidate_labels: List[str],
+                    min_score: float, model: Optional[str] = None) -> ReferenceDetection | None:
+    """Picks the best-scoring prediction with a non-empty box among one insertion's candidate labels."""
+    best = None
+    for prediction in predictions:
+        box = prediction['box']
+        viable = (
+            prediction['label'] in candidate_labels
+            and prediction['score'] >= min_score
+            and box['xmax'] > box['xmin'] and box['ymax'] > box['ymin']
+        )
+        if viable and (best is None or prediction['score'] > best.score):
+            best = ReferenceDetection(
+                label=prediction['label'],
+                box=(box['xmin'], box['ymin'], box['xmax'], box['ymax']),
+                score=prediction['score'],
+                rank=candidate_labels.index(prediction['label']),
+                model=model,
+            )
+    return best
+
+def detect_best_reference(image: ImageSource, candidate_labels: List[str],
+                          min_score: float = REFERENCE_MIN_SCORE) -> ReferenceDetection | None:
+    """
+    Scores all ranked reference candidates in one detector pass and returns the
+    best-scoring detection with a non-empty box, or None if none reaches min_score.
+    A cascade escalates while no candidate reaches its escalation score.
+    """
+    def settled(predictions, escalation_score):
+        best = _best_detection(predictions, candidate_labels, min_score)
+        return best is not None and best.score >= escalation_score
+
+    predictions, model = _detect_cascaded(image, candidate_labels, min_score, settled)
+    return _best_detection(predictions, candidate_labels, min_score, model)
+
+def detect_best_references(image: ImageSource, candidate_label_lists: List[List[str]],
+                           min_score: float = REFERENCE_MIN_SCORE) -> List[ReferenceDetection | None]:
+    """
+    Resolves the references of several insertions into the same image with one detector
+    pass over the union of their candidate labels. Returns one detection (or None) per list.
+    A cascade escalates while any insertion has no candidate reaching its escalation score.
+    """
+    all_labels = list(dict.fromkeys(label for labels in candidate_label_lists for label in labels))
+
+    def settled(predictions, escalation_score):
+        bests = [_best_detection(predictions, labels, min_score) for labels in candidate_label_lists]
+        return all(best is not None and best.score >= escalation_score for best in bests)
+
+    predictions, model = _detect_cascaded(image, all_labels, min_score, settled)
+    return [_best_detection(predictions, labels, min_score, model) for labels in candidate_label_lists]
@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from think_n_blend.config import (
+    FONT_DIRS, FONT_FACES, FONT_CACHE_SIZE, TEXT_MIN_FONT_SIZE, TEXT_MAX_FONT_SIZE, TEXT_FIT_MARGIN
+)
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+_REFERENCE_SIZE = 100  # Size used to estimate the fitted size before refining it
+
+@lru_cache(maxsize=1)
+def _font_index() -> Dict[str, str]:
+    """Scans the configured font directories once, mapping lower-case file names (no extension) to paths."""
+    index = {}
+    for font_dir in FONT_DIRS:
+        for root, _, filenames in os.walk(os.path.expanduser(font_dir)):
+            for filename in sorted(filenames):
+                stem, extension = os.path.splitext(filename)
+                if extension.lower() in FONT_EXTENSIONS:
+                    index.setdefault(stem.lower(), os.path.join(root, filename))
+    return index
+
+@lru_cache(maxsize=None)
+def resolve_font_path(face: Optional[str] = None) -> Optional[str]:
+    """
+    Resolves a font file for face (a path or a file name without extension), falling back to
+    the preferred faces in config and then to any installed font. Returns None if none is found.
+    """
+    if face and os.path.isfile(face):
+        return face
+
+    index = _font_index()
+    for name in ([face] if face else []) + FONT_FACES:
+        if name.lower() in index:
+            return index[name.lower()]
+    if index:
+        return index[min(index)]
+
+    print(f"Warning: no fonts found in {FONT_DIRS}; using Pillow's built-in font")
+    return None
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(size: int, face: Optional[str] = None) -> ImageFont.FreeTypeFont:
+    """Returns a cached font of the given size."""
+    font_path = resolve_font_path(face)
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default(size)
+
+@lru_cache(maxsize=4096)
+def measure_text(text: str, size: int, face: Optional[str] = None) -> Tuple[int, int, int, int]:
+    """Returns the cached bounding box (left, top, right, bottom) of text drawn at the origin."""
+    return get_font(size, face).getbbox(text)
+
+def _fits(text: str, size: int, face: Optional[str], width: float, height: float) -> bool:
+    left, top, right, bottom = measure_text(text, size, face)
+    return right - left <= width and bottom - top <= height
+
+def fit_font_size(text: str, box_size: Tuple[int, int], face: Optional[str] = None,
+                  min_size: int = TEXT_MIN_FONT_SIZE, max_size: int = TEXT_MAX_FONT_SIZE) -> int:
+    """
+    Finds the largest font size at which text fits inside box_size (less the fit margin).
+    Glyph extents scale almost linearly with size, so a measurement at a reference size gives
+    a close first guess; a short search around it settles the exact size.
+    """
+    width, height = box_size[0] * TEXT_FIT_MARGIN, box_size[1] * TEXT_FIT_MARGIN
+    left, top, right, bottom = measure_text(text, _REFERENCE_SIZE, face)
+    if right <= left or bottom <= top or width <= 0 or height <= 0:
+        return min_size
+
+    guess = int(_REFERENCE_SIZE * min(width / (right - left), height / (bottom - top)))
+    guess = max(min_size, min(max_size, guess))
+
+    # Bracket the answer with steps away from the guess, then bisect the bracket
+    step = max(1, guess // 16)
+    if _fits(text, guess, face, width, height):
+        low, high = guess, guess + step
+        while high <= max_size and _fits(text, high, face, width, height):
+            low, high = high, high + step
+        high = min(high - 1, max_size)
+    else:
+        low, high = guess - step, guess - 1
+        while low >= min_size and not _fits(text, low, face, width, height):
+            low, high = low - step, low - 1
+        low = max(low, min_size)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _fits(text, mid, face, width, height):
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def draw_text_centered(image: Image.Image, text: str, font_color: str = "white",
+                       font_size: Optional[int] = None, face: Optional[str] = None) -> int:
+    """
+    Draws text centered on image, auto-fitting the font size to the image when font_size
+    is None. Returns the font size used.
+    """
+    font_size = font_size or fit_font_size(text, image.size, face)
+    left, top, right, bottom = measure_text(text, font_size, face)
+
+    # Offset by the bounding box origin so the visible glyphs, not the pen position, are centered
+    x = (image.width - (right - left)) // 2 - left
+    y = (image.height - (bottom - top)) // 2 - top
+    ImageDraw.Draw(image).text((x, y), text, fill=font_color, font=get_font(font_size, face))
+    return font_size
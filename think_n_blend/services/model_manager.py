@@ -1,16 +1,31 @@
 import os
 import subprocess
-from typing import Dict, Any, Optional
-from think_n_blend.config import DIFFUSION_MODELS, OBJECT_DETECTION_MODELS, DEFAULT_DIFFUSION_MODEL, DEFAULT_OBJECT_DETECTION_MODEL
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable
+from think_n_blend.config import (
+    DIFFUSION_MODELS, OBJECT_DETECTION_MODELS, OCR_MODELS,
+    DEFAULT_DIFFUSION_MODEL, DEFAULT_OBJECT_DETECTION_MODEL, DEFAULT_OCR_MODEL,
+    MODEL_MEMORY_BUDGET_MB, DETECTION_ONNX_INTRA_OP_THREADS, UNICOMBINE_JOB_TIMEOUT_S, UNICOMBINE_STARTUP_TIMEOUT_S
+)
 
 class ModelManager:
     """Manages different diffusion and object detection models."""
     
-    def __init__(self):
+    def __init__(self, memory_budget_mb: int = MODEL_MEMORY_BUDGET_MB):
         self.diffusion_models = DIFFUSION_MODELS
         self.object_detection_models = OBJECT_DETECTION_MODELS
+        self.ocr_models = OCR_MODELS
         self.current_diffusion_model = DEFAULT_DIFFUSION_MODEL
         self.current_object_detection_model = DEFAULT_OBJECT_DETECTION_MODEL
+        self.current_ocr_model = DEFAULT_OCR_MODEL
+        self.memory_budget_mb = memory_budget_mb
+        
+        # Loaded model instances, ordered from least to most recently used
+        self._loaded_models: "OrderedDict[str, Any]" = OrderedDict()
+        self._model_memory: Dict[str, int] = {}
+        self._inference_clients: Dict[str, Any] = {}
+        self._lock = threading.RLock()
     
     def get_diffusion_model_config(self, model_name: Optional[str] = None) -> Dict[str, Any]:
         """Get configuration for a diffusion model."""
@@ -26,6 +41,17 @@ class ModelManager:
             raise ValueError(f"Unknown object detection model: {model_name}")
         return self.object_detection_models[model_name]
     
+    def get_detection_tiers(self, model_name: Optional[str] = None) -> List[str]:
+        """Detection models to try in order: a cascade's tiers, cheapest first, or the model itself."""
+        model_name = model_name or self.current_object_detection_model
+        config = self.get_object_detection_model_config(model_name)
+        return list(config.get("cascade", [model_name]))
+    
+    def get_escalation_score(self, model_name: Optional[str] = None) -> float:
+        """Best score below which a cascade tier escalates to the next one (0 for a single model)."""
+        config = self.get_object_detection_model_config(model_name)
+        return config.get("escalation_score", 0.0)
+    
     def list_available_models(self) -> Dict[str, list]:
         """List all available models."""
         return {
@@ -61,6 +87,8 @@ class ModelManager:
         elif model_type == "object_detection":
             # For Hugging Face models, we assume they're available if the config exists
             return model_name in self.object_detection_models
+        elif model_type == "ocr":
+            return model_name in self.ocr_models
         else:
             raise ValueError(f"Unknown model type: {model_type}")
     
@@ -82,27 +110,172 @@ class ModelManager:
             print(f"Error installing requirements for {model_name}: {e}")
             return False
     
-    def get_inference_command(self, model_name: str, **kwargs) -> list:
-        """Get the inference command for a diffusion model."""
+    def get_inference_client(self, model_name: str) -> Any:
+        """Get the shared persistent inference worker client for a diffusion model."""
         config = self.get_diffusion_model_config(model_name)
         
         if model_name == "unicombine":
-            inference_script = os.path.join(config["path"], config["inference_script"])
-            return self._get_unicombine_command(inference_script, **kwargs)
+            with self._lock:
+                if model_name not in self._inference_clients:
+                    from think_n_blend.services.unicombine_worker import UniCombineWorkerClient
+                    self._inference_clients[model_name] = UniCombineWorkerClient(
+                        config["path"], config["inference_script"],
+                        UNICOMBINE_JOB_TIMEOUT_S, UNICOMBINE_STARTUP_TIMEOUT_S
+                    )
+                return self._inference_clients[model_name]
         elif model_name == "simple_paste":
-            # Simple paste doesn't use inference commands
-            return []
+            # Simple paste doesn't use an inference worker
+            return None
+        else:
+            raise ValueError(f"No inference worker defined for model: {model_name}")
+    
+    def run_inference(self, model_name: str, **kwargs) -> str | None:
+        """Run a diffusion model job on its persistent worker and return the output image path."""
+        client = self.get_inference_client(model_name)
+        if client is None:
+            return None
+        
+        if model_name == "unicombine":
+            args = self._get_unicombine_args(**kwargs)
         else:
-            raise ValueError(f"No inference command defined for model: {model_name}")
+            raise ValueError(f"No inference arguments defined for model: {model_name}")
+        return client.run(args, kwargs.get("output_dir", "output"))
+    
+    def shutdown_inference_workers(self):
+        """Stop all persistent inference workers."""
+        with self._lock:
+            clients = list(self._inference_clients.values())
+            self._inference_clients.clear()
+        for client in clients:
+            client.close()
+    
+    def get_object_detector(self, model_name: Optional[str] = None) -> Any:
+        """Get a shared zero-shot object detection pipeline, loading it on first use. A cascade gives its last, most accurate tier."""
+        model_name = self.get_detection_tiers(model_name)[-1]
+        config = self.get_object_detection_model_config(model_name)
+        
+        def load():
+            if config.get("backend") == "onnxruntime":
+                try:
+                    from think_n_blend.services.onnx_detector import OnnxOwlDetector
+                    return OnnxOwlDetector(config["onnx_dir"], DETECTION_ONNX_INTRA_OP_THREADS)
+                except Exception as e:
+                    # Besides a missing package or export: onnxruntime's own Fail/InvalidGraph/NoSuchFile on a
+                    # corrupt graph or unsupported provider, and ValueError/KeyError on a bad export_info.json
+                    print(f"ONNX Runtime backend for '{model_name}' unavailable "
+                          f"({type(e).__name__}: {e}); falling back to PyTorch")
+            from transformers import pipeline
+            return pipeline(model=config["model"], task=config["task"])
+        
+        return self.get_model(f"object_detection:{model_name}", load)
+    
+    def get_ocr_reader(self, model_name: Optional[str] = None) -> Any:
+        """Get a shared OCR reader, loading it on first use."""
+        model_name = model_name or self.current_ocr_model
+        if model_name not in self.ocr_models:
+            raise ValueError(f"Unknown OCR model: {model_name}")
+        config = self.ocr_models[model_name]
+        
+        def load():
+            import easyocr
+            return easyocr.Reader(config["languages"])
+        
+        return self.get_model(f"ocr:{model_name}", load)
+    
+    def get_model(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the loaded model for key, calling loader once if it is not resident."""
+        with self._lock:
+            if key in self._loaded_models:
+                self._loaded_models.move_to_end(key)
+                return self._loaded_models[key]
+            
+            print(f"Loading model '{key}'...")
+            model = loader()
+            self._loaded_models[key] = model
+            self._model_memory[key] = self._estimate_model_memory(model)
+            print(f"Loaded model '{key}' ({self._model_memory[key] / (1024 * 1024):.1f} MB)")
+            self._evict_over_budget(keep=key)
+            return model
+    
+    def unload_model(self, key: str) -> bool:
+        """Drop a loaded model from the registry."""
+        with self._lock:
+            if key not in self._loaded_models:
+                return False
+            del self._loaded_models[key]
+            self._model_memory.pop(key, None)
+        self._release_device_memory()
+        return True
+    
+    def unload_all_models(self):
+        """Drop every loaded model from the registry."""
+        with self._lock:
+            self._loaded_models.clear()
+            self._model_memory.clear()
+        self._release_device_memory()
+    
+    def get_memory_usage(self) -> Dict[str, int]:
+        """Get the estimated resident memory in bytes of each loaded model."""
+        with self._lock:
+            return {key: self._model_memory[key] for key in self._loaded_models}
+    
+    def _evict_over_budget(self, keep: str):
+        """Evict least-recently-used models until the memory budget is respected."""
+        budget = self.memory_budget_mb * 1024 * 1024
+        evicted = False
+        while sum(self._model_memory.values()) > budget:
+            candidates = [key for key in self._loaded_models if key != keep]
+            if not candidates:
+                print(f"Warning: model '{keep}' alone exceeds the {self.memory_budget_mb} MB memory budget")
+                break
+            key = candidates[0]
+            print(f"Evicting model '{key}' to stay within the {self.memory_budget_mb} MB memory budget")
+            del self._loaded_models[key]
+            self._model_memory.pop(key, None)
+            evicted = True
+        if evicted:
+            self._release_device_memory()
+    
+    @staticmethod
+    def _estimate_model_memory(model: Any) -> int:
+        """Estimate the memory held by a model's parameters and buffers."""
+        # ONNX Runtime sessions report the size of their graphs instead
+        if hasattr(model, "memory_bytes"):
+            return model.memory_bytes
+        
+        # Pipelines expose .model, EasyOCR readers expose .detector and .recognizer
+        modules = [getattr(model, name, None) for name in ("model", "detector", "recognizer")]
+        modules = [module for module in modules if module is not None] or [model]
+        
+        total = 0
+        for module in modules:
+            for attr in ("parameters", "buffers"):
+                tensors = getattr(module, attr, None)
+                if not callable(tensors):
+                    continue
+                for tensor in tensors():
+                    total += tensor.numel() * tensor.element_size()
+        return total
+    
+    @staticmethod
+    def _release_device_memory():
+        """Return cached GPU memory after models are dropped."""
+        import gc
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
     
     def is_simple_paste_model(self, model_name: str) -> bool:
         """Check if the model is a simple paste model."""
         return model_name == "simple_paste"
     
-    def _get_unicombine_command(self, inference_script: str, **kwargs) -> list:
-        """Get UniCombine inference command."""
-        command = [
-            "python", inference_script,
+    def _get_unicombine_args(self, **kwargs) -> list:
+        """Get UniCombine inference arguments."""
+        args = [
             "--condition_types", "fill", "subject",
             "--denoising_lora_name", "subject_fill_union",
             "--denoising_lora_weight", "1.0",
@@ -112,7 +285,7 @@ class ModelManager:
             "--version", "training-based",
             "--output_dir", kwargs.get("output_dir", "output"),
         ]
-        return command
+        return args
 
 # Global model manager instance
 model_manager = ModelManager() 
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import json
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from PIL import Image
+
+# Files written by think_n_blend.export_detector into an export directory
+IMAGE_ENCODER_FILE = "image_encoder.onnx"  # pixel_values -> image_feats, pred_boxes
+TEXT_ENCODER_FILE = "text_encoder.onnx"  # input_ids, attention_mask -> text_embeds
+CLASS_HEAD_FILE = "class_head.onnx"  # image_feats, query_embeds, query_mask -> logits
+EXPORT_INFO_FILE = "export_info.json"
+
+class OnnxOwlDetector:
+    """
+    OWL-ViT/OWLv2 exported by think_n_blend.export_detector, run on ONNX Runtime's CPU
+    provider. It exposes the image encoder, text encoder and class head separately, so
+    detection_service caches its embeddings just like the PyTorch model's, and can also be
+    called like the transformers zero-shot pipeline.
+    """
+
+    def __init__(self, model_dir: str, intra_op_threads: int = 0):
+        """Loads an export directory; intra_op_threads=0 lets ONNX Runtime use every physical core."""
+        import onnxruntime as ort
+        from transformers import AutoProcessor
+
+        with open(os.path.join(model_dir, EXPORT_INFO_FILE)) as f:
+            self.info: Dict[str, Any] = json.load(f)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        paths = [os.path.join(model_dir, name) for name in (IMAGE_ENCODER_FILE, TEXT_ENCODER_FILE, CLASS_HEAD_FILE)]
+        self.image_encoder, self.text_encoder, self.class_head = [
+            ort.InferenceSession(path, options, providers=["CPUExecutionProvider"]) for path in paths
+        ]
+        self.processor = AutoProcessor.from_pretrained(model_dir)
+        self.model_type = self.info.get("model_type", "owlv2")
+        self.memory_bytes = sum(os.path.getsize(path) for path in paths)
+        # Embedding cache key; exports of the same model with other weights must not share entries
+        self.name_or_path = f"{self.info['model']}@onnx{'-int8' if self.info['quantized'] else ''}"
+
+    def embed_image(self, image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        """Patch features (1, num_patches, depth) and normalized (cx, cy, w, h) boxes (num_patches, 4)."""
+        pixel_values = self.processor(images=image, return_tensors="np")["pixel_values"].astype(np.float32)
+        image_feats, pred_boxes = self.image_encoder.run(None, {"pixel_values": pixel_values})
+        return image_feats, pred_boxes[0]
+
+    def embed_text(self, label: str) -> np.ndarray:
+        """Query embedding of one label."""
+        tokens = self.processor.tokenizer(label, return_tensors="np")
+        return self.text_encoder.run(None, {
+            "input_ids": tokens["input_ids"].astype(np.int64),
+            "attention_mask": tokens["attention_mask"].astype(np.int64),
+        })[0][0]
+
+    def class_scores(self, image_feats: np.ndarray, query_embeds: np.ndarray) -> np.ndarray:
+        """Sigmoid scores (num_patches, num_labels) of query embeddings (1, num_labels, depth) against an image."""
+        query_mask = np.ones(query_embeds.shape[:2], dtype=bool)
+        logits = self.class_head.run(None, {
+            "image_feats": image_feats, "query_embeds": query_embeds, "query_mask": query_mask,
+        })[0][0]
+        return 1 / (1 + np.exp(-logits))
+
+    def __call__(self, image: Image.Image, candidate_labels: List[str], threshold: float = 0.1) -> List[Dict[str, Any]]:
+        """Pipeline-style detection without embedding caching."""
+        from think_n_blend.services.detection_service import owl_predictions
+
+        image_feats, pred_boxes = self.embed_image(image)
+        query_embeds = np.stack([self.embed_text(label) for label in candidate_labels])[None]
+        scores = self.class_scores(image_feats, query_embeds)
+        return owl_predictions(scores, pred_boxes, candidate_labels, image.size, threshold,
+                               self.model_type == "owlv2")
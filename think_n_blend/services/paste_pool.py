@@ -0,0 +1,124 @@
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+from PIL import Image
+from think_n_blend.config import PASTE_WORKER_ATTACHED_IMAGES
+from think_n_blend.schemas import BoundingBox
+from think_n_blend.utils.image_utils import ImageContext, save_bounding_box_visualization
+from think_n_blend.services.simple_paste_service import object_paste_layer, text_paste_layer, render_layers
+
+@dataclass
+class SharedImageHandle:
+    """Picklable reference to a decoded RGB main image held in shared memory."""
+    name: str
+    path: str
+    size: Tuple[int, int]
+
+@dataclass
+class PasteTask:
+    output_path: str
+    layers: List[Tuple[str, str, BoundingBox]]  # ("object", crop path, box) or ("text", text, box)
+    visualizations: List[Tuple[BoundingBox, BoundingBox, str]] = field(default_factory=list)  # (reference, target, path)
+
+# Worker side: shared images this process has mapped, least recently used first
+_attached: "OrderedDict[str, Tuple[shared_memory.SharedMemory, Image.Image]]" = OrderedDict()
+
+def _attach(handle: SharedImageHandle) -> Image.Image:
+    """Maps a shared main image into this worker without copying or decoding it."""
+    if handle.name in _attached:
+        _attached.move_to_end(handle.name)
+        return _attached[handle.name][1]
+
+    shm = shared_memory.SharedMemory(name=handle.name)
+    image = Image.frombuffer('RGB', handle.size, shm.buf, 'raw', 'RGB', 0, 1)
+    _attached[handle.name] = (shm, image)
+    while len(_attached) > PASTE_WORKER_ATTACHED_IMAGES:
+        _, (old_shm, old_image) = _attached.popitem(last=False)
+        del old_image
+        old_shm.close()
+    return image
+
+def _render_task(handle: SharedImageHandle, task: PasteTask) -> str:
+    """Worker entry point: composites the task's layers onto the shared main image and saves it."""
+    context = ImageContext.from_image(handle.path, _attach(handle))
+    layers = [
+        object_paste_layer(subject, box) if kind == "object" else text_paste_layer(subject, box)
+        for kind, subject, box in task.layers
+    ]
+    render_layers(context, layers, task.output_path)
+    for reference_box, target_box, visualization_path in task.visualizations:
+        save_bounding_box_visualization(context, reference_box, target_box, visualization_path)
+    return task.output_path
+
+class PastePool:
+    """
+    Renders simple-paste jobs in worker processes. Each main image is decoded once in the
+    parent and copied into shared memory, where every job using it maps it by name.
+    """
+
+    def __init__(self, workers: int):
+        # Spawned rather than forked: the batch runner already has an event loop and thread pools running
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        # main image path -> (shared block, handle, jobs still using it)
+        self._shared: Dict[str, Tuple[shared_memory.SharedMemory, SharedImageHandle, int]] = {}
+        self._lock = threading.Lock()
+
+    def share(self, context: ImageContext) -> SharedImageHandle:
+        """
+        Holds the main image in shared memory, copying it there on first use; each call
+        must be matched by a release(). A caller holding it across jobs keeps it from being re-copied.
+        """
+        with self._lock:
+            if context.path in self._shared:
+                shm, handle, users = self._shared[context.path]
+                self._shared[context.path] = (shm, handle, users + 1)
+                return handle
+
+            image = context.image
+            pixels = image.tobytes()
+            shm = shared_memory.SharedMemory(create=True, size=len(pixels))
+            shm.buf[:len(pixels)] = pixels
+            handle = SharedImageHandle(name=shm.name, path=context.path, size=image.size)
+            self._shared[context.path] = (shm, handle, 1)
+            return handle
+
+    def release(self, path: str):
+        """Drops one hold on a shared main image, freeing the block with the last one."""
+        with self._lock:
+            shm, handle, users = self._shared[path]
+            if users > 1:
+                self._shared[path] = (shm, handle, users - 1)
+                return
+            del self._shared[path]
+        shm.close()
+        shm.unlink()
+
+    def submit(self, context: ImageContext, task: PasteTask) -> Future:
+        """
+        Queues a task on the main image. The pixels are in shared memory once this returns,
+        so the caller may release its context straight away. The future yields the output path.
+        """
+        handle = self.share(context)
+        future = self._executor.submit(_render_task, handle, task)
+        future.add_done_callback(lambda _: self.release(context.path))
+        return future
+
+    def shutdown(self):
+        """Waits for queued tasks and frees any shared images still held."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            remaining = list(self._shared.values())
+            self._shared.clear()
+        for shm, _, _ in remaining:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self) -> "PastePool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
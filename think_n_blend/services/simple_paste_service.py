@@ -1,14 +1,18 @@
 import os
-from typing import Tuple
-from PIL import Image, ImageDraw, ImageFont
+from typing import List, Optional, Tuple
+from PIL import Image
 from think_n_blend.schemas import InsertionResult
-from think_n_blend.utils.image_utils import create_mask_from_box
+from think_n_blend.utils.image_utils import create_mask_from_box, ImageSource, as_image_context
+from think_n_blend.services.compositing_service import PasteLayer, composite_layers
+from think_n_blend.services.font_service import draw_text_centered
 
 def resize_object_to_fit_box(object_image: Image.Image, target_box: Tuple[int, int, int, int]) -> Image.Image:
     """Resize object image to fit the target bounding box."""
     x1, y1, x2, y2 = target_box
     box_width = x2 - x1
     box_height = y2 - y1
+    if box_width <= 0 or box_height <= 0:
+        raise ValueError(f"Target box {target_box} has no area")
     
     # Resize object to fit the box while maintaining aspect ratio
     object_width, object_height = object_image.size
@@ -24,41 +28,65 @@ def resize_object_to_fit_box(object_image: Image.Image, target_box: Tuple[int, i
         new_height = box_height
         new_width = int(box_height * aspect_ratio)
     
-    return object_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return object_image.resize((max(1, new_width), max(1, new_height)), Image.Resampling.LANCZOS)
 
-def create_text_image_for_box(text: str, target_box: Tuple[int, int, int, int], font_size: int = 48, font_color: str = "white") -> Image.Image:
-    """Create a text image that fits the target bounding box with transparent background."""
+def create_text_image_for_box(text: str, target_box: Tuple[int, int, int, int], font_size: Optional[int] = None,
+                              font_color: str = "white") -> Image.Image:
+    """Create a text image that fits the target bounding box with transparent background, auto-fitting the font size unless one is given."""
     x1, y1, x2, y2 = target_box
     box_width = x2 - x1
     box_height = y2 - y1
     
     # Create transparent image the size of the target box
     text_image = Image.new('RGBA', (box_width, box_height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(text_image)
-    
-    # Try to use a default font, fallback to basic if not available
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
+    draw_text_centered(text_image, text, font_color, font_size)
+    return text_image
+
+def object_paste_layer(object_crop: ImageSource, target_box: Tuple[int, int, int, int]) -> PasteLayer:
+    """Builds a paste layer with the object resized and centered in the target box."""
+    with as_image_context(object_crop).open() as crop:
+        object_image = crop.convert('RGBA')
     
-    # Calculate text position to center it in the box
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width_actual = bbox[2] - bbox[0]
-    text_height_actual = bbox[3] - bbox[1]
+    # Resize object to fit the target box
+    resized_object = resize_object_to_fit_box(object_image, target_box)
     
-    # Center the text in the box
-    x = (box_width - text_width_actual) // 2
-    y = (box_height - text_height_actual) // 2
+    # Calculate paste position (center the object in the box)
+    x1, y1, x2, y2 = target_box
+    box_width = x2 - x1
+    box_height = y2 - y1
+    obj_width, obj_height = resized_object.size
     
-    # Draw text with specified color
-    draw.text((x, y), text, fill=font_color, font=font)
+    paste_x = x1 + (box_width - obj_width) // 2
+    paste_y = y1 + (box_height - obj_height) // 2
+    return PasteLayer(resized_object, (paste_x, paste_y))
+
+def text_paste_layer(text: str, target_box: Tuple[int, int, int, int], font_size: Optional[int] = None,
+                     font_color: str = "white") -> PasteLayer:
+    """Builds a paste layer with the text rendered over the target box."""
+    # Create text image that fits the target box with transparent background
+    text_image = create_text_image_for_box(text, target_box, font_size, font_color)
+    x1, y1, x2, y2 = target_box
+    return PasteLayer(text_image, (x1, y1), color_match=False)
+
+def composite_onto_copy(main_image: ImageSource, layers: List[PasteLayer]) -> Image.Image:
+    """Composites any number of layers onto one copy of the main image, in memory."""
+    # Copy the already decoded main image once; only the layer regions are blended
+    result = as_image_context(main_image).image.copy()
+    composite_layers(result, layers)
+    return result
+
+def render_layers(main_image: ImageSource, layers: List[PasteLayer], output_path: str) -> str:
+    """Composites any number of layers onto one copy of the main image and saves it."""
+    result = composite_onto_copy(main_image, layers)
     
-    return text_image
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    result.save(output_path, quality=95)
+    return output_path
 
 def simple_object_paste(
-    main_image_path: str,
-    object_crop_path: str,
+    main_image: ImageSource,
+    object_crop: ImageSource,
     target_box: Tuple[int, int, int, int],
     output_path: str = None,
 ) -> InsertionResult:
@@ -66,38 +94,10 @@ def simple_object_paste(
     Simple object pasting without diffusion model.
     """
     try:
-        # Load images
-        main_image = Image.open(main_image_path).convert('RGBA')
-        object_image = Image.open(object_crop_path).convert('RGBA')
-        
-        # Create a copy of the main image
-        result_image = main_image.copy()
-        
-        # Resize object to fit the target box
-        resized_object = resize_object_to_fit_box(object_image, target_box)
-        
-        # Calculate paste position (center the object in the box)
-        x1, y1, x2, y2 = target_box
-        box_width = x2 - x1
-        box_height = y2 - y1
-        obj_width, obj_height = resized_object.size
-        
-        paste_x = x1 + (box_width - obj_width) // 2
-        paste_y = y1 + (box_height - obj_height) // 2
-        
-        # Paste the object
-        result_image.paste(resized_object, (paste_x, paste_y), resized_object)
-        
-        # Save result
         if output_path is None:
             output_path = "output/simple_paste_result.jpg"
         
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Convert back to RGB for JPEG saving
-        result_image_rgb = result_image.convert('RGB')
-        result_image_rgb.save(output_path, quality=95)
+        render_layers(main_image, [object_paste_layer(object_crop, target_box)], output_path)
         
         return InsertionResult(
             success=True,
@@ -114,10 +114,10 @@ def simple_object_paste(
         )
 
 def simple_text_paste(
-    main_image_path: str,
+    main_image: ImageSource,
     text: str,
     target_box: Tuple[int, int, int, int],
-    font_size: int = 48,
+    font_size: Optional[int] = None,
     font_color: str = "white",
     background_color: str = None,
     output_path: str = None,
@@ -127,29 +127,10 @@ def simple_text_paste(
     Places text directly in the target bounding box with transparent background.
     """
     try:
-        # Load main image
-        main_image = Image.open(main_image_path).convert('RGBA')
-        
-        # Create text image that fits the target box with transparent background
-        text_image = create_text_image_for_box(text, target_box, font_size, font_color)
-        
-        # Create a copy of the main image
-        result_image = main_image.copy()
-        
-        # Paste the text at the target box position
-        x1, y1, x2, y2 = target_box
-        result_image.paste(text_image, (x1, y1), text_image)
-        
-        # Save result
         if output_path is None:
             output_path = f"output/simple_text_{text.replace(' ', '_')}.jpg"
         
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Convert back to RGB for JPEG saving
-        result_image_rgb = result_image.convert('RGB')
-        result_image_rgb.save(output_path, quality=95)
+        render_layers(main_image, [text_paste_layer(text, target_box, font_size, font_color)], output_path)
         
         return InsertionResult(
             success=True,
@@ -163,4 +144,4 @@ def simple_text_paste(
             success=False,
             output_path="",
             error_message=f"Simple text pasting failed: {str(e)}"
-        ) 
\ No newline at end of file
+        )
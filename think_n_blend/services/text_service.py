@@ -1,40 +1,28 @@
 import os
 import json
-from typing import Tuple
-from PIL import Image, ImageDraw, ImageFont
+import shutil
+from typing import Optional, Tuple
+from PIL import Image
 from think_n_blend.schemas import TextInsertion, InsertionResult
-from think_n_blend.utils.image_utils import create_mask_from_box
+from think_n_blend.utils.image_utils import create_mask_from_box, ImageSource, as_image_context
+from think_n_blend.utils.metrics import metrics
 from think_n_blend.services.model_manager import model_manager
+from think_n_blend.services.font_service import draw_text_centered
 from think_n_blend.services.simple_paste_service import simple_text_paste
 
-def create_text_image(text: str, font_size: int = 48, font_color: str = "white", 
+def create_text_image(text: str, font_size: Optional[int] = None, font_color: str = "white",
                      background_color: str = "black", size: Tuple[int, int] = (512, 128), output_dir: str = "output") -> str:
-    """Creates a text image for insertion."""
+    """Creates a text image for insertion. Without a font_size, the text is fitted to the image."""
     image = Image.new('RGB', size, background_color)
-    draw = ImageDraw.Draw(image)
-    
-    # Try to use a default font, fallback to basic if not available
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-    
-    # Calculate text position to center it
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-    
-    x = (size[0] - text_width) // 2
-    y = (size[1] - text_height) // 2
-    
-    draw.text((x, y), text, fill=font_color, font=font)
+    draw_text_centered(image, text, font_color, font_size)
     
     output_path = os.path.join(output_dir, f"text_{text.replace(' ', '_')}.png")
     image.save(output_path)
     return output_path
 
+@metrics.timed("blending")
 def insert_text_with_unicombine(
-    main_image_path: str,
+    main_image: ImageSource,
     text: str,
     target_box: Tuple[int, int, int, int],
     diffusion_model: str = "unicombine",
@@ -49,10 +37,10 @@ def insert_text_with_unicombine(
     if model_manager.is_simple_paste_model(diffusion_model):
         print("Using simple paste mode for text (no diffusion model required)")
         result = simple_text_paste(
-            main_image_path,
+            main_image,
             text,
             target_box,
-            48,  # default font size
+            None,  # fit the font size to the box
             "white",  # default font color
             None,  # transparent background
             os.path.join(output_dir, f"simple_text_{text.replace(' ', '_')}.jpg")
@@ -68,9 +56,10 @@ def insert_text_with_unicombine(
         )
 
     # Create text image
+    os.makedirs(output_dir, exist_ok=True)
     text_image_path = create_text_image(
         text,
-        48,  # default font size
+        None,  # fit the font size to the text image
         "white",  # default font color
         "black",  # default background
         (512, 128),  # default size
@@ -78,7 +67,7 @@ def insert_text_with_unicombine(
     )
     
     # Create mask for the insertion area
-    mask_path = create_mask_from_box(main_image_path, target_box, os.path.join(output_dir, "text_mask.png"))
+    mask_path = create_mask_from_box(main_image, target_box, os.path.join(output_dir, "text_mask.png"))
     
     # Create UniCombine JSON data
     unicombine_json_data = {
@@ -91,42 +80,29 @@ def insert_text_with_unicombine(
     with open(unicombine_json_path, 'w') as f:
         json.dump(unicombine_json_data, f)
 
-    # Get inference command from model manager
-    command = model_manager.get_inference_command(
+    # Run the job on the persistent inference worker, writing into a private scratch directory
+    inference_output_dir = os.path.join(output_dir, "unicombine_text_output")
+    shutil.rmtree(inference_output_dir, ignore_errors=True)
+    output_file = model_manager.run_inference(
         diffusion_model,
-        main_image_path=main_image_path,
+        main_image_path=as_image_context(main_image).ensure_file(output_dir, "main_image"),
         object_crop_path=text_image_path,
         json_path=unicombine_json_path,
-        output_dir=output_dir
+        output_dir=inference_output_dir
     )
-
-    try:
-        import subprocess
-        subprocess.run(command, check=True)
-        
-        output_files = [os.path.join(output_dir, f) for f in os.listdir(output_dir) 
-                       if f.endswith(('.jpg', '.png')) and "mask" not in f and "visualization" not in f]
-        if not output_files:
-            return InsertionResult(
-                success=False,
-                output_path="",
-                error_message="No output image found from diffusion model"
-            )
-            
-        latest_file = max(output_files, key=os.path.getctime)
-        final_image_path = os.path.join(output_dir, f"text_inserted_{text.replace(' ', '_')}.jpg")
-        os.rename(latest_file, final_image_path)
-        
-        return InsertionResult(
-            success=True,
-            output_path=final_image_path,
-            bounding_box=target_box,
-            confidence_score=0.8  # Placeholder confidence
-        )
-
-    except subprocess.CalledProcessError as e:
+    if not output_file:
         return InsertionResult(
             success=False,
             output_path="",
-            error_message=f"Error during {diffusion_model} execution: {e}"
-        ) 
\ No newline at end of file
+            error_message=f"Error during {diffusion_model} execution: no output image found"
+        )
+
+    final_image_path = os.path.join(output_dir, f"text_inserted_{text.replace(' ', '_')}.jpg")
+    os.replace(output_file, final_image_path)
+    
+    return InsertionResult(
+        success=True,
+        output_path=final_image_path,
+        bounding_box=target_box,
+        confidence_score=0.8  # Placeholder confidence
+    )
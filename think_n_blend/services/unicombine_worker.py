@@ -0,0 +1,264 @@
+"""
+Persistent UniCombine inference worker.
+
+The worker runs UniCombine's inference script inside one long-lived Python
+process so FLUX and the LoRA weights are loaded from disk only once. Jobs are
+exchanged with the client as JSON lines over the worker's stdin/stdout pipes.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import runpy
+import importlib
+import argparse
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+from think_n_blend.config import UNICOMBINE_CACHED_CLASSES
+
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+
+def _cache_key(*values: Any) -> tuple:
+    """Builds a hashable key, identifying non-primitive values (models, dtypes) by identity."""
+    key = []
+    for value in values:
+        if isinstance(value, (str, int, float, bool, type(None))):
+            key.append(value)
+        elif isinstance(value, (list, tuple)):
+            key.append(_cache_key(*value))
+        elif isinstance(value, dict):
+            key.append(_cache_key(*sorted(value.items(), key=lambda item: item[0])))
+        else:
+            key.append(("id", id(value)))
+    return tuple(key)
+
+def _install_weight_cache(class_names: List[str]):
+    """
+    Memoizes weight loading on the named classes ("module.Class") so repeated inference runs
+    reuse resident models. Called only in the worker process; other classes are left alone.
+    """
+    cache: Dict[tuple, Any] = {}
+
+    def memoize_classmethod(cls, name: str):
+        func = getattr(cls, name).__func__
+
+        def cached(klass, *args, **kwargs):
+            key = _cache_key(klass.__module__, klass.__qualname__, name, args, kwargs)
+            if key not in cache:
+                cache[key] = func(klass, *args, **kwargs)
+            return cache[key]
+
+        setattr(cls, name, classmethod(cached))
+
+    def memoize_method(cls, name: str):
+        func = getattr(cls, name)
+
+        def cached(self, *args, **kwargs):
+            # Keyed on every argument, so another weight file or adapter name is still loaded
+            key = _cache_key(id(self), name, args, kwargs)
+            if key not in cache:
+                cache[key] = func(self, *args, **kwargs)
+            return cache[key]
+
+        setattr(cls, name, cached)
+
+    for class_name in class_names:
+        module_name, _, attr = class_name.rpartition(".")
+        try:
+            cls = getattr(importlib.import_module(module_name), attr)
+        except (ImportError, AttributeError) as e:
+            print(f"Not caching weights of {class_name}: {e}", file=sys.stderr)
+            continue
+        memoize_classmethod(cls, "from_pretrained")
+        if hasattr(cls, "load_lora_weights"):
+            memoize_method(cls, "load_lora_weights")
+
+def _list_outputs(output_dir: str) -> Dict[str, float]:
+    """Lists candidate output images in a directory with their modification times."""
+    if not os.path.isdir(output_dir):
+        return {}
+    return {
+        os.path.join(output_dir, f): os.path.getmtime(os.path.join(output_dir, f))
+        for f in os.listdir(output_dir)
+        if f.endswith(IMAGE_EXTENSIONS) and "mask" not in f and "visualization" not in f
+    }
+
+def _run_job(inference_script: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one inference job in-process and reports the image it produced."""
+    output_dir = job["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+    before = _list_outputs(output_dir)
+
+    saved_argv = sys.argv
+    sys.argv = [inference_script] + list(job["args"])
+    try:
+        runpy.run_path(inference_script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            return {"id": job["id"], "success": False, "error": f"Inference exited with code {e.code}"}
+    except Exception as e:
+        return {"id": job["id"], "success": False, "error": f"Inference failed: {e}"}
+    finally:
+        sys.argv = saved_argv
+
+    after = _list_outputs(output_dir)
+    produced = [path for path, mtime in after.items() if before.get(path) != mtime]
+    if not produced:
+        return {"id": job["id"], "success": False, "error": "No output image found from diffusion model"}
+
+    return {"id": job["id"], "success": True, "output_path": max(produced, key=after.get)}
+
+def serve(model_path: str, inference_script: str, cached_classes: List[str]):
+    """Serves inference jobs read from stdin until it is closed."""
+    # Keep the protocol channel private and send everything the model prints to stderr
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    sys.path.insert(0, os.path.abspath(model_path))
+    _install_weight_cache(cached_classes)
+    inference_script = os.path.abspath(os.path.join(model_path, inference_script))
+
+    protocol_out.write(json.dumps({"ready": True}) + "\n")
+    protocol_out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        response = _run_job(inference_script, job)
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+class UniCombineWorkerClient:
+    """Starts and talks to a persistent UniCombine worker process."""
+
+    def __init__(self, model_path: str, inference_script: str,
+                 job_timeout: Optional[float] = None, startup_timeout: Optional[float] = None):
+        """Timeouts are in seconds; a worker that exceeds one is killed and restarted for the next job."""
+        self.model_path = model_path
+        self.inference_script = inference_script
+        self.job_timeout = job_timeout
+        self.startup_timeout = startup_timeout
+        self._process: Optional[subprocess.Popen] = None
+        self._messages: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._next_job_id = 0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def run(self, args: List[str], output_dir: str) -> str | None:
+        """Submits an inference job and returns the path of the generated image."""
+        with self._lock:
+            try:
+                process = self._ensure_started()
+                self._next_job_id += 1
+                job = {"id": self._next_job_id, "args": args, "output_dir": output_dir}
+                process.stdin.write(json.dumps(job) + "\n")
+                process.stdin.flush()
+                response = self._read_message(self.job_timeout)
+            except (OSError, RuntimeError, ValueError) as e:
+                # Also covers timeouts and non-protocol lines; the stream is out of sync either way
+                print(f"Error communicating with UniCombine worker: {e}")
+                self._terminate()
+                return None
+
+        if not response.get("success"):
+            print(f"Error during UniCombine execution: {response.get('error')}")
+            return None
+        return response["output_path"]
+
+    def start(self):
+        """Starts the worker now instead of on the first job, so that job does not wait for model loading."""
+        with self._lock:
+            self._ensure_started()
+
+    def is_running(self) -> bool:
+        """Check if the worker process is alive."""
+        return self._process is not None and self._process.poll() is None
+
+    def close(self):
+        """Stops the worker process, letting it finish the current job."""
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+            self._process.wait(timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            self._terminate()
+        self._process = None
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self.is_running():
+            return self._process
+
+        print("Starting UniCombine worker (loading model weights once)...")
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "think_n_blend.services.unicombine_worker",
+                "--model_path", self.model_path,
+                "--inference_script", self.inference_script,
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        # Lines are read on a thread so a hung worker can be timed out
+        self._messages = queue.Queue()
+        threading.Thread(
+            target=self._pump, args=(self._process, self._messages), name="unicombine-worker-reader", daemon=True
+        ).start()
+        try:
+            if not self._read_message(self.startup_timeout).get("ready"):
+                raise RuntimeError("UniCombine worker failed to start")
+        except (OSError, RuntimeError, ValueError):
+            self._terminate()
+            raise
+        return self._process
+
+    @staticmethod
+    def _pump(process: subprocess.Popen, messages: "queue.Queue[Optional[str]]"):
+        """Forwards the worker's protocol lines, then None once it exits."""
+        try:
+            for line in process.stdout:
+                messages.put(line)
+        except (OSError, ValueError):
+            pass
+        messages.put(None)
+
+    def _read_message(self, timeout: Optional[float]) -> Dict[str, Any]:
+        try:
+            line = self._messages.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"UniCombine worker did not answer within {timeout:.0f}s")
+        if line is None:
+            raise RuntimeError(f"UniCombine worker exited with code {self._process.poll()}")
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError(f"Unexpected line from UniCombine worker: {line.strip()!r}")
+        return message
+
+    def _terminate(self):
+        if self._process is not None:
+            self._process.kill()
+            try:
+                # Reap it, or every timed-out worker stays behind as a zombie
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                print("UniCombine worker did not exit after being killed")
+            self._process = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent UniCombine inference worker")
+    parser.add_argument("--model_path", type=str, required=True,
+                       help="Path to the UniCombine repository.")
+    parser.add_argument("--inference_script", type=str, default="inference.py",
+                       help="Inference script inside the UniCombine repository.")
+    parser.add_argument("--cached_classes", type=str, nargs="*", default=UNICOMBINE_CACHED_CLASSES,
+                       help="Classes (module.Class) whose loaded weights are kept between jobs.")
+    args = parser.parse_args()
+    serve(args.model_path, args.inference_script, args.cached_classes)
+
+if __name__ == "__main__":
+    main()
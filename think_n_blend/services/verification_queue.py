@@ -0,0 +1,141 @@
+import os
+import json
+import queue
+import threading
+from dataclasses import asdict
+from typing import Any, Callable, List, Tuple
+from think_n_blend.config import (
+    VERIFICATION_CHECKS_FILE, DEFAULT_VERIFICATION_WORKERS, DEFAULT_VERIFICATION_BATCH_SIZE
+)
+from think_n_blend.schemas import PlannedInsertion, VerificationCheck, VerificationResult
+from think_n_blend.services import verification_service
+from think_n_blend.utils.image_utils import ImageContext
+from think_n_blend.utils.metrics import metrics
+
+def planned_checks(planned: List[PlannedInsertion]) -> List[VerificationCheck]:
+    """One check per planned insertion: its object label or text, within its target box."""
+    return [
+        VerificationCheck(
+            insertion.spec.kind,
+            insertion.vision_response.target_object.label if insertion.spec.kind == "object" else insertion.spec.text,
+            insertion.target_box,
+        )
+        for insertion in planned
+    ]
+
+def save_checks(output_dir: str, checks: List[VerificationCheck]) -> str:
+    """Saves a job's checks next to its outputs, so the job can be verified later."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, VERIFICATION_CHECKS_FILE)
+    with open(path, 'w') as f:
+        json.dump([asdict(check) for check in checks], f, indent=2)
+    return path
+
+def load_checks(output_dir: str) -> List[VerificationCheck]:
+    """Reads the checks a job saved in its output directory."""
+    with open(os.path.join(output_dir, VERIFICATION_CHECKS_FILE)) as f:
+        return [
+            VerificationCheck(check['kind'], check['expected'],
+                              tuple(check['target_box']) if check['target_box'] else None)
+            for check in json.load(f)
+        ]
+
+class VerificationQueue:
+    """
+    Verifies finished outputs in background threads, so blending never waits on the detector
+    or OCR. Each submitted output is checked against the checks saved in its job directory,
+    and on_result(key, results) is called from a worker thread once all of them have run.
+    """
+
+    def __init__(self, on_result: Callable[[Any, List[VerificationResult]], None],
+                 workers: int = DEFAULT_VERIFICATION_WORKERS,
+                 batch_size: int = DEFAULT_VERIFICATION_BATCH_SIZE):
+        self.on_result = on_result
+        self.batch_size = max(1, batch_size)
+        # Unbounded: a queued output is only a few strings, and submitting must never block blending
+        self._queue: "queue.Queue[Tuple[Any, str, str] | None]" = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"verification-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: Any, output_path: str, output_dir: str):
+        """Queues a finished output for verification; key is handed back to on_result."""
+        self._queue.put((key, output_path, output_dir))
+
+    def close(self):
+        """Waits for every queued output to be verified, then stops the workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> "VerificationQueue":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next_batch(self) -> Tuple[List[Tuple[Any, str, str]], bool]:
+        """Blocks for one output, then takes whatever else is queued up to batch_size. Also reports a stop."""
+        task = self._queue.get()
+        if task is None:
+            return [], True
+        batch = [task]
+        while len(batch) < self.batch_size:
+            try:
+                task = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                return batch, True
+            batch.append(task)
+        return batch, False
+
+    def _work(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._verify(batch)
+
+    def _verify(self, batch: List[Tuple[Any, str, str]]):
+        # Each output is decoded once and shared by all of its checks
+        contexts, checks, owners, failures = [], [], [], {}
+        for index, (_, output_path, output_dir) in enumerate(batch):
+            try:
+                job_checks = load_checks(output_dir)
+            except Exception as e:
+                failures[index] = str(e)
+                continue
+            context = ImageContext(output_path)
+            contexts.append(context)
+            checks += [(context, check) for check in job_checks]
+            owners += [index] * len(job_checks)
+
+        try:
+            results = verification_service.verify_batch(checks)
+        except Exception as e:
+            results = [VerificationResult(object_detected=False, text_detected=False, error_message=str(e))
+                       for _ in checks]
+        finally:
+            for context in contexts:
+                context.release()
+
+        per_job = {index: [] for index in range(len(batch))}
+        for index, (_, check), result in zip(owners, checks, results):
+            metrics.increment("verification_checks_total", kind=check.kind,
+                              status="passed" if result.passed else "failed")
+            per_job[index].append(result)
+
+        for index, (key, output_path, _) in enumerate(batch):
+            if index in failures:
+                print(f"Could not verify {output_path}: {failures[index]}")
+                per_job[index] = [VerificationResult(object_detected=False, text_detected=False,
+                                                     error_message=failures[index])]
+            try:
+                self.on_result(key, per_job[index])
+            except Exception as e:
+                print(f"Error recording verification of {output_path}: {e}")
@@ -1,32 +1,84 @@
-from transformers import pipeline
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+import numpy as np
 from PIL import Image
-import easyocr
-from think_n_blend.schemas import VerificationResult
+from think_n_blend.config import (
+    VERIFICATION_REGION_OF_INTEREST, VERIFICATION_ROI_MARGIN,
+    VERIFICATION_OBJECT_MIN_SCORE, VERIFICATION_TEXT_MIN_SIMILARITY
+)
+from think_n_blend.schemas import BoundingBox, VerificationCheck, VerificationResult
+from think_n_blend.services.model_manager import model_manager
+from think_n_blend.utils.image_utils import ImageSource, ImageContext, as_image_context
+from think_n_blend.utils.metrics import metrics
 
-def verify_object_insertion(image_path: str, expected_object: str) -> VerificationResult:
+def _normalize_text(text: str) -> str:
+    """Lowercases and drops everything but letters and digits; OCR spacing and punctuation are unreliable."""
+    return re.sub(r"[\W_]+", "", text.lower())
+
+def text_similarity(expected: str, detected: str) -> float:
     """
-    Verifies that an object was successfully inserted using object detection.
+    0..1 similarity between the expected text and its best-matching stretch of the
+    detected text, ignoring case, spacing and punctuation.
+    """
+    expected, detected = _normalize_text(expected), _normalize_text(detected)
+    if not expected or not detected:
+        return 0.0
+    if expected in detected:
+        return 1.0
+    best = SequenceMatcher(None, expected, detected).ratio()
+    # Detected text may hold more than the insertion, e.g. scene text inside the margin
+    for start in range(len(detected) - len(expected) + 1):
+        best = max(best, SequenceMatcher(None, expected, detected[start:start + len(expected)]).ratio())
+    return best
+
+def _region(context: ImageContext, target_box: Optional[BoundingBox],
+            margin: float) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+    """Crops the target box plus a margin and returns it with its offset, or None to use the whole image."""
+    if target_box is None or not VERIFICATION_REGION_OF_INTEREST:
+        return None
+    x1, y1, x2, y2 = target_box
+    width, height = context.size
+    pad = int(round(max(x2 - x1, y2 - y1) * margin))
+    left, top = max(0, x1 - pad), max(0, y1 - pad)
+    right, bottom = min(width, x2 + pad), min(height, y2 + pad)
+    if right <= left or bottom <= top:
+        return None
+    return context.image.crop((left, top, right, bottom)), (left, top)
+
+def _object_result(predictions, offset: Tuple[int, int]) -> VerificationResult:
+    """Scores the detector's predictions for one region, reporting boxes in full-image coordinates."""
+    if not predictions:
+        return VerificationResult(
+            object_detected=False,
+            text_detected=False,
+            object_confidence=0.0
+        )
+    best_prediction = max(predictions, key=lambda x: x['score'])
+    left, top = offset
+    box = best_prediction['box']
+    best_prediction = {**best_prediction, 'box': {
+        'xmin': box['xmin'] + left, 'ymin': box['ymin'] + top,
+        'xmax': box['xmax'] + left, 'ymax': box['ymax'] + top,
+    }}
+    return VerificationResult(
+        object_detected=best_prediction['score'] > VERIFICATION_OBJECT_MIN_SCORE,
+        text_detected=False,
+        object_confidence=best_prediction['score'],
+        detected_objects=[best_prediction]
+    )
+
+def verify_object_insertion(image: ImageSource, expected_object: str, target_box: Optional[BoundingBox] = None,
+                            margin: float = VERIFICATION_ROI_MARGIN) -> VerificationResult:
+    """
+    Verifies that an object was successfully inserted using object detection. With a
+    target_box, only that region (plus a margin) is searched.
     """
     try:
-        detector = pipeline(model="google/owlv2-base-patch16-ensemble", task="zero-shot-object-detection")
-        image = Image.open(image_path)
-        
-        predictions = detector(image, candidate_labels=[expected_object])
-        
-        if predictions:
-            best_prediction = max(predictions, key=lambda x: x['score'])
-            return VerificationResult(
-                object_detected=best_prediction['score'] > 0.5,
-                text_detected=False,
-                object_confidence=best_prediction['score'],
-                detected_objects=[best_prediction]
-            )
-        else:
-            return VerificationResult(
-                object_detected=False,
-                text_detected=False,
-                object_confidence=0.0
-            )
+        detector = model_manager.get_object_detector()
+        context = as_image_context(image)
+        region, offset = _region(context, target_box, margin) or (context.image, (0, 0))
+        return _object_result(detector(region, candidate_labels=[expected_object]), offset)
     except Exception as e:
         return VerificationResult(
             object_detected=False,
@@ -34,34 +86,58 @@ def verify_object_insertion(image_path: str, expected_object: str) -> Verificati
             error_message=str(e)
         )
 
-def verify_text_insertion(image_path: str, expected_text: str) -> VerificationResult:
+def _read_text(reader, region: Image.Image, cropped: bool, expected_text: str):
+    """
+    OCR readings of a region. A cropped target box holds one line of text, so recognition
+    runs on it directly; full detection runs only if that reading does not match, and the
+    closer of the two readings is kept.
     """
-    Verifies that text was successfully inserted using OCR.
+    pixels = np.asarray(region)
+    if not cropped:
+        return reader.readtext(pixels)
+
+    def score(results):
+        return text_similarity(expected_text, " ".join(text for _, text, _ in results))
+
+    recognized = reader.recognize(pixels)
+    if score(recognized) >= VERIFICATION_TEXT_MIN_SIMILARITY:
+        return recognized
+    return max([recognized, reader.readtext(pixels)], key=score)
+
+def verify_text_insertion(image: ImageSource, expected_text: str, target_box: Optional[BoundingBox] = None,
+                          margin: float = VERIFICATION_ROI_MARGIN) -> VerificationResult:
+    """
+    Verifies that text was successfully inserted using OCR, matching it fuzzily. With a
+    target_box, only that region (plus a margin) is read.
     """
     try:
-        # Initialize EasyOCR
-        reader = easyocr.Reader(['en'])
-        
-        # Read the image
-        results = reader.readtext(image_path)
-        
+        # Get the shared EasyOCR reader
+        reader = model_manager.get_ocr_reader()
+
+        context = as_image_context(image)
+        roi = _region(context, target_box, margin)
+        region, (left, top) = roi or (context.image, (0, 0))
+        results = _read_text(reader, region, roi is not None, expected_text)
+
         detected_texts = []
         for (bbox, text, confidence) in results:
             detected_texts.append({
                 'text': text,
                 'confidence': confidence,
-                'bbox': bbox
+                'bbox': [[x + left, y + top] for x, y in bbox]
             })
-        
+
         # Check if expected text is found
-        text_found = any(expected_text.lower() in text['text'].lower() for text in detected_texts)
+        detected_text = " ".join([text['text'] for text in detected_texts])
+        similarity = text_similarity(expected_text, detected_text)
         max_confidence = max([text['confidence'] for text in detected_texts]) if detected_texts else 0.0
-        
+
         return VerificationResult(
             object_detected=False,
-            text_detected=text_found,
+            text_detected=similarity >= VERIFICATION_TEXT_MIN_SIMILARITY,
             text_confidence=max_confidence,
-            detected_text=" ".join([text['text'] for text in detected_texts])
+            detected_text=detected_text,
+            text_similarity=similarity
         )
     except Exception as e:
         return VerificationResult(
@@ -70,13 +146,53 @@ def verify_text_insertion(image_path: str, expected_text: str) -> VerificationRe
             error_message=str(e)
         )
 
-def verify_insertion_quality(image_path: str, insertion_type: str, expected_content: str) -> VerificationResult:
+@metrics.timed("verification")
+def verify_insertion_quality(image: ImageSource, insertion_type: str, expected_content: str,
+                             target_box: Optional[BoundingBox] = None) -> VerificationResult:
     """
-    Verifies the quality of an insertion based on type.
+    Verifies the quality of an insertion based on type, within the target box when it is given.
     """
     if insertion_type == "object":
-        return verify_object_insertion(image_path, expected_content)
+        return verify_object_insertion(image, expected_content, target_box)
     elif insertion_type == "text":
-        return verify_text_insertion(image_path, expected_content)
+        return verify_text_insertion(image, expected_content, target_box)
     else:
-        raise ValueError(f"Unknown insertion type: {insertion_type}") 
\ No newline at end of file
+        raise ValueError(f"Unknown insertion type: {insertion_type}")
+
+@metrics.timed("verification")
+def verify_batch(checks: List[Tuple[ImageSource, VerificationCheck]]) -> List[VerificationResult]:
+    """
+    Verifies several (image, check) pairs, in order. Object checks go to the detector as one
+    batched call when it is a transformers pipeline; text checks are read one by one.
+    """
+    results: List[Optional[VerificationResult]] = [None] * len(checks)
+    objects = []
+    for index, (image, check) in enumerate(checks):
+        if check.kind == "text":
+            results[index] = verify_text_insertion(image, check.expected, check.target_box)
+        elif check.kind == "object":
+            objects.append((index, image, check))
+        else:
+            raise ValueError(f"Unknown insertion type: {check.kind}")
+
+    detector = model_manager.get_object_detector() if len(objects) > 1 else None
+    if getattr(detector, "model", None) is None:
+        for index, image, check in objects:
+            results[index] = verify_object_insertion(image, check.expected, check.target_box)
+        return results
+
+    try:
+        regions = []
+        for _, image, check in objects:
+            context = as_image_context(image)
+            regions.append(_region(context, check.target_box, VERIFICATION_ROI_MARGIN) or (context.image, (0, 0)))
+        batched = detector(
+            [{"image": region, "candidate_labels": [check.expected]} for (region, _), (_, _, check) in zip(regions, objects)],
+            batch_size=len(objects),
+        )
+        for (index, _, _), (_, offset), predictions in zip(objects, regions, batched):
+            results[index] = _object_result(predictions, offset)
+    except Exception as e:
+        for index, _, _ in objects:
+            results[index] = VerificationResult(object_detected=False, text_detected=False, error_message=str(e))
+    return results
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Any, Optional, List
+from think_n_blend.config import VISION_CACHE_ENABLED, VISION_CACHE_DIR, VISION_CACHE_MAX_SIZE_MB
+from think_n_blend.utils.image_utils import ImageSource, as_image_context
+
+class VisionCache:
+    """Content-addressed on-disk cache for GPT-4 Vision reasoning results."""
+
+    def __init__(self, cache_dir: str = VISION_CACHE_DIR, max_size_mb: int = VISION_CACHE_MAX_SIZE_MB,
+                 enabled: bool = VISION_CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def make_key(self, model: str, prompt_template: str, images: List[ImageSource], text: str = "",
+                 options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Hash the model, prompt template, text, image bytes and request options into a cache key.
+        Options are anything else that changes the reply, such as upload encoding or the response schema.
+        """
+        digest = hashlib.sha256()
+        for part in (model, prompt_template, text, json.dumps(options or {}, sort_keys=True)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        for image in images:
+            digest.update(bytes.fromhex(as_image_context(image).content_hash))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached entry, or None on a miss or when the cache is disabled."""
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry and evict the least-recently-used entries above the size limit."""
+        if not self.enabled:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def clear(self) -> int:
+        """Delete every cached entry and return how many were removed."""
+        removed = 0
+        with self._lock:
+            for path in self._entry_paths():
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def set_enabled(self, enabled: bool):
+        """Enable or bypass the cache."""
+        self.enabled = enabled
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _entry_paths(self) -> List[str]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith(".json")]
+
+    def _evict(self):
+        max_size = self.max_size_mb * 1024 * 1024
+        with self._lock:
+            entries = []
+            for path in self._entry_paths():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= max_size:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except OSError:
+                    pass
+
+# Global vision cache instance
+vision_cache = VisionCache()
@@ -1,130 +1,367 @@
 import os
 import json
-from openai import OpenAI
-from think_n_blend.config import GPT4_VISION_PROMPT, GPT4_TEXT_VISION_PROMPT, GPT4_VISION_MODEL
-from think_n_blend.schemas import Gpt4VisionResponse, ReferenceObject, TargetObject
-from think_n_blend.utils.image_utils import encode_image
+from dataclasses import fields
+from typing import List, TYPE_CHECKING
+from think_n_blend.config import (
+    GPT4_VISION_PROMPT, GPT4_TEXT_VISION_PROMPT, GPT4_MULTI_VISION_PROMPT, GPT4_VISION_MODEL,
+    VISION_STRUCTURED_OUTPUT, VISION_MAX_REPAIR_ATTEMPTS, VISION_MAX_IMAGE_SIDE, VISION_IMAGE_FORMAT,
+    VISION_IMAGE_QUALITY
+)
+from think_n_blend.schemas import (
+    Gpt4VisionResponse, ReferenceObject, TargetObject, InsertionSpec, MultiInsertionResponse
+)
+from think_n_blend.utils.image_utils import encode_image_for_upload, ImageSource, as_image_context
+from think_n_blend.utils.metrics import metrics
+from think_n_blend.utils.schema_utils import dataclass_json_schema, schema_issues, subset_json_schema, merge_json
+from think_n_blend.services.vision_cache import vision_cache
 
-def get_vision_reasoning(main_image_path: str, object_crop_path: str, output_dir: str = "output") -> Gpt4VisionResponse:
-    """
-    Analyzes the main image and object crop to determine a realistic placement for the object.
-    """
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
-    main_image_b64 = encode_image(main_image_path)
-    object_crop_b64 = encode_image(object_crop_path)
-
-    response = client.chat.completions.create(
-        model=GPT4_VISION_MODEL,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": GPT4_VISION_PROMPT},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{main_image_b64}"}},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{object_crop_b64}"}},
-                ],
-            }
-        ],
-        max_tokens=500,
-    )
+if TYPE_CHECKING:
+    # openai takes about a second to import; it is loaded on the first request instead
+    from openai import OpenAI, AsyncOpenAI
 
-    response_text = response.choices[0].message.content
-
-    # Save the full GPT API response
-    full_response_data = {
-        "raw_response": response_text,
-        "model": GPT4_VISION_MODEL,
-        "usage": response.usage.dict() if response.usage else None,
-        "completion_tokens": response.usage.completion_tokens if response.usage else None,
-        "prompt_tokens": response.usage.prompt_tokens if response.usage else None,
-        "total_tokens": response.usage.total_tokens if response.usage else None
-    }
-    
-    os.makedirs(output_dir, exist_ok=True)
-    with open(os.path.join(output_dir, 'gpt_full_response.json'), 'w') as f:
-        json.dump(full_response_data, f, indent=2)
+VISION_RESPONSE_SCHEMA = dataclass_json_schema(Gpt4VisionResponse)
+MULTI_VISION_RESPONSE_SCHEMA = dataclass_json_schema(MultiInsertionResponse)
 
+def _parse_vision_json(response_text: str) -> dict:
+    """Extracts the JSON reasoning block from a GPT-4 Vision reply."""
     try:
         json_response_string = response_text.split('```json')[1].split('```')[0].strip()
-        data = json.loads(json_response_string)
+        return json.loads(json_response_string)
     except (IndexError, json.JSONDecodeError) as e:
         print(f"Error parsing JSON from response: {e}")
         print(f"Raw response: {response_text}")
         try:
-            data = json.loads(response_text)
+            return json.loads(response_text)
         except json.JSONDecodeError:
             print("Fallback JSON parsing failed. Raising exception.")
             raise ValueError("Invalid JSON response from GPT-4 Vision") from e
 
-    # Save the parsed vision reasoning data
-    with open(os.path.join(output_dir, 'object_vision_reasoning.json'), 'w') as f:
+def _save_json(data: dict, output_dir: str | None, filename: str):
+    """Writes a JSON artifact into the output directory, unless there is none."""
+    if output_dir is None:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, filename), 'w') as f:
         json.dump(data, f, indent=2)
-    
-    return Gpt4VisionResponse(
-        reference_object=ReferenceObject(**data["reference_object"]),
-        target_object=TargetObject(**data["target_object"]),
-    )
 
-def get_text_vision_reasoning(main_image_path: str, text: str, output_dir: str = "output") -> Gpt4VisionResponse:
-    """
-    Analyzes the main image and text to determine a realistic placement for the text.
-    """
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def _cache_key(prompt_template: str, images: list, text: str, schema: dict) -> str:
+    """Keys a request on its inputs plus the upload encoding and reply format, which all change the answer."""
+    return vision_cache.make_key(GPT4_VISION_MODEL, prompt_template, images, text, {
+        "max_image_side": VISION_MAX_IMAGE_SIDE,
+        "image_format": VISION_IMAGE_FORMAT,
+        "image_quality": VISION_IMAGE_QUALITY,
+        "structured_output": VISION_STRUCTURED_OUTPUT,
+        "schema": schema,
+    })
+
+def _object_request(main_image: ImageSource, object_crop: ImageSource) -> dict:
+    """Describes the GPT-4 Vision request for object placement."""
+    images = [as_image_context(main_image), as_image_context(object_crop)]
+    return {
+        "cache_key": _cache_key(GPT4_VISION_PROMPT, images, "", VISION_RESPONSE_SCHEMA),
+        "prompt": GPT4_VISION_PROMPT,
+        "images": images,
+        "extra_response_data": {},
+        "response_filename": 'gpt_full_response.json',
+        "reasoning_filename": 'object_vision_reasoning.json',
+        "schema": VISION_RESPONSE_SCHEMA,
+        "build": _placement_from_json,
+    }
+
+def _text_request(main_image: ImageSource, text: str) -> dict:
+    """Describes the GPT-4 Vision request for text placement."""
+    images = [as_image_context(main_image)]
+    return {
+        "cache_key": _cache_key(GPT4_TEXT_VISION_PROMPT, images, text, VISION_RESPONSE_SCHEMA),
+        # Use the text vision prompt from config
+        "prompt": GPT4_TEXT_VISION_PROMPT.format(text=text),
+        "images": images,
+        "extra_response_data": {"text_to_insert": text},
+        "response_filename": 'gpt_text_full_response.json',
+        "reasoning_filename": 'text_vision_reasoning.json',
+        "schema": VISION_RESPONSE_SCHEMA,
+        "build": _placement_from_json,
+    }
+
+def _describe_insertions(insertions: List[InsertionSpec]) -> str:
+    """Lists the items of a multi-insertion request, pointing object items at their crop image."""
+    lines = []
+    image_number = 2  # The main image comes first
+    for number, spec in enumerate(insertions, 1):
+        if spec.kind == "object":
+            lines.append(f"{number}. The object shown in image {image_number}")
+            image_number += 1
+        else:
+            lines.append(f'{number}. The text "{spec.text}"')
+    return "\n".join(lines)
 
-    main_image_b64 = encode_image(main_image_path)
+def _multi_request(main_image: ImageSource, insertions: List[InsertionSpec]) -> dict:
+    """Describes one GPT-4 Vision request that places every insertion of a multi-insertion job."""
+    description = _describe_insertions(insertions)
+    images = [as_image_context(image) for image in
+              [main_image] + [spec.object_crop for spec in insertions if spec.kind == "object"]]
 
-    # Use the text vision prompt from config
-    text_vision_prompt = GPT4_TEXT_VISION_PROMPT.format(text=text)
+    def build(data: dict) -> MultiInsertionResponse:
+        return MultiInsertionResponse(placements=[_placement_from_json(p) for p in data["placements"]])
 
-    response = client.chat.completions.create(
-        model=GPT4_VISION_MODEL,
-        messages=[
+    def count_issues(data: dict | None) -> list:
+        """Missing placements are repaired one by one; surplus ones mean the whole list is redone."""
+        placements = data.get("placements") if isinstance(data, dict) else None
+        if not isinstance(placements, list):
+            return []  # schema_issues reports it
+        if len(placements) > len(insertions):
+            return ["placements"]
+        return [f"placements.{index}" for index in range(len(placements), len(insertions))]
+
+    return {
+        "cache_key": _cache_key(GPT4_MULTI_VISION_PROMPT, images, description, MULTI_VISION_RESPONSE_SCHEMA),
+        "prompt": GPT4_MULTI_VISION_PROMPT.format(insertions=description),
+        "images": images,
+        "extra_response_data": {"insertions": [str(spec.subject) for spec in insertions]},
+        "response_filename": 'gpt_multi_full_response.json',
+        "reasoning_filename": 'multi_vision_reasoning.json',
+        "schema": MULTI_VISION_RESPONSE_SCHEMA,
+        "build": build,
+        "check": count_issues,
+        "repair_hint": f"'placements' must have exactly {len(insertions)} items, one per insertion in order.",
+    }
+
+def _build_messages(request: dict) -> list:
+    """Encodes the request images for upload and records their sizes on the request."""
+    images = [encode_image_for_upload(image) for image in request["images"]]
+    content = [{"type": "text", "text": request["prompt"]}]
+    content += [{"type": "image_url", "image_url": {"url": image.data_url}} for image in images]
+
+    request["upload"] = {
+        "request_bytes": len(request["prompt"].encode('utf-8')) + sum(len(image.data) for image in images),
+        "images": [
             {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": text_vision_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{main_image_b64}"}},
-                ],
+                "path": str(source),
+                "mime_type": image.mime_type,
+                "original_size": list(image.original_size),
+                "encoded_size": list(image.encoded_size),
+                "scale": image.scale,
+                "encoded_bytes": image.num_bytes,
             }
+            for source, image in zip(request["images"], images)
         ],
-        max_tokens=500,
-    )
+    }
+    return [{"role": "user", "content": content}]
 
-    response_text = response.choices[0].message.content
+def _load_cached_reasoning(request: dict, output_dir: str | None) -> dict | None:
+    """Returns cached reasoning data for a request, rewriting its response artifact."""
+    cached = vision_cache.get(request["cache_key"])
+    if not cached:
+        if vision_cache.enabled:
+            metrics.increment("vision_cache_misses_total")
+        return None
+    metrics.increment("vision_cache_hits_total")
+    print("Using cached GPT-4 Vision reasoning (no API call)")
+    _save_json({**cached["full_response"], "cached": True}, output_dir, request["response_filename"])
+    return cached["reasoning"]
+
+def _completion_kwargs(messages: list, schema: dict) -> dict:
+    """Builds chat completion arguments, constraining the reply to the schema in structured mode."""
+    kwargs = {"model": GPT4_VISION_MODEL, "messages": messages, "max_tokens": 500}
+    if VISION_STRUCTURED_OUTPUT:
+        kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "vision_placement", "strict": True, "schema": schema},
+        }
+    return kwargs
+
+def _repair_kwargs(request: dict, messages: list, issues: list) -> dict:
+    """Builds a follow-up request asking only for the fields that are missing or invalid."""
+    print(f"Re-requesting missing or invalid fields: {', '.join(issues)}")
+    metrics.increment("vision_repair_requests_total")
+    repair_messages = messages + [
+        {"role": "assistant", "content": request["responses"][-1]["raw_response"]},
+        {
+            "role": "user",
+            "content": (
+                "Your answer was missing these fields or gave invalid values for them: "
+                f"{', '.join(issues)}. Reply with a JSON object containing only these fields, "
+                "nested as in the original format; list items are keyed by their zero-based index. "
+                + request.get("repair_hint", "")
+            ).strip(),
+        },
+    ]
+    return _completion_kwargs(repair_messages, subset_json_schema(request["schema"], issues))
+
+def _issues(request: dict, data: dict | None) -> list:
+    """Dotted paths of the fields a repair has to ask for: schema violations plus the request's own checks."""
+    issues = schema_issues(data, request["schema"])
+    if "check" in request:
+        issues += [issue for issue in request["check"](data) if issue not in issues]
+    return issues
+
+def _read_response(request: dict, response) -> dict | None:
+    """Records an API response on the request and parses its JSON, returning None if it has none."""
+    response_text = response.choices[0].message.content or ""
+    metrics.increment("vision_requests_total")
+    if response.usage:
+        metrics.increment("vision_prompt_tokens_total", response.usage.prompt_tokens or 0)
+        metrics.increment("vision_completion_tokens_total", response.usage.completion_tokens or 0)
+    request.setdefault("responses", []).append({
+        "raw_response": response_text,
+        "usage": response.usage.dict() if response.usage else None,
+    })
+    try:
+        data = json.loads(response_text) if VISION_STRUCTURED_OUTPUT else _parse_vision_json(response_text)
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"Could not parse GPT-4 Vision reply: {e}")
+        return None
+    return _normalize_reasoning(data) if isinstance(data, dict) else None
+
+def _normalize_reasoning(data: dict) -> dict:
+    """Drops unusable alternative reference labels so they never cost a repair request."""
+    if isinstance(data.get("placements"), list):
+        for placement in data["placements"]:
+            if isinstance(placement, dict):
+                _normalize_reasoning(placement)
+        return data
+
+    reference = data.get("reference_object")
+    if isinstance(reference, dict):
+        alternatives = reference.get("alternative_labels")
+        reference["alternative_labels"] = [
+            label for label in alternatives if isinstance(label, str) and label.strip()
+        ] if isinstance(alternatives, list) else []
+    return data
+
+def _finish_response(request: dict, data: dict | None, issues: list, output_dir: str | None):
+    """Saves the API responses and caches the reasoning once it is valid."""
+    responses = request["responses"]
+    totals = {
+        key: sum((r["usage"] or {}).get(key, 0) for r in responses)
+        for key in ("completion_tokens", "prompt_tokens", "total_tokens")
+    }
 
     # Save the full GPT API response
     full_response_data = {
-        "raw_response": response_text,
+        "raw_response": responses[0]["raw_response"],
         "model": GPT4_VISION_MODEL,
-        "text_to_insert": text,
-        "usage": response.usage.dict() if response.usage else None,
-        "completion_tokens": response.usage.completion_tokens if response.usage else None,
-        "prompt_tokens": response.usage.prompt_tokens if response.usage else None,
-        "total_tokens": response.usage.total_tokens if response.usage else None
+        **request["extra_response_data"],
+        "upload": request.get("upload"),
+        "usage": responses[0]["usage"],
+        **totals,
+        "repairs": responses[1:],
     }
-    
-    os.makedirs(output_dir, exist_ok=True)
-    with open(os.path.join(output_dir, 'gpt_text_full_response.json'), 'w') as f:
-        json.dump(full_response_data, f, indent=2)
+    _save_json(full_response_data, output_dir, request["response_filename"])
 
-    try:
-        json_response_string = response_text.split('```json')[1].split('```')[0].strip()
-        data = json.loads(json_response_string)
-    except (IndexError, json.JSONDecodeError) as e:
-        print(f"Error parsing JSON from response: {e}")
-        print(f"Raw response: {response_text}")
-        try:
-            data = json.loads(response_text)
-        except json.JSONDecodeError:
-            print("Fallback JSON parsing failed. Raising exception.")
-            raise ValueError("Invalid JSON response from GPT-4 Vision") from e
+    if issues:
+        raise ValueError(f"Invalid JSON response from GPT-4 Vision: missing or invalid fields {', '.join(issues)}")
+
+    vision_response = _build_vision_response(request, data, output_dir)
+    vision_cache.put(request["cache_key"], {"full_response": full_response_data, "reasoning": data})
+    return vision_response
+
+def _placement_from_json(data: dict) -> Gpt4VisionResponse:
+    """Converts one placement's reasoning data to a Gpt4VisionResponse, ignoring unknown keys."""
+    def known_fields(cls, values: dict) -> dict:
+        return {f.name: values[f.name] for f in fields(cls) if f.name in values}
 
-    # Save the parsed vision reasoning data
-    with open(os.path.join(output_dir, 'text_vision_reasoning.json'), 'w') as f:
-        json.dump(data, f, indent=2)
-    
     return Gpt4VisionResponse(
-        reference_object=ReferenceObject(**data["reference_object"]),
-        target_object=TargetObject(**data["target_object"]),
+        reference_object=ReferenceObject(**known_fields(ReferenceObject, data["reference_object"])),
+        target_object=TargetObject(**known_fields(TargetObject, data["target_object"])),
     )
+
+def _build_vision_response(request: dict, data: dict, output_dir: str | None):
+    """Saves the parsed reasoning and converts it to the request's response type."""
+    # Save the parsed vision reasoning data
+    _save_json(data, output_dir, request["reasoning_filename"])
+    return request["build"](data)
+
+@metrics.timed("reasoning")
+def _run_request(request: dict, output_dir: str | None, client: "OpenAI | None" = None):
+    """Answers a request from the cache or the OpenAI API."""
+    data = _load_cached_reasoning(request, output_dir)
+    if data is not None:
+        return _build_vision_response(request, data, output_dir)
+
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    messages = _build_messages(request)
+    data = _read_response(request, client.chat.completions.create(**_completion_kwargs(messages, request["schema"])))
+    issues = _issues(request, data)
+
+    for _ in range(VISION_MAX_REPAIR_ATTEMPTS):
+        if not issues:
+            break
+        repair = _read_response(request, client.chat.completions.create(**_repair_kwargs(request, messages, issues)))
+        data = merge_json(data or {}, repair or {})
+        issues = _issues(request, data)
+
+    return _finish_response(request, data, issues, output_dir)
+
+@metrics.timed("reasoning")
+async def _run_request_async(request: dict, output_dir: str | None, client: "AsyncOpenAI | None"):
+    """Answers a request from the cache or the OpenAI API without blocking the event loop."""
+    data = _load_cached_reasoning(request, output_dir)
+    if data is not None:
+        return _build_vision_response(request, data, output_dir)
+
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    messages = _build_messages(request)
+    data = _read_response(request, await client.chat.completions.create(**_completion_kwargs(messages, request["schema"])))
+    issues = _issues(request, data)
+
+    for _ in range(VISION_MAX_REPAIR_ATTEMPTS):
+        if not issues:
+            break
+        repair = _read_response(request, await client.chat.completions.create(**_repair_kwargs(request, messages, issues)))
+        data = merge_json(data or {}, repair or {})
+        issues = _issues(request, data)
+
+    return _finish_response(request, data, issues, output_dir)
+
+def get_vision_reasoning(main_image: ImageSource, object_crop: ImageSource, output_dir: str | None = "output",
+                         client: "OpenAI | None" = None) -> Gpt4VisionResponse:
+    """
+    Analyzes the main image and object crop to determine a realistic placement for the object.
+    Without an output_dir, the responses are not saved.
+    """
+    return _run_request(_object_request(main_image, object_crop), output_dir, client)
+
+def get_text_vision_reasoning(main_image: ImageSource, text: str, output_dir: str | None = "output",
+                              client: "OpenAI | None" = None) -> Gpt4VisionResponse:
+    """
+    Analyzes the main image and text to determine a realistic placement for the text.
+    Without an output_dir, the responses are not saved.
+    """
+    return _run_request(_text_request(main_image, text), output_dir, client)
+
+def get_multi_vision_reasoning(main_image: ImageSource, insertions: List[InsertionSpec],
+                               output_dir: str | None = "output",
+                               client: "OpenAI | None" = None) -> MultiInsertionResponse:
+    """
+    Places several objects and texts in the main image with a single GPT-4 Vision request.
+    Without an output_dir, the responses are not saved.
+    """
+    return _run_request(_multi_request(main_image, insertions), output_dir, client)
+
+async def get_vision_reasoning_async(main_image: ImageSource, object_crop: ImageSource,
+                                     output_dir: str | None = "output",
+                                     client: "AsyncOpenAI | None" = None) -> Gpt4VisionResponse:
+    """
+    Async variant of get_vision_reasoning for running many requests concurrently on a shared client.
+    """
+    return await _run_request_async(_object_request(main_image, object_crop), output_dir, client)
+
+async def get_text_vision_reasoning_async(main_image: ImageSource, text: str, output_dir: str | None = "output",
+                                          client: "AsyncOpenAI | None" = None) -> Gpt4VisionResponse:
+    """
+    Async variant of get_text_vision_reasoning for running many requests concurrently on a shared client.
+    """
+    return await _run_request_async(_text_request(main_image, text), output_dir, client)
+
+async def get_multi_vision_reasoning_async(main_image: ImageSource, insertions: List[InsertionSpec],
+                                           output_dir: str | None = "output",
+                                           client: "AsyncOpenAI | None" = None) -> MultiInsertionResponse:
+    """
+    Async variant of get_multi_vision_reasoning for running many requests concurrently on a shared client.
+    """
+    return await _run_request_async(_multi_request(main_image, insertions), output_dir, client)
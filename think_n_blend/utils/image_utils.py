@@ -1,17 +1,186 @@
+import io
+import os
 import base64
+import hashlib
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple, Union, TYPE_CHECKING
 from PIL import Image, ImageDraw
+from think_n_blend.config import VISION_MAX_IMAGE_SIDE, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY
+from think_n_blend.schemas import EncodedImage
 
-def encode_image(image_path: str) -> str:
-    """Encodes an image to base64."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+if TYPE_CHECKING:
+    import numpy as np
 
-def create_mask_from_box(image_path: str, box: Tuple[int, int, int, int], output_path: str) -> str:
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+class ImageContext:
+    """
+    Pipeline-scoped handle on an image: the size is read from the header
+    only, the pixels are decoded once on first use and shared by every stage.
+    Images passed in memory (encoded bytes or a PIL image) have no path;
+    ensure_file writes a copy out for a tool that reads files.
+    """
+
+    def __init__(self, path: Optional[str], data: Optional[bytes] = None):
+        self.path = path
+        self._data = data  # Encoded bytes of an in-memory image
+        self._source = None  # Caller's PIL image, kept as given (e.g. with its alpha channel)
+        self._size = None
+        self._image = None
+        self._content_hash = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_image(cls, path: Optional[str], image: Image.Image) -> "ImageContext":
+        """Wraps pixels that are already decoded, e.g. mapped from shared memory or passed in by a caller."""
+        context = cls(path)
+        if path is None:
+            context._source = image
+        if image.mode == 'RGB':
+            context._image = image
+        return context
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ImageContext":
+        """Wraps an encoded image (JPEG, PNG, ...) held in memory."""
+        return cls(None, data)
+
+    def open(self) -> Image.Image:
+        """Opens the image as stored, without converting its mode; the caller closes it."""
+        if self._source is not None:
+            return self._source.copy()
+        if self.path is None:
+            return Image.open(io.BytesIO(self._data))
+        return Image.open(self.path)
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the encoded bytes (or of the pixels), for caching results derived from the image content."""
+        if self._content_hash is None:
+            if self._source is not None:
+                digest = hashlib.sha256(f"{self._source.mode}{self._source.size}".encode('utf-8'))
+                digest.update(self._source.tobytes())
+                self._content_hash = digest.hexdigest()
+            elif self.path is None:
+                self._content_hash = hashlib.sha256(self._data).hexdigest()
+            else:
+                with open(self.path, "rb") as image_file:
+                    self._content_hash = hashlib.sha256(image_file.read()).hexdigest()
+        return self._content_hash
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Image size, read without decoding the pixel data."""
+        if self._image is not None:
+            return self._image.size
+        if self._source is not None:
+            return self._source.size
+        if self._size is None:
+            with self.open() as image:
+                self._size = image.size
+        return self._size
+
+    @property
+    def image(self) -> Image.Image:
+        """Decoded RGB image. Shared between stages, so callers must copy before modifying it."""
+        with self._lock:
+            if self._image is None:
+                if self._source is not None:
+                    self._image = self._source.convert('RGB')
+                else:
+                    with self.open() as image:
+                        self._image = image.convert('RGB')
+            return self._image
+
+    def ensure_file(self, directory: str, name: str = "image") -> str:
+        """
+        Returns the image's path, or writes an in-memory image into directory and returns that
+        file's path. The context keeps no reference to the file, so directory may be removed.
+        """
+        with self._lock:
+            if self.path is not None:
+                return self.path
+            os.makedirs(directory, exist_ok=True)
+            if self._data is not None:
+                with Image.open(io.BytesIO(self._data)) as image:
+                    extension = (image.format or "png").lower()
+                path = os.path.join(directory, f"{name}.{extension}")
+                with open(path, 'wb') as f:
+                    f.write(self._data)
+            else:
+                path = os.path.join(directory, f"{name}.png")
+                self._source.save(path)
+            return path
+
+    def release(self):
+        """Drops the decoded pixels."""
+        with self._lock:
+            if self._image is not None:
+                # The caller's own image stays open
+                if self._image is not self._source:
+                    self._image.close()
+                self._image = None
+
+    def __str__(self) -> str:
+        return self.path or "<in-memory image>"
+
+    def __enter__(self) -> "ImageContext":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+# Image paths, encoded bytes, PIL images, NumPy arrays (H x W or H x W x C) or contexts
+ImageSource = Union[str, os.PathLike, bytes, Image.Image, "np.ndarray", ImageContext]
+
+def as_image_context(image: ImageSource) -> ImageContext:
+    """Wraps any image source in an ImageContext, passing existing contexts through."""
+    if isinstance(image, ImageContext):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return ImageContext.from_bytes(bytes(image))
+    if isinstance(image, Image.Image):
+        return ImageContext.from_image(None, image)
+    if hasattr(image, "__array_interface__"):
+        return ImageContext.from_image(None, Image.fromarray(image))
+    return ImageContext(os.fspath(image))
+
+def encode_image_for_upload(
+    image: ImageSource,
+    max_side: int = VISION_MAX_IMAGE_SIDE,
+    image_format: str = VISION_IMAGE_FORMAT,
+    quality: int = VISION_IMAGE_QUALITY,
+) -> EncodedImage:
+    """Downscales an image to max_side and re-encodes it compactly for the vision API."""
+    with as_image_context(image).open() as source:
+        original_size = source.size
+        source.draft("RGB", (max_side, max_side))  # Let JPEG decoding skip detail we would discard
+        image = source.convert("RGBA" if source.mode in ("RGBA", "LA", "P") else "RGB")
+
+    if image.mode == "RGBA" and image_format != "WEBP":
+        # JPEG has no alpha channel, flatten transparent crops onto white
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality)
+    encoded = buffer.getvalue()
+
+    return EncodedImage(
+        data=base64.b64encode(encoded).decode('utf-8'),
+        mime_type=IMAGE_MIME_TYPES[image_format],
+        original_size=original_size,
+        encoded_size=image.size,
+        num_bytes=len(encoded),
+    )
+
+def create_mask_from_box(image: ImageSource, box: Tuple[int, int, int, int], output_path: str) -> str:
     """Creates a mask image from a bounding box."""
-    image = Image.open(image_path)
-    mask = Image.new('L', image.size, 0)
+    mask = Image.new('L', as_image_context(image).size, 0)
     draw = ImageDraw.Draw(mask)
     draw.rectangle(box, fill=255)
     mask.save(output_path)
@@ -23,13 +192,13 @@ def create_dummy_image(path: str, size: Tuple[int, int], color: str):
     Image.new('RGB', size, color=color).save(path)
 
 def save_bounding_box_visualization(
-    image_path: str,
+    image: ImageSource,
     reference_box: Tuple[int, int, int, int],
     target_box: Tuple[int, int, int, int],
     output_path: str,
 ):
     """Saves an image with the reference and target bounding boxes drawn on it."""
-    image = Image.open(image_path)
+    image = as_image_context(image).image.copy()
     draw = ImageDraw.Draw(image)
     draw.rectangle(reference_box, outline="red", width=3)
     draw.rectangle(target_box, outline="green", width=3)
@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from think_n_blend.schemas import InsertionSpec
+
+def _job_dir(base_dir: str, mode: str, main_image: str, identity_parts: List[str], subject: str) -> str:
+    identity = "\0".join([mode, os.path.abspath(main_image)] + identity_parts)
+    digest = hashlib.sha1(identity.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(base_dir, f"{mode}_{Path(main_image).stem}_{subject}_{digest}")
+
+def job_output_dir(base_dir: str, mode: str, main_image: str, object_crop: Optional[str] = None,
+                   text: Optional[str] = None) -> str:
+    """Returns a deterministic working directory for one insertion job under base_dir."""
+    if object_crop:
+        subject = Path(object_crop).stem
+    else:
+        subject = re.sub(r'[^A-Za-z0-9_-]+', '_', text or "")[:32]
+    identity_parts = [os.path.abspath(object_crop) if object_crop else "", text or ""]
+    return _job_dir(base_dir, mode, main_image, identity_parts, subject)
+
+def multi_job_output_dir(base_dir: str, main_image: str, insertions: List[InsertionSpec]) -> str:
+    """Returns a deterministic working directory for one multi-insertion job under base_dir."""
+    identity_parts = [
+        f"object:{os.path.abspath(spec.object_crop)}" if spec.kind == "object" else f"text:{spec.text}"
+        for spec in insertions
+    ]
+    return _job_dir(base_dir, "multi", main_image, identity_parts, f"{len(insertions)}_insertions")
+
+def job_inputs_hash(mode: str, image_paths: List[str], values: List[str]) -> str:
+    """Hashes a job's mode, input image bytes and text values, so edited inputs are redone on resume."""
+    digest = hashlib.sha256()
+    for part in [mode] + values:
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\0")
+    for image_path in image_paths:
+        with open(image_path, "rb") as image_file:
+            digest.update(hashlib.sha256(image_file.read()).digest())
+    return digest.hexdigest()
+
+class JobJournal:
+    """
+    Append-only JSONL record of finished batch jobs. Each line is flushed to disk as the job
+    completes; only a compact status index is kept in memory.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        # job_id -> (status, inputs_hash, output_path, byte offset of the job's latest record)
+        self._index: Dict[str, Tuple[str, str, str, int]] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._truncate_torn_tail()
+            for offset, record in self._read_records():
+                self._index_record(record, offset)
+        else:
+            open(path, 'w').close()
+
+    def _truncate_torn_tail(self):
+        """Drops a last line left incomplete by a crash mid-write, so new records start on a fresh line."""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _read_records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    yield offset, json.loads(line)
+                except json.JSONDecodeError:
+                    pass
+                offset += len(line)
+
+    def _index_record(self, record: Dict[str, Any], offset: int):
+        output_path = record["result"].get("output_path") or ""
+        self._index[record["job_id"]] = (record["status"], record["inputs_hash"], output_path, offset)
+
+    def is_complete(self, job_id: str, inputs_hash: str) -> bool:
+        """True if the job last succeeded on the same inputs and its output still exists."""
+        entry = self._index.get(job_id)
+        return bool(entry) and entry[0] == "success" and entry[1] == inputs_hash and os.path.exists(entry[2])
+
+    def record(self, job_id: str, inputs_hash: str, result: Dict[str, Any]):
+        """Appends a finished job's result and forces it to disk."""
+        record = {
+            "job_id": job_id,
+            "inputs_hash": inputs_hash,
+            "status": "success" if result.get("success") else "failed",
+            "finished_at": time.time(),
+            "result": result,
+        }
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                f.write((json.dumps(record) + "\n").encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            self._index_record(record, offset)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Streams the latest record of every journaled job, in completion order."""
+        latest = {entry[3] for entry in self._index.values()}
+        for offset, record in self._read_records():
+            if offset in latest:
+                yield record
+
+    def iter_results(self, job_ids: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the latest result of each job: of the given job_ids in that order (skipping any
+        not journaled), or of every journaled job in completion order.
+        """
+        if job_ids is None:
+            for record in self.iter_records():
+                yield record["result"]
+            return
+
+        with open(self.path, 'rb') as f:
+            for job_id in job_ids:
+                if job_id in self._index:
+                    f.seek(self._index[job_id][3])
+                    yield json.loads(f.readline())["result"]
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from think_n_blend.config import METRICS_PREFIX, METRICS_DURATION_BUCKETS
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+COUNTER_HELP = {
+    "jobs_total": "Finished insertion jobs by mode and status.",
+    "stage_failures_total": "Stage runs that raised or produced no result.",
+    "service_rejected_jobs_total": "Job submissions turned away because the service queue was full.",
+    "detection_escalations_total": "Detection cascade tiers that handed a lookup to the next tier.",
+    "detection_answers_total": "Reference lookups answered, by detection model or cascade tier.",
+    "verification_checks_total": "Insertions verified by the verification stage, by kind and outcome.",
+    "vision_requests_total": "Chat completion requests sent to the vision model, including repairs.",
+    "vision_repair_requests_total": "Follow-up requests asking for missing or invalid fields.",
+    "vision_cache_hits_total": "Vision reasoning answered from the cache.",
+    "vision_cache_misses_total": "Vision reasoning not found in the cache.",
+    "vision_prompt_tokens_total": "Prompt tokens billed for vision requests.",
+    "vision_completion_tokens_total": "Completion tokens billed for vision requests.",
+}
+
+@dataclass
+class JobRecord:
+    """Where one insertion job spent its time, plus its own counters."""
+    job_id: str
+    mode: str
+    started_at: float = field(default_factory=time.time)
+    duration_s: float = 0.0
+    success: Optional[bool] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)  # Seconds per stage, summed over its spans
+    counters: Dict[str, float] = field(default_factory=dict)
+
+# The job whose spans and counters are being recorded; set per thread or asyncio task
+_current_job: contextvars.ContextVar[Optional[JobRecord]] = contextvars.ContextVar("current_job", default=None)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metrics:
+    """
+    Process-wide stage timings and counters. Spans and counters also accumulate on the
+    current job's record, which is written as one JSON line when the job finishes.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX, buckets: List[float] = METRICS_DURATION_BUCKETS):
+        self.prefix = prefix
+        self.buckets = list(buckets)
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # stage -> (cumulative bucket counts, sum, count)
+        self._durations: Dict[str, Tuple[List[int], float, int]] = {}
+        self._jobs_file: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        """Adds amount to a counter, and to the current job's copy of it."""
+        label_items = tuple(sorted(labels.items()))
+        with self._lock:
+            key = (name, label_items)
+            self._counters[key] = self._counters.get(key, 0) + amount
+            record = _current_job.get()
+            if record is not None:
+                job_key = f"{name}{_format_labels(label_items)}"
+                record.counters[job_key] = record.counters.get(job_key, 0) + amount
+
+    def observe(self, stage: str, seconds: float):
+        """Records one stage duration in the histogram and on the current job."""
+        with self._lock:
+            counts, total, count = self._durations.get(stage, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (seconds <= bound) for c, bound in zip(counts, self.buckets)]
+            self._durations[stage] = (counts, total + seconds, count + 1)
+            record = _current_job.get()
+            if record is not None:
+                record.stages[stage] = record.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage: str):
+        """Times a block as one run of stage; an exception counts as a stage failure."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment("stage_failures_total", stage=stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str) -> Callable:
+        """Decorator running every call of a function (or coroutine function) in a span."""
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def timed_coroutine(*args, **kwargs):
+                    with self.span(stage):
+                        return await func(*args, **kwargs)
+                return timed_coroutine
+
+            @functools.wraps(func)
+            def timed_function(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return timed_function
+        return decorator
+
+    def start_job(self, job_id: str, mode: str) -> JobRecord:
+        return JobRecord(job_id=job_id, mode=mode)
+
+    def finish_job(self, record: JobRecord, success: bool, output_path: Optional[str] = None,
+                   error: Optional[str] = None):
+        """Closes a job record, counts it and appends it to the jobs file if one is set."""
+        record.duration_s = time.time() - record.started_at
+        record.success = success
+        record.output_path = output_path
+        record.error = error
+        with self._lock:
+            key = ("jobs_total", (("mode", record.mode), ("status", "success" if success else "failure")))
+            self._counters[key] = self._counters.get(key, 0) + 1
+            if self._jobs_file:
+                with open(self._jobs_file, 'a') as f:
+                    f.write(json.dumps(asdict(record)) + "\n")
+
+    @contextmanager
+    def job_context(self, record: JobRecord):
+        """Attributes spans and counters in this thread or task to record."""
+        token = _current_job.set(record)
+        try:
+            yield record
+        finally:
+            _current_job.reset(token)
+
+    def run_in_job(self, record: JobRecord, func: Callable, *args) -> Any:
+        """Calls func in record's context; for executors, which do not carry context over."""
+        with self.job_context(record):
+            return func(*args)
+
+    def set_job_id(self, job_id: str):
+        """Names the current job, unless whoever started it already did."""
+        record = _current_job.get()
+        if record is not None and not record.job_id:
+            record.job_id = job_id
+
+    def track_job(self, mode: str) -> Callable:
+        """
+        Decorator recording each call of a pipeline function as a job that succeeds when it
+        returns a result. Calls made inside an already tracked job just add to that job.
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def tracked(*args, **kwargs):
+                if _current_job.get() is not None:
+                    return func(*args, **kwargs)
+                record = self.start_job("", mode)
+                with self.job_context(record):
+                    try:
+                        result = func(*args, **kwargs)
+                    except Exception as e:
+                        self.finish_job(record, False, error=str(e))
+                        raise
+                self.finish_job(record, result is not None, output_path=result)
+                return result
+            return tracked
+        return decorator
+
+    def set_jobs_file(self, path: Optional[str]):
+        """Appends a JSON line per finished job to path (None stops writing them)."""
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._jobs_file = path
+
+    def prometheus_text(self) -> str:
+        """Renders all counters and stage duration histograms in the Prometheus text format."""
+        with self._lock:
+            counters = dict(self._counters)
+            durations = dict(self._durations)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for (_, labels), value in sorted(item for item in counters.items() if item[0][0] == name):
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+        metric = f"{self.prefix}_stage_duration_seconds"
+        lines.append(f"# HELP {metric} Time spent in each pipeline stage.")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage in sorted(durations):
+            counts, total, count = durations[stage]
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {_format_value(total)}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Writes a Prometheus text snapshot atomically, e.g. for the node exporter's textfile collector."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> "ThreadingHTTPServer":
+        """Serves GET /metrics from a daemon thread until the returned server is shut down."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def reset(self):
+        """Drops all counters and durations."""
+        with self._lock:
+            self._counters.clear()
+            self._durations.clear()
+
+# Global metrics instance
+metrics = Metrics()
@@ -0,0 +1,101 @@
+from dataclasses import fields, is_dataclass
+from typing import Any, Dict, List, Literal, get_args, get_origin
+
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+PYTHON_TYPES = {"string": str, "integer": int, "number": (int, float), "boolean": bool, "array": list}
+
+def _type_json_schema(field_type: Any) -> Dict[str, Any]:
+    if is_dataclass(field_type):
+        return dataclass_json_schema(field_type)
+    if get_origin(field_type) is Literal:
+        return {"type": "string", "enum": list(get_args(field_type))}
+    if get_origin(field_type) in (list, List):
+        return {"type": "array", "items": _type_json_schema(get_args(field_type)[0])}
+    if field_type in JSON_TYPES:
+        return {"type": JSON_TYPES[field_type]}
+    raise ValueError(f"Unsupported field type for JSON schema: {field_type}")
+
+def dataclass_json_schema(cls) -> Dict[str, Any]:
+    """Builds a strict JSON schema (all fields required, no extra keys) from a dataclass."""
+    properties = {f.name: _type_json_schema(f.type) for f in fields(cls)}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+def schema_issues(data: Any, schema: Dict[str, Any], path: str = "") -> List[str]:
+    """Returns the dotted paths of fields in data that are missing or do not match the schema."""
+    if schema["type"] == "object":
+        if not isinstance(data, dict):
+            return [path] if path else list(schema["properties"])
+        issues = []
+        for name, field_schema in schema["properties"].items():
+            field_path = f"{path}.{name}" if path else name
+            if name not in data:
+                issues.append(field_path)
+            else:
+                issues.extend(schema_issues(data[name], field_schema, field_path))
+        return issues
+
+    if schema["type"] == "array":
+        if not isinstance(data, list):
+            return [path]
+        # Items are addressed by index, so a repair only asks for what is wrong inside them
+        issues = []
+        for index, item in enumerate(data):
+            issues.extend(schema_issues(item, schema["items"], f"{path}.{index}" if path else str(index)))
+        return issues
+
+    if not isinstance(data, PYTHON_TYPES[schema["type"]]) or ("enum" in schema and data not in schema["enum"]):
+        return [path]
+    if schema["type"] == "string" and not data.strip():
+        return [path]
+    return []
+
+def _group_paths(paths: List[str]) -> Dict[str, List[str]]:
+    """Groups dotted paths by their first segment; an empty remainder names the whole field."""
+    groups: Dict[str, List[str]] = {}
+    for path in paths:
+        name, _, rest = path.partition(".")
+        groups.setdefault(name, []).append(rest)
+    return groups
+
+def subset_json_schema(schema: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    """
+    Restricts a schema to the fields named by dotted paths. Array items are named by index
+    and become an object keyed by those indices, e.g. {"2": {...}}, which merge_json applies.
+    """
+    properties = {}
+    for name, rests in _group_paths(paths).items():
+        field_schema = schema["items"] if schema["type"] == "array" else schema["properties"][name]
+        if all(rests) and field_schema["type"] in ("object", "array"):
+            properties[name] = subset_json_schema(field_schema, rests)
+        else:
+            properties[name] = field_schema
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def merge_json(base: Any, update: Dict[str, Any]) -> Any:
+    """
+    Recursively merges update into a copy of base. On a list, update's keys are item indices;
+    items may only be appended contiguously, so an index that would leave a gap is rejected.
+    """
+    def merge_value(current: Any, value: Any) -> Any:
+        return merge_json(current, value) if isinstance(value, dict) and isinstance(current, (dict, list)) else value
+
+    if isinstance(base, list):
+        merged = list(base)
+        indices = sorted((int(key), value) for key, value in update.items() if str(key).isdigit())
+        for index, value in indices:
+            if index < len(merged):
+                merged[index] = merge_value(merged[index], value)
+            elif index == len(merged):
+                merged.append(value)
+            # An index past the end would land in the wrong slot; it is dropped and stays an issue
+        return merged
+
+    merged = dict(base)
+    for key, value in update.items():
+        merged[key] = merge_value(merged.get(key), value)
+    return merged